@@ -0,0 +1,97 @@
+"""
+Build the similar-trials vector index from a local ClinicalTrials.gov dump.
+
+    python -m app.build_index /data/ctg-studies --output app/models/trial_index --kind ivfpq
+
+Studies are read like app.bulk_score (directories or files of study JSON /
+JSON Lines, optionally gzipped), embedded and scored in batches. Each
+trial's vector (summary, disease and eligibility embeddings) is stored
+together with its prediction, so /similar/{nctid} answers from the index
+alone. Use `--kind flat` for exact search on small corpora and `--kind
+ivfpq` for the full registry.
+"""
+import argparse
+
+from app.bulk_io import batches, iter_studies, list_study_files, preprocess_batch
+from app.core.batching import predict_isolated
+from app.core.vector_index import IndexWriter, train_ivfpq, trial_vectors
+from app.services.clinicaltrials_api import study_nctid
+
+
+def build_index(source: str, output: str, predictor, kind: str = "flat", batch_size: int = 256,
+                n_samples: int = 1000, nlist: int = None, m: int = None) -> int:
+    """
+    Embeds and scores every study under source into a new index at output.
+    Returns:
+        Number of indexed trials
+    """
+    writer = IndexWriter(output)
+    try:
+        for batch in batches(iter_studies(list_study_files(source)), batch_size):
+            nctids, trials = [], []
+            studies = [study for _, _, study in batch]
+            for study, trial in zip(studies, preprocess_batch(studies)):
+                nctid = study_nctid(study)
+                if isinstance(trial, Exception):
+                    print(f"[build_index] Skipping {nctid or 'study'}: {trial}")
+                    continue
+                if nctid:
+                    nctids.append(nctid)
+                    trials.append(trial)
+            if not trials:
+                continue
+
+            # One embedding pass feeds both the index vectors and the model
+            embeddings = predictor.embedder.encode_trials(trials)
+            vectors = trial_vectors(embeddings)
+            phases = [trial["phase"] for trial in trials]
+
+            def predict_rows(rows):
+                return predictor.predict_embeddings({field: x[rows] for field, x in embeddings.items()},
+                                                    [phases[i] for i in rows], n_samples=n_samples)
+
+            results = predict_isolated(predict_rows, list(range(len(trials))))
+            keep = []
+            for i, result in enumerate(results):
+                if isinstance(result, Exception):
+                    print(f"[build_index] Skipping {nctids[i]}: {result}")
+                else:
+                    keep.append(i)
+            writer.append(
+                [nctids[i] for i in keep],
+                vectors[keep],
+                [{"phase": phases[i], **results[i]} for i in keep],
+            )
+            print(f"[build_index] {writer.count} trials indexed")
+    finally:
+        writer.close()
+
+    if kind == "ivfpq" and writer.count:
+        params = train_ivfpq(output, nlist=nlist, m=m)
+        print(f"[build_index] Trained IVF-PQ: {params}")
+    return writer.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the similar-trials vector index.")
+    parser.add_argument("source", help="Directory or file of study JSON / JSON Lines (optionally .gz)")
+    parser.add_argument("--output", required=True, help="Index directory (replaced if it exists)")
+    parser.add_argument("--kind", choices=["flat", "ivfpq"], default="flat")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4 * sqrt(trials))")
+    parser.add_argument("--m", type=int, default=None, help="PQ subspaces (must divide the vector dim)")
+    parser.add_argument("--model-path", default="app/models/model_weights.pth")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-samples", type=int, default=1000)
+    parser.add_argument("--device", default=None)
+    args = parser.parse_args(argv)
+
+    from app.core.predict import TrialPredictor
+
+    predictor = TrialPredictor(model_path=args.model_path, device=args.device)
+    count = build_index(args.source, args.output, predictor, kind=args.kind, batch_size=args.batch_size,
+                        n_samples=args.n_samples, nlist=args.nlist, m=args.m)
+    print(f"[build_index] Done: {count} trials in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
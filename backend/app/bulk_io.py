@@ -0,0 +1,177 @@
+"""
+Shared I/O of the offline CLIs (app.bulk_score, app.rescore,
+app.embed_features, app.build_index, ...): reading a local
+ClinicalTrials.gov dump, batching and preprocessing its studies, and the
+checkpointed CSV / Parquet result sinks.
+"""
+import csv
+import gzip
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+
+from app.core.parsing import parse_trial_json, parse_trials
+from app.core.preprocessing import preprocess_trial, preprocess_trials, trial_rows
+
+OUTPUT_COLUMNS = ["nctid", "phase", "probability", "uncertainty", "label", "deterministic", "n_samples_used",
+                  "error"]
+
+STUDY_SUFFIXES = (".json", ".jsonl", ".ndjson")
+
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _is_lines(path: str) -> bool:
+    return path.removesuffix(".gz").endswith((".jsonl", ".ndjson"))
+
+
+def list_study_files(source: str) -> List[str]:
+    """
+    Returns the study files under source in a stable (sorted) order, which the
+    checkpoint positions refer to.
+    """
+    if os.path.isfile(source):
+        return [source]
+    files = []
+    for root, dirs, names in os.walk(source):
+        dirs.sort()
+        for name in names:
+            if name.removesuffix(".gz").endswith(STUDY_SUFFIXES):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def iter_studies(files: List[str], start: Tuple[int, int] = (0, 0)) -> Iterator[Tuple[int, int, dict]]:
+    """
+    Streams (file index, record index, study JSON) from files, starting at the
+    given position. Skipped JSON Lines records are not parsed.
+    """
+    start_file, start_record = start
+    for file_idx in range(start_file, len(files)):
+        skip = start_record if file_idx == start_file else 0
+        path = files[file_idx]
+        with _open(path) as f:
+            if _is_lines(path):
+                record_idx = 0
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if record_idx >= skip:
+                        yield file_idx, record_idx, json.loads(line)
+                    record_idx += 1
+            else:
+                data = json.load(f)
+                if isinstance(data, dict) and "studies" in data:
+                    data = data["studies"]
+                studies = data if isinstance(data, list) else [data]
+                for record_idx in range(skip, len(studies)):
+                    yield file_idx, record_idx, studies[record_idx]
+
+
+def batches(iterator, size: int) -> Iterator[list]:
+    """
+    Groups an iterator into lists of up to size items.
+    """
+    batch = []
+    for item in iterator:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class CsvSink:
+    """
+    Appends rows to one CSV file. The checkpoint stores the byte offset after
+    the last committed batch, so rows from an interrupted batch are truncated
+    away on resume.
+    """
+
+    def __init__(self, path: str, offset: Optional[int]):
+        if offset is not None and os.path.exists(path):
+            os.truncate(path, offset)
+        self.path = path
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=OUTPUT_COLUMNS)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, rows: List[dict]):
+        self.writer.writerows(rows)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def position(self):
+        return os.path.getsize(self.path)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """
+    Writes one Parquet part file per batch into a directory; parts after the
+    checkpointed count are overwritten on resume.
+    """
+
+    def __init__(self, path: str, parts: Optional[int]):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)") from e
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.parts = parts or 0
+        for name in os.listdir(path):
+            if name.startswith("part-") and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(path, name))
+
+    def write(self, rows: List[dict]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(rows, schema=pa.schema([
+            ("nctid", pa.string()), ("phase", pa.string()), ("probability", pa.float64()),
+            ("uncertainty", pa.float64()), ("label", pa.int64()), ("deterministic", pa.float64()),
+            ("n_samples_used", pa.int64()), ("error", pa.string()),
+        ]))
+        pq.write_table(table, os.path.join(self.path, f"part-{self.parts:05d}.parquet"))
+        self.parts += 1
+
+    def position(self):
+        return self.parts
+
+    def close(self):
+        pass
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def preprocess_batch(studies: List[dict]) -> List[object]:
+    """
+    preprocess_trial output per study, or the exception raised for it. The
+    columnar path handles the whole batch; only a batch with a malformed
+    study falls back to one study at a time.
+    """
+    try:
+        return trial_rows(preprocess_trials(parse_trials(studies)))
+    except Exception:
+        pass
+    trials = []
+    for study in studies:
+        try:
+            trials.append(preprocess_trial(parse_trial_json(study)))
+        except Exception as e:
+            trials.append(e)
+    return trials
@@ -0,0 +1,118 @@
+"""
+Offline bulk scoring over a local ClinicalTrials.gov dump.
+
+    python -m app.bulk_score /data/ctg-studies --output scores.csv
+
+The source is a directory (searched recursively) or a single file of study
+JSON: `.json` files holding one study, a list of studies or an API page
+(`{"studies": [...]}`), or `.jsonl`/`.ndjson` files with one study per line.
+Any of them may be gzip-compressed (`.gz`). Studies are streamed in batches
+through parse -> preprocess -> batched embedding -> batched inference, and
+results are written incrementally as CSV or Parquet. Progress is
+checkpointed after every batch so an interrupted run resumes where it left
+off.
+"""
+import argparse
+import json
+import os
+from typing import List, Optional
+
+from app.bulk_io import (OUTPUT_COLUMNS, CsvSink, ParquetSink, batches, iter_studies, list_study_files,
+                         preprocess_batch, save_checkpoint)
+from app.core.batching import predict_isolated
+from app.services.clinicaltrials_api import study_nctid
+
+def _load_checkpoint(path: str, files: List[str]) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("files") != len(files):
+        raise RuntimeError(f"Checkpoint {path} was written for a different source; use --restart")
+    return checkpoint
+
+
+def _score_batch(predictor, studies: List[dict], n_samples: int, adaptive=None) -> List[dict]:
+    rows, prepped, slots = [], [], []
+    for study, trial in zip(studies, preprocess_batch(studies)):
+        row = {col: None for col in OUTPUT_COLUMNS}
+        row["nctid"] = study_nctid(study)
+        if isinstance(trial, Exception):
+            row["error"] = str(trial)
+        else:
+            row["phase"] = trial["phase"]
+            prepped.append(trial)
+            slots.append(row)
+        rows.append(row)
+
+    results = predict_isolated(predictor.predict_batch, prepped, n_samples=n_samples, adaptive=adaptive)
+    for row, result in zip(slots, results):
+        row.update({"error": str(result)} if isinstance(result, Exception) else result)
+    return rows
+
+
+def score_dump(source: str, output: str, predictor, batch_size: int = 256, n_samples: int = 1000,
+               fmt: Optional[str] = None, restart: bool = False, adaptive=None) -> int:
+    """
+    Scores every study under source into output, resuming from the checkpoint
+    at `<output>.checkpoint.json` unless restart is set. adaptive is an
+    optional AdaptiveSampling; n_samples is then the per-trial cap.
+    Returns:
+        Number of studies scored by this run
+    """
+    fmt = fmt or ("parquet" if output.endswith(".parquet") else "csv")
+    files = list_study_files(source)
+    checkpoint_path = output.rstrip("/") + ".checkpoint.json"
+
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+        if fmt == "csv" and os.path.exists(output):
+            os.remove(output)
+    checkpoint = _load_checkpoint(checkpoint_path, files) or {"files": len(files), "position": [0, 0],
+                                                              "processed": 0, "output": None}
+    if checkpoint["processed"]:
+        print(f"[bulk_score] Resuming after {checkpoint['processed']} studies")
+
+    sink = CsvSink(output, checkpoint["output"]) if fmt == "csv" else ParquetSink(output, checkpoint["output"])
+    scored = 0
+    try:
+        for batch in batches(iter_studies(files, tuple(checkpoint["position"])), batch_size):
+            sink.write(_score_batch(predictor, [study for _, _, study in batch], n_samples, adaptive))
+            file_idx, record_idx, _ = batch[-1]
+            scored += len(batch)
+            checkpoint.update(position=[file_idx, record_idx + 1], processed=checkpoint["processed"] + len(batch),
+                              output=sink.position())
+            save_checkpoint(checkpoint_path, checkpoint)
+            print(f"[bulk_score] {checkpoint['processed']} studies scored")
+    finally:
+        sink.close()
+    return scored
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a local ClinicalTrials.gov study dump.")
+    parser.add_argument("source", help="Directory or file of study JSON / JSON Lines (optionally .gz)")
+    parser.add_argument("--output", required=True, help="CSV file, or directory for Parquet parts")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="Output format (default: from --output)")
+    parser.add_argument("--model-path", default="app/models/model_weights.pth")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-samples", type=int, default=1000)
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Stop MC sampling per trial once converged (--n-samples is the cap)")
+    parser.add_argument("--sem-tol", type=float, default=1e-3)
+    parser.add_argument("--std-tol", type=float, default=1e-3)
+    args = parser.parse_args(argv)
+
+    from app.core.predict import AdaptiveSampling, TrialPredictor
+
+    predictor = TrialPredictor(model_path=args.model_path, device=args.device)
+    adaptive = AdaptiveSampling(sem_tol=args.sem_tol, std_tol=args.std_tol) if args.adaptive else None
+    scored = score_dump(args.source, args.output, predictor, batch_size=args.batch_size,
+                        n_samples=args.n_samples, fmt=args.format, restart=args.restart, adaptive=adaptive)
+    print(f"[bulk_score] Done: {scored} studies scored this run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Deadline-aware admission control for interactive predictions.
+
+Every /predict request carries a Deadline (the X-Deadline-Ms header, or the
+configured default) that the pipeline checks between stages and hands to
+the micro-batcher, so work whose caller has already given up is dropped
+instead of finished. In front of the pipeline sits an AdmissionController:
+at most max_concurrency requests run at once and at most max_queue wait for
+a slot; past that, requests are turned away at once (Overloaded -> 503 with
+Retry-After) instead of piling up in the threadpool until they time out.
+
+Each admitted request gets a degradation level, from the admission queue's
+occupancy and from what each level has recently cost against the request's
+remaining budget:
+
+    0 full           MC dropout with the requested samples
+    1 reduced        MC dropout with fewer samples
+    2 approximate    sampling-free moment propagation (uncertainty_mode "moments")
+    3 deterministic  deterministic forward pass only, no uncertainty
+    4 stale          a cached result past its TTL, without revalidation
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+DEGRADATION_LEVELS = ("full", "reduced", "approximate", "deterministic", "stale")
+FULL, REDUCED, APPROXIMATE, DETERMINISTIC, STALE = range(len(DEGRADATION_LEVELS))
+
+# Header with the caller's remaining budget in milliseconds
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Too many requests waiting; retry later")
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """
+    Absolute expiry (on clock) of one request; seconds=None never expires.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = None if seconds is None else clock() + seconds
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self._clock() >= self.expires_at
+
+    def check(self, stage: str):
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+
+def parse_deadline(header: Optional[str], default_ms: float, clock=time.monotonic) -> Deadline:
+    """
+    Deadline from an X-Deadline-Ms header value, else default_ms. A budget of
+    0 or less means no deadline.
+    Raises:
+        ValueError: if the header is not a number
+    """
+    ms = float(header) if header is not None else default_ms
+    if math.isnan(ms):
+        raise ValueError(f"Invalid {DEADLINE_HEADER}: {header}")
+    return Deadline(ms / 1000.0 if ms > 0 else None, clock=clock)
+
+
+async def within(deadline: Deadline, awaitable, stage: str):
+    """
+    Awaits awaitable, cancelling it with DeadlineExceeded once deadline passes.
+    """
+    deadline.check(stage)
+    try:
+        return await asyncio.wait_for(awaitable, deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"Deadline exceeded during {stage}") from None
+
+
+class Admission:
+    """
+    One admitted request. The pipeline sets level to what it actually served
+    (e.g. deterministic when no stale result exists), which is what the
+    controller's cost estimate is updated for, and sets cached for answers
+    from the cache, which say nothing about the cost of computing one.
+    """
+
+    def __init__(self, level: int, deadline: Deadline):
+        self.level = level
+        self.deadline = deadline
+        self.cached = False
+
+    @property
+    def name(self) -> str:
+        return DEGRADATION_LEVELS[self.level]
+
+
+class AdmissionController:
+    """
+    Bounded admission queue plus degradation policy (see module docstring).
+
+    Queue occupancy at or above each of the pressure fractions raises the
+    level by one. A level whose recent cost (EWMA of request seconds,
+    decaying with half_life so an old spike does not pin requests to a low
+    level) exceeds the remaining deadline is skipped for the next one.
+    Bound to the event loop of the requests it serves.
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_queue: int = 64, pressure=(0.25, 0.5, 0.75, 0.9),
+                 smoothing: float = 0.2, half_life: float = 30.0, clock=time.monotonic):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.pressure = pressure
+        self.smoothing = smoothing
+        self.half_life = half_life
+        self._clock = clock
+
+        self.running = 0
+        self._waiters: deque = deque()
+        self._cost = [(0.0, 0.0)] * len(DEGRADATION_LEVELS)  # level -> (seconds, observed at)
+
+        self.admitted = [0] * len(DEGRADATION_LEVELS)
+        self.rejected = 0
+        self.expired = 0
+
+    def cost(self, level: int) -> float:
+        seconds, observed_at = self._cost[level]
+        return seconds * 0.5 ** ((self._clock() - observed_at) / self.half_life)
+
+    def observe(self, level: int, seconds: float):
+        previous = self.cost(level)
+        estimate = seconds if previous == 0 else previous + self.smoothing * (seconds - previous)
+        self._cost[level] = (estimate, self._clock())
+
+    def retry_after(self) -> int:
+        # Time for the queue ahead to drain at the full-quality cost
+        backlog = (len(self._waiters) + 1) / max(1, self.max_concurrency)
+        return max(1, math.ceil(backlog * self.cost(FULL)))
+
+    def choose_level(self, deadline: Deadline) -> int:
+        occupancy = len(self._waiters) / self.max_queue if self.max_queue else 0.0
+        level = sum(occupancy >= fraction for fraction in self.pressure)
+        remaining = deadline.remaining()
+        if remaining is not None:
+            while level < STALE and self.cost(level) > remaining:
+                level += 1
+        return level
+
+    async def _acquire(self, deadline: Deadline):
+        if self.running < self.max_concurrency and not self._waiters:
+            self.running += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.retry_after())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # shield: a timeout must not cancel a slot that was just handed over
+            await asyncio.wait_for(asyncio.shield(waiter), deadline.remaining())
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.expired += 1
+                raise DeadlineExceeded("Deadline exceeded in the admission queue") from None
+            raise
+
+    def _release(self):
+        # The slot passes straight to the oldest waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def admit(self, deadline: Deadline):
+        """
+        Waits for a slot (Overloaded if the queue is full, DeadlineExceeded if
+        the deadline passes first) and yields the request's Admission.
+        """
+        await self._acquire(deadline)
+        admission = Admission(self.choose_level(deadline), deadline)
+        started = self._clock()
+        try:
+            yield admission
+            if not admission.cached:
+                self.observe(admission.level, self._clock() - started)
+            self.admitted[admission.level] += 1
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "waiting": len(self._waiters),
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "admitted": dict(zip(DEGRADATION_LEVELS, self.admitted)),
+            "cost_seconds": {name: round(self.cost(level), 4) for level, name in enumerate(DEGRADATION_LEVELS)},
+        }
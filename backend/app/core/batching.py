@@ -0,0 +1,167 @@
+import asyncio
+import time
+from collections import defaultdict
+from functools import partial
+from typing import Callable, List, Optional
+
+from app.core.admission import DeadlineExceeded
+from app.core.metrics import current_request, merge_stages, run_collecting
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Upper bounds (ms) of the queue-wait histogram buckets
+WAIT_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+def predict_isolated(predict_batch: Callable, trials: list, **kwargs) -> list:
+    """
+    predict_batch(trials, **kwargs), falling back to one trial at a time when
+    the batch fails so one bad trial does not fail the rest.
+    Returns:
+        list: the result for each trial, or the exception raised for it
+    """
+    try:
+        return predict_batch(trials, **kwargs)
+    except Exception:
+        results = []
+        for trial in trials:
+            try:
+                results.append(predict_batch([trial], **kwargs)[0])
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def _bucket(value: float, bounds) -> str:
+    for bound in bounds:
+        if value <= bound:
+            return f"le_{bound}"
+    return "inf"
+
+
+class MicroBatcher:
+    """
+    Asyncio micro-batching scheduler in front of TrialPredictor.predict_batch.
+
+    Requests are queued and gathered until max_batch_size is reached or the
+    oldest request has waited max_wait_ms, then scored with one batched
+    embedding + MC pass in a worker thread. Results are fanned back out to the
+    waiting requests. Batches run one at a time; requests arriving meanwhile
+    form the next batch.
+    """
+
+    def __init__(self, predict_batch: Callable, max_batch_size: int = 32, max_wait_ms: float = 10.0):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.requests = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.max_queue_depth = 0
+        self.expired = 0
+        self.batch_sizes = defaultdict(int)
+        self.wait_ms = defaultdict(int)
+
+    def _ensure_started(self):
+        # The queue and worker belong to the running loop; restart on a new one
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._loop is not loop or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, trial_dict: dict, n_samples: int, deadline=None) -> dict:
+        """
+        Queue one preprocessed trial and wait for its prediction. A request
+        whose deadline (app.core.admission.Deadline) has passed by the time
+        its batch is formed is failed with DeadlineExceeded, unscored.
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        # current_request() receives the shared batch's stage timings for the access log
+        await self._queue.put((trial_dict, n_samples, deadline, future, time.perf_counter(), current_request()))
+        self.requests += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            for *_, enqueued, request in batch:
+                self.wait_ms[_bucket((started - enqueued) * 1000, WAIT_MS_BUCKETS)] += 1
+                merge_stages(request, {"batch_queue_wait": (started - enqueued) * 1000})
+            self.batches += 1
+            self.batched_requests += len(batch)
+            self.batch_sizes[_bucket(len(batch), BATCH_SIZE_BUCKETS)] += 1
+
+            # Requests may ask for different sample counts; score each group together
+            groups = defaultdict(list)
+            for trial, n_samples, deadline, future, _, request in batch:
+                if future.cancelled():
+                    continue
+                if deadline is not None and deadline.expired:
+                    self.expired += 1
+                    future.set_exception(DeadlineExceeded("Deadline exceeded waiting for a micro-batch"))
+                    continue
+                groups[n_samples].append((trial, future, request))
+            for n_samples, items in groups.items():
+                await self._score(items, n_samples)
+
+    async def _score(self, items: List[tuple], n_samples: int):
+        trials = [trial for trial, _, _ in items]
+        stages = {}
+        try:
+            results, stages = await self._loop.run_in_executor(
+                None, partial(run_collecting, predict_isolated, self.predict_batch, trials, n_samples=n_samples)
+            )
+        except Exception as e:
+            results = [e] * len(items)
+        for (_, future, request), result in zip(items, results):
+            merge_stages(request, stages)
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "requests": self.requests,
+            "batches": self.batches,
+            "expired": self.expired,
+            "mean_batch_size": round(self.batched_requests / self.batches, 2) if self.batches else 0.0,
+            "batch_size_histogram": dict(self.batch_sizes),
+            "queue_wait_ms_histogram": dict(self.wait_ms),
+        }
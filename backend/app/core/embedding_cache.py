@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, one writer per cache directory
+    fcntl = None
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapse whitespace so trivially different copies of a field share a key.
+    The transformer tokenizers split on whitespace, so this does not change
+    the tokens the model sees.
+    """
+    return " ".join((text or "").split())
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """
+    Append-only on-disk store for one model: a raw float32 matrix read through
+    np.memmap plus a tab-separated index of text hash -> row.
+
+    Row numbers come from the size of the vectors file, never from the index:
+    on open, a partial trailing row or index line left by a crash is cut off
+    and index entries past the last whole row are ignored. Writers hold an
+    exclusive fcntl lock on the directory's lock file and pick up rows other
+    processes appended first, so several processes can share one directory.
+    """
+
+    def __init__(self, directory: str, dim: Optional[int] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.tsv")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock_path = os.path.join(directory, "write.lock")
+
+        self.dim = dim
+        self.index: Dict[str, int] = {}
+        self._rows = 0
+        self._index_offset = 0
+        self._mmap = None
+        with self._write_lock():
+            self._load_meta()
+            self._repair()
+            self._sync()
+
+    @contextmanager
+    def _write_lock(self):
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_meta(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+
+    def _vector_rows(self) -> int:
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (self.dim * 4)
+
+    def _repair(self):
+        # Cut a partial trailing row / index line left by an interrupted write
+        if self.dim is not None and os.path.exists(self.vectors_path):
+            os.truncate(self.vectors_path, self._vector_rows() * self.dim * 4)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            if data and not data.endswith(b"\n"):
+                os.truncate(self.index_path, data.rfind(b"\n") + 1)
+
+    def _sync(self):
+        """
+        Read index lines appended since the last sync (by this or another
+        process), keeping only those pointing at whole rows.
+        """
+        self._rows = self._vector_rows()
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        self._index_offset += len(complete)
+        for line in complete.decode("utf-8").splitlines():
+            key, _, row = line.partition("\t")
+            if row and int(row) < self._rows:
+                self.index[key] = int(row)
+
+    def _matrix(self):
+        if self._mmap is None or self._mmap.shape[0] < self._rows:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._mmap
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self.index.get(key)
+        if row is None and os.path.exists(self.index_path) and os.path.getsize(self.index_path) > self._index_offset:
+            # Another process may have added it
+            if self.dim is None:
+                self._load_meta()
+            self._sync()
+            row = self.index.get(key)
+        if row is None:
+            return None
+        return np.array(self._matrix()[row])
+
+    def put(self, keys: List[str], vectors: np.ndarray):
+        with self._write_lock():
+            self._load_meta()
+            self._sync()
+            new, seen = [], set()
+            for key, vector in zip(keys, vectors):
+                if key not in self.index and key not in seen:
+                    seen.add(key)
+                    new.append((key, vector))
+            if not new:
+                return
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+
+            # Vectors first, then the index, so a crash never indexes a missing row
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.asarray([v for _, v in new], dtype=np.float32).tobytes())
+            lines = []
+            for key, _ in new:
+                lines.append(f"{key}\t{self._rows}\n")
+                self.index[key] = self._rows
+                self._rows += 1
+            with open(self.index_path, "ab") as f:
+                f.write("".join(lines).encode("utf-8"))
+            self._index_offset = os.path.getsize(self.index_path)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model name, normalized text hash).
+
+    Lookups hit an in-process LRU first, then the optional on-disk tier
+    (memory-mapped float32 arrays, one directory per model). Disk hits are
+    promoted into the LRU.
+    """
+
+    def __init__(self, max_entries: int = 50000, cache_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._lru: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._disk: Dict[str, _DiskTier] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_tier(self, model_name: str) -> Optional[_DiskTier]:
+        if not self.cache_dir:
+            return None
+        if model_name not in self._disk:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+            self._disk[model_name] = _DiskTier(os.path.join(self.cache_dir, safe_name))
+        return self._disk[model_name]
+
+    def _remember(self, key: tuple, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Returns one cached vector per text, or None where the text is not cached.
+        """
+        results = []
+        with self._lock:
+            disk = self._disk_tier(model_name)
+            for text in texts:
+                key = (model_name, text_key(text))
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                elif disk is not None and (vector := disk.get(key[1])) is not None:
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+                results.append(vector)
+        return results
+
+    def put_many(self, model_name: str, texts: List[str], embeddings: np.ndarray):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            for key, vector in zip(keys, embeddings):
+                self._remember((model_name, key), vector)
+            disk = self._disk_tier(model_name)
+            if disk is not None:
+                disk.put(keys, embeddings)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._lru),
+            }
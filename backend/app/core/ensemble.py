@@ -0,0 +1,226 @@
+"""
+Several MultiInputNN checkpoints served behind one TrialEmbedder.
+
+Every checkpoint (`*.pth` / `*.safetensors`) in a directory is a member,
+named after its file stem. The members' parameters and buffers are stacked
+(torch.func.stack_module_state) and all of them are evaluated by one
+vmap'ed functional call over the shared input tensors, so the embeddings are
+computed once per trial however many members there are, and MC dropout draws
+independent masks per member (randomness="different").
+
+The directory is re-scanned at most every refresh_interval seconds (and on
+refresh()): added, replaced or removed checkpoints are picked up without a
+restart. Each process re-scans on its own, so pre-forked workers converge
+on the same set.
+"""
+import copy
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from torch.func import functional_call, stack_module_state, vmap
+
+from app.core.generate_embeddings import TrialEmbedder
+from app.core.metrics import span
+from app.core.predict import TrialPredictor, phase_labels
+from app.models.model import MultiInputNN
+from app.models.weights import load_weights
+
+CHECKPOINT_SUFFIXES = (".pth", ".pt", ".safetensors")
+
+
+class _Stack:
+    """
+    An immutable snapshot of the members, swapped as a whole on refresh.
+    """
+
+    def __init__(self, names: List[str], models: List[MultiInputNN], checksums: List[str]):
+        self.names = names
+        self.checksums = checksums
+        self.params, self.buffers = stack_module_state(models)
+        # Stateless templates the stacked tensors are plugged into; MC dropout
+        # gets its own so concurrent deterministic calls never see train mode
+        self.base = copy.deepcopy(models[0]).to("meta").eval()
+        self.mc_base = copy.deepcopy(self.base)
+        self.mc_base.enable_mc_dropout()
+
+    def __call__(self, inputs: tuple, mc: bool = False) -> torch.Tensor:
+        """
+        Logits of every member, [N, B].
+        """
+        base = self.mc_base if mc else self.base
+
+        def call(params, buffers, *x):
+            return functional_call(base, (params, buffers), x)
+
+        logits = vmap(call, in_dims=(0, 0) + (None,) * len(inputs), randomness="different")(
+            self.params, self.buffers, *inputs)
+        return logits.squeeze(-1)
+
+
+class EnsemblePredictor(TrialPredictor):
+    """
+    TrialPredictor whose results average the members of model_dir and carry
+    each member's own result under "models".
+    """
+
+    def __init__(self, model_dir: str, device=None, mc_chunk_size: int = 1024, embedding_cache=None,
+                 embedder=None, on_progress=None, embed_backend="fp32", load_embedder: bool = True,
+                 refresh_interval: float = 30.0):
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        print(f"[EnsemblePredictor] Using device: {self.device}")
+        report = on_progress or (lambda component, state: None)
+
+        self.model_dir = model_dir
+        self.refresh_interval = refresh_interval
+        self.mc_chunk_size = mc_chunk_size
+        self._files: Dict[str, tuple] = {}    # name -> (path, mtime, size)
+        self._models: Dict[str, tuple] = {}   # name -> (model, checksum)
+        self._stack: Optional[_Stack] = None
+        self._refresh_lock = threading.Lock()
+        self._next_refresh = 0.0
+
+        report("weights", "loading")
+        self.refresh()
+        if self._stack is None:
+            raise RuntimeError(f"No model checkpoints in {model_dir}")
+        report("weights", "ready")
+
+        self.embedder = embedder
+        if embedder is None and load_embedder:
+            self.embedder = TrialEmbedder(device=self.device, cache=embedding_cache, on_progress=on_progress,
+                                          backend=embed_backend)
+
+    def _scan(self) -> Dict[str, tuple]:
+        files = {}
+        for name in sorted(os.listdir(self.model_dir)):
+            stem, suffix = os.path.splitext(name)
+            if suffix in CHECKPOINT_SUFFIXES:
+                path = os.path.join(self.model_dir, name)
+                stat = os.stat(path)
+                files[stem] = (path, stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _load_member(self, path: str) -> tuple:
+        model = MultiInputNN(sponsor_dim=384, disease_dim=768, text_dim=768, num_features=len(phase_labels))
+        load_weights(model, path, self.device)
+        model.to(self.device)
+        model.eval()
+        return model, self._file_checksum(path)
+
+    def refresh(self) -> bool:
+        """
+        Re-scan model_dir, loading new or changed checkpoints and dropping
+        removed ones. A checkpoint that fails to load is skipped (and retried
+        on the next scan once it changes), keeping the current members.
+        Returns:
+            True if the set of members changed
+        """
+        with self._refresh_lock:
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            files = self._scan()
+            if files == self._files:
+                return False
+            models = {}
+            for name, entry in files.items():
+                if self._files.get(name) == entry and name in self._models:
+                    models[name] = self._models[name]
+                    continue
+                try:
+                    models[name] = self._load_member(entry[0])
+                    print(f"[EnsemblePredictor] Loaded {name} from {entry[0]}")
+                except Exception as e:
+                    # e.g. a checkpoint still being copied in; retried once it changes again
+                    print(f"[EnsemblePredictor] Skipping {entry[0]}: {e}")
+                    if name in self._models:
+                        models[name] = self._models[name]
+            self._files = files
+            if models.keys() == self._models.keys() and \
+                    all(models[n][1] == self._models[n][1] for n in models):
+                return False
+            if not models:
+                print(f"[EnsemblePredictor] No loadable checkpoints in {self.model_dir}; keeping the current members")
+                return False
+            self._models = models
+            names = sorted(models)
+            self._stack = _Stack(names, [models[n][0] for n in names], [models[n][1] for n in names])
+            print(f"[EnsemblePredictor] Members: {', '.join(names)}")
+            return True
+
+    def _maybe_refresh(self):
+        if time.monotonic() >= self._next_refresh:
+            self.refresh()
+
+    @property
+    def members(self) -> List[str]:
+        return list(self._stack.names)
+
+    @property
+    def weights_checksum(self) -> str:
+        # Cached predictions are invalidated whenever a member changes
+        stack = self._stack
+        digest = hashlib.sha256("|".join(f"{n}:{c}" for n, c in zip(stack.names, stack.checksums)).encode())
+        return digest.hexdigest()[:16]
+
+    def member_info(self) -> List[dict]:
+        stack = self._stack
+        return [{"name": n, "checksum": c, "path": self._files.get(n, (None,))[0]}
+                for n, c in zip(stack.names, stack.checksums)]
+
+    def predict(self, trial_dict: dict) -> dict:
+        inputs = self.prepare_inputs([trial_dict])
+        with torch.no_grad():
+            prob = torch.sigmoid(self._stack(inputs)).mean().item()
+        return {"probability": round(prob, 4), "label": int(prob >= 0.5)}
+
+    def predict_inputs(self, inputs: tuple, n_samples: int = 20, chunk_size: int = None, adaptive=None,
+                       uncertainty_mode: str = "mc") -> list:
+        """
+        Deterministic forward and MC dropout of every member in vectorized
+        calls. The ensemble probability is the mean over all members' samples
+        and its uncertainty their pooled std (within- plus between-member
+        spread). Adaptive sampling is not applied; n_samples is per member.
+        Returns:
+            List of result dictionaries, one per input row
+        """
+        if uncertainty_mode != "mc":
+            raise ValueError("The ensemble only supports uncertainty_mode 'mc'")
+        self._maybe_refresh()
+        stack = self._stack
+        n_models, batch_size = len(stack.names), inputs[0].shape[0]
+
+        with span("forward", items=batch_size), torch.no_grad():
+            deterministic = torch.sigmoid(stack(inputs)).cpu().numpy()  # [N, B]
+
+        samples_per_chunk = max(1, (chunk_size or self.mc_chunk_size) // (batch_size * n_models))
+        chunks = []
+        with span("mc_sample", items=batch_size), torch.no_grad():
+            for start in range(0, n_samples, samples_per_chunk):
+                reps = min(samples_per_chunk, n_samples - start)
+                logits = stack(tuple(t.repeat_interleave(reps, dim=0) for t in inputs), mc=True)
+                chunks.append(torch.sigmoid(logits).view(n_models, batch_size, reps).cpu())
+        samples = torch.cat(chunks, dim=2).numpy().astype(np.float64) if chunks \
+            else np.empty((n_models, batch_size, 0))
+
+        per_model = [self._summarize(deterministic[m], samples[m]) for m in range(n_models)]
+        results = []
+        for row in range(batch_size):
+            pooled = samples[:, row].reshape(-1)
+            prob_mean = float(pooled.mean())
+            results.append({
+                "probability": round(prob_mean, 4),
+                "uncertainty": round(float(pooled.std()), 4),
+                "label": int(prob_mean >= 0.5),
+                "deterministic": round(float(deterministic[:, row].mean()), 4),
+                "n_samples_used": samples.shape[2],
+                "models": {name: per_model[m][row] for m, name in enumerate(stack.names)},
+            })
+        return results
+
+    def predict_scenarios(self, base: dict, variants: list, n_samples: int = 20, chunk_size: int = None) -> list:
+        # Members share no tower outputs, so variants are scored as a batch
+        return self.predict_batch([base] + list(variants), n_samples=n_samples, chunk_size=chunk_size)
@@ -0,0 +1,257 @@
+"""
+Persisted per-trial embeddings for re-scoring without the encoders.
+
+A store directory holds the five TrialEmbedder fields of every trial, split
+into shards of at most shard_size rows:
+
+    manifest.json           store id, dtype, field dims, encoders, shard row counts
+    shard-00000/ids.txt     one NCTID per line, in row order
+    shard-00000/versions.txt  study version (lastUpdatePostDate) per row
+    shard-00000/phase.bin   preprocessed phase per row (PHASE_DTYPE)
+    shard-00000/<field>.f16 raw [rows, dim] matrix per field (.f32 for float32)
+
+Rows are appended to the last shard and the manifest is rewritten after
+every batch, so it only ever counts rows whose bytes are on disk. Opening a
+store for append truncates each shard back to the manifest count; a run
+killed mid-batch resumes from the last complete batch. The manifest records
+the encoder model names and revisions, and a writer refuses to mix vectors
+from different encoders into one store. FeatureStore maps the shards with
+np.memmap; nothing is read until a batch is sliced.
+
+A trial is stored once per study version: a newer version of a stored
+trial is appended as a new row that supersedes the old one, and readers
+only yield each NCTID's latest row.
+"""
+import json
+import os
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+FIELD_DIMS = {"sponsor": 384, "disease": 768, "inclusion": 768, "exclusion": 768, "summary": 768}
+DTYPES = {"float16": ".f16", "float32": ".f32"}
+PHASE_DTYPE = np.dtype("<U16")
+SHARD_SIZE = 65536
+
+
+def _shard_dir(path: str, index: int) -> str:
+    return os.path.join(path, f"shard-{index:05d}")
+
+
+def _read_manifest(path: str) -> dict:
+    with open(os.path.join(path, "manifest.json")) as f:
+        return json.load(f)
+
+
+def _read_lines(shard: str, name: str, count: int) -> List[str]:
+    path = os.path.join(shard, name)
+    if not os.path.exists(path):
+        return [""] * count  # stores written before versions were recorded
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()[:count]
+    return lines + [""] * (count - len(lines))
+
+
+def _read_ids(shard: str, count: int) -> List[str]:
+    return _read_lines(shard, "ids.txt", count)
+
+
+def _read_versions(shard: str, count: int) -> List[str]:
+    return _read_lines(shard, "versions.txt", count)
+
+
+class FeatureStoreWriter:
+    """
+    Appends embeddings to a new or existing store.
+    Args:
+        encoders: TrialEmbedder.encoder_info() of the embedder producing the rows
+        dtype / shard_size: only used when the store is created
+    """
+
+    def __init__(self, path: str, encoders: dict, dtype: str = "float16", shard_size: int = SHARD_SIZE,
+                 dims: Optional[Dict[str, int]] = None):
+        self.path = path
+        if os.path.exists(os.path.join(path, "manifest.json")):
+            self.manifest = _read_manifest(path)
+            if self.manifest["encoders"] != encoders:
+                raise ValueError(f"Feature store {path} was built with other encoders: {self.manifest['encoders']}")
+        else:
+            if dtype not in DTYPES:
+                raise ValueError(f"Unsupported dtype {dtype!r}; expected one of {sorted(DTYPES)}")
+            os.makedirs(path, exist_ok=True)
+            self.manifest = {"id": uuid.uuid4().hex, "dtype": dtype, "fields": dict(dims or FIELD_DIMS),
+                             "encoders": encoders, "shard_size": shard_size, "shards": []}
+        self.manifest.setdefault("id", uuid.uuid4().hex)
+        self.dtype = np.dtype(self.manifest["dtype"])
+        self.suffix = DTYPES[self.manifest["dtype"]]
+        self.versions: Dict[str, str] = {}  # NCTID -> version of its latest row
+        self.updated = 0
+        for index, count in enumerate(self.manifest["shards"]):
+            shard = _shard_dir(path, index)
+            self._truncate(shard, count)
+            self.versions.update(zip(_read_ids(shard, count), _read_versions(shard, count)))
+
+    @property
+    def count(self) -> int:
+        return sum(self.manifest["shards"])
+
+    @property
+    def nctids(self):
+        return self.versions.keys()
+
+    def is_current(self, nctid: str, version: str = "") -> bool:
+        """
+        True if nctid is stored at version or a newer one (any stored row
+        counts when version is unknown).
+        """
+        if nctid not in self.versions:
+            return False
+        return not version or version <= self.versions[nctid]
+
+    def _truncate(self, shard: str, count: int):
+        # Drop whatever a killed run wrote after the last manifest update
+        for field, dim in self.manifest["fields"].items():
+            os.truncate(os.path.join(shard, field + self.suffix), count * dim * self.dtype.itemsize)
+        os.truncate(os.path.join(shard, "phase.bin"), count * PHASE_DTYPE.itemsize)
+        for name, lines in (("ids.txt", _read_ids(shard, count)), ("versions.txt", _read_versions(shard, count))):
+            with open(os.path.join(shard, name), "w", encoding="utf-8") as f:
+                f.writelines(f"{line}\n" for line in lines)
+
+    def _write_manifest(self):
+        tmp = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, "manifest.json"))
+
+    def _append_shard(self, index: int, nctids: List[str], embeddings: Dict[str, np.ndarray], phases: List[str],
+                      versions: List[str]):
+        shard = _shard_dir(self.path, index)
+        # A shard the manifest does not count yet may hold a killed run's partial batch
+        mode = "ab" if self.manifest["shards"][index] else "wb"
+        os.makedirs(shard, exist_ok=True)
+        files = []
+        for field in self.manifest["fields"]:
+            files.append((field + self.suffix, np.ascontiguousarray(embeddings[field], dtype=self.dtype).tobytes()))
+        files.append(("phase.bin", np.asarray([p or "" for p in phases], dtype=PHASE_DTYPE).tobytes()))
+        files.append(("ids.txt", "".join(f"{n}\n" for n in nctids).encode("utf-8")))
+        files.append(("versions.txt", "".join(f"{v}\n" for v in versions).encode("utf-8")))
+        for name, data in files:
+            with open(os.path.join(shard, name), mode) as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def append(self, nctids: List[str], embeddings: Dict[str, np.ndarray], phases: List[str],
+               versions: Optional[List[str]] = None) -> int:
+        """
+        Appends rows and commits the manifest. Rows already stored at the same
+        (or a newer) version are skipped; a newer version supersedes the
+        stored row.
+        Args:
+            embeddings: TrialEmbedder.encode_trials() output for the same rows
+            phases: preprocessed phase per row
+            versions: study version (clinicaltrials_api.study_version) per row
+        Returns:
+            Number of rows added
+        """
+        versions = list(versions) if versions is not None else [""] * len(nctids)
+        for field, dim in self.manifest["fields"].items():
+            shape = np.shape(embeddings[field])
+            if shape != (len(nctids), dim):
+                raise ValueError(f"{field} embeddings have shape {shape}, expected ({len(nctids)}, {dim})")
+        keep = [i for i, nctid in enumerate(nctids) if not self.is_current(nctid, versions[i])]
+        if len(set(nctids[i] for i in keep)) != len(keep):
+            raise ValueError("Duplicate NCTIDs in one append")
+        start = 0
+        while start < len(keep):
+            shards = self.manifest["shards"]
+            if not shards or shards[-1] >= self.manifest["shard_size"]:
+                shards.append(0)
+            room = self.manifest["shard_size"] - shards[-1]
+            rows = keep[start:start + room]
+            self._append_shard(len(shards) - 1, [nctids[i] for i in rows],
+                               {field: np.asarray(embeddings[field])[rows] for field in self.manifest["fields"]},
+                               [phases[i] for i in rows], [versions[i] for i in rows])
+            shards[-1] += len(rows)
+            self._write_manifest()
+            start += len(rows)
+        self.updated += sum(nctids[i] in self.versions for i in keep)
+        self.versions.update((nctids[i], versions[i]) for i in keep)
+        return len(keep)
+
+    def close(self):
+        if not os.path.exists(os.path.join(self.path, "manifest.json")):
+            self._write_manifest()
+
+
+class FeatureStore:
+    """
+    Read-only view of a store; each shard's fields are memory-mapped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest = _read_manifest(path)
+        self.id = self.manifest.get("id")
+        self.encoders = self.manifest["encoders"]
+        self.dtype = np.dtype(self.manifest["dtype"])
+        suffix = DTYPES[self.manifest["dtype"]]
+        self.shards = []
+        for index, count in enumerate(self.manifest["shards"]):
+            shard = _shard_dir(path, index)
+            if not count:
+                continue
+            arrays = {
+                field: np.memmap(os.path.join(shard, field + suffix), dtype=self.dtype, mode="r", shape=(count, dim))
+                for field, dim in self.manifest["fields"].items()
+            }
+            phases = np.memmap(os.path.join(shard, "phase.bin"), dtype=PHASE_DTYPE, mode="r", shape=(count,))
+            self.shards.append((_read_ids(shard, count), arrays, phases))
+
+        # Each NCTID's latest row; earlier rows of it were superseded by a newer study version
+        latest = {}
+        for index, (ids, _, _) in enumerate(self.shards):
+            latest.update((nctid, (index, row)) for row, nctid in enumerate(ids))
+        self._current = [np.zeros(len(ids), dtype=bool) for ids, _, _ in self.shards]
+        for index, row in latest.values():
+            self._current[index][row] = True
+        self.trials = len(latest)
+
+    def __len__(self) -> int:
+        """
+        Rows in the store, superseded ones included (the unit of iter_batches' start).
+        """
+        return sum(self.manifest["shards"])
+
+    def iter_spans(self, batch_size: int = 1024,
+                   start: int = 0) -> Iterator[Tuple[int, List[str], Dict[str, np.ndarray], List[str]]]:
+        """
+        Yields (end row, nctids, field -> [B, dim] array, phases) for the
+        current rows of each span of batch_size rows from row start on, so a
+        caller can checkpoint the end row. Batches do not span shards; the
+        arrays are slices of the memory maps (copies where superseded rows
+        are left out), in the store dtype.
+        """
+        base = 0
+        for (ids, arrays, phases), current in zip(self.shards, self._current):
+            for offset in range(max(0, start - base), len(ids), batch_size):
+                stop = min(offset + batch_size, len(ids))
+                keep = current[offset:stop]
+                if keep.all():
+                    yield (base + stop, ids[offset:stop], {field: rows[offset:stop] for field, rows in arrays.items()},
+                           [str(p) for p in phases[offset:stop]])
+                elif keep.any():
+                    rows = np.flatnonzero(keep) + offset
+                    yield (base + stop, [ids[r] for r in rows], {field: x[rows] for field, x in arrays.items()},
+                           [str(phases[r]) for r in rows])
+            base += len(ids)
+
+    def iter_batches(self, batch_size: int = 1024,
+                     start: int = 0) -> Iterator[Tuple[List[str], Dict[str, np.ndarray], List[str]]]:
+        """
+        Yields (nctids, field -> [B, dim] array, phases) of the current rows in
+        store order from row start on (see iter_spans).
+        """
+        for _, ids, arrays, phases in self.iter_spans(batch_size, start):
+            yield ids, arrays, phases
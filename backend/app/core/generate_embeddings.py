@@ -1,29 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
 import numpy as np
 from tqdm import tqdm
 from transformers import AutoTokenizer, AutoModel
 from sentence_transformers import SentenceTransformer
 
+from app.core.inference_backend import (
+    check_backend, sentence_transformer_kwargs, optimize_sentence_transformer, optimize_encoder
+)
+from app.core.metrics import span
+
+SPONSOR_MODEL_NAME = 'all-MiniLM-L6-v2'
+TEXT_MODEL_NAME = 'kamalkraj/BioSimCSE-BioLinkBERT-BASE'
+DISEASE_MODEL_NAME = "Charangan/MedBERT"
+
+
+def _revision(model):
+    """
+    Hub commit hash a transformers model was loaded from (None for local or exported models).
+    """
+    if isinstance(model, SentenceTransformer):
+        model = model[0].auto_model
+    return getattr(getattr(model, "config", None), "_commit_hash", None)
+
 
 class TrialEmbedder:
-    def __init__(self, device=None, batch_size=64):
+    def __init__(self, device=None, batch_size=64, cache=None, on_progress=None, backend="fp32",
+                 onnx_dir="app/models/onnx"):
         self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
-        print(f"[TrialEmbedder] Using device: {self.device}")
+        self.backend = check_backend(backend)
+        print(f"[TrialEmbedder] Using device: {self.device} | backend: {self.backend}")
+
+        # on_progress(component, state) reports model load state, e.g. to /readyz
+        report = on_progress or (lambda component, state: None)
 
         # Models
-        self.sponsor_model = SentenceTransformer('all-MiniLM-L6-v2', device=str(self.device))
-        self.text_model = SentenceTransformer('kamalkraj/BioSimCSE-BioLinkBERT-BASE', device=str(self.device))
-        self.disease_tokenizer = AutoTokenizer.from_pretrained("Charangan/MedBERT")
-        self.disease_model = AutoModel.from_pretrained("Charangan/MedBERT").to(self.device)
+        report("sponsor_model", "loading")
+        st_kwargs = sentence_transformer_kwargs(backend)
+        self.sponsor_model = SentenceTransformer(SPONSOR_MODEL_NAME, device=str(self.device), **st_kwargs)
+        optimize_sentence_transformer(self.sponsor_model, backend)
+        report("sponsor_model", "ready")
+        report("text_model", "loading")
+        self.text_model = SentenceTransformer(TEXT_MODEL_NAME, device=str(self.device), **st_kwargs)
+        optimize_sentence_transformer(self.text_model, backend)
+        report("text_model", "ready")
+        report("disease_model", "loading")
+        self.disease_tokenizer = AutoTokenizer.from_pretrained(DISEASE_MODEL_NAME)
+        self.disease_model = AutoModel.from_pretrained(DISEASE_MODEL_NAME).to(self.device)
         self.disease_model.eval()
+        self.disease_model = optimize_encoder(self.disease_model, self.disease_tokenizer, backend,
+                                              onnx_path=f"{onnx_dir}/medbert.onnx")
+        report("disease_model", "ready")
 
         self.batch_size = batch_size
 
+        # Optional EmbeddingCache; repeated texts skip the transformer forward pass
+        self.cache = cache
+
+    def _cached(self, model_name, texts, encode_fn):
+        """
+        Serve texts from the cache and encode only the misses (deduplicated).
+        """
+        if self.cache is None:
+            return encode_fn(texts)
+
+        # Optimized backends drift slightly from fp32; keep their vectors apart
+        if self.backend != "fp32":
+            model_name = f"{model_name}@{self.backend}"
+
+        cached = self.cache.get_many(model_name, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        if missing:
+            encoded = encode_fn(missing)
+            self.cache.put_many(model_name, missing, encoded)
+            fresh = dict(zip(missing, encoded))
+            cached = [fresh[t] if v is None else v for t, v in zip(texts, cached)]
+        return np.vstack(cached).astype(np.float32)
+
+    @staticmethod
+    def _length_order(texts):
+        """
+        Indices of texts from longest to shortest. Character length is a cheap
+        proxy for token length, so neighbouring texts pad to similar lengths.
+        """
+        return sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+
+    @staticmethod
+    def _restore_order(sorted_rows, order):
+        restored = np.empty_like(sorted_rows)
+        restored[order] = sorted_rows
+        return restored
+
     def _batch_embed_sbert(self, sentences, model):
+        # Length-bucketed: each batch pads only to its own longest text
+        order = self._length_order(sentences)
+        ordered = [sentences[i] for i in order]
         embeddings_list = []
-        n = len(sentences)
+        n = len(ordered)
         for i in tqdm(range(0, n, self.batch_size), desc="Embedding batches"):
-            batch = sentences[i:i + self.batch_size]
+            batch = ordered[i:i + self.batch_size]
             batch_embeddings = model.encode(
                 batch,
                 convert_to_numpy=True,
@@ -32,31 +108,87 @@ class TrialEmbedder:
                 show_progress_bar=False
             )
             embeddings_list.append(batch_embeddings)
-        return np.vstack(embeddings_list)
+        return self._restore_order(np.vstack(embeddings_list), order)
 
     def encode_sponsors(self, sponsor_names):
-        return self._batch_embed_sbert(sponsor_names, self.sponsor_model)
+        with span("encode_sponsors", items=len(sponsor_names)):
+            return self._cached(SPONSOR_MODEL_NAME, sponsor_names, self._embed_sponsors)
 
     def encode_text_fields(self, texts):
-        return self._batch_embed_sbert(texts, self.text_model)
+        with span("encode_text_fields", items=len(texts)):
+            return self._cached(TEXT_MODEL_NAME, texts, self._embed_text_fields)
+
+    def encoder_info(self) -> dict:
+        """
+        Model name and revision of each encoder plus the inference backend, stored
+        with persisted embeddings (see FeatureStore) so vectors from different
+        encoders are never mixed.
+        """
+        return {
+            "sponsor": {"model": SPONSOR_MODEL_NAME, "revision": _revision(self.sponsor_model)},
+            "text": {"model": TEXT_MODEL_NAME, "revision": _revision(self.text_model)},
+            "disease": {"model": DISEASE_MODEL_NAME, "revision": _revision(self.disease_model)},
+            "backend": self.backend,
+        }
+
+    def encode_trials(self, trial_dicts):
+        """
+        Embed every field of a batch of preprocessed trials, one multi-row
+        batch per field.
+        Returns:
+            dict of field name -> np.ndarray with one row per trial
+        """
+        return {
+            'sponsor': self.encode_sponsors([t['sponsor'] for t in trial_dicts]),
+            'disease': self.encode_diseases([t['diseases'] for t in trial_dicts]),
+            'inclusion': self.encode_text_fields([t['inclusion_criteria'] for t in trial_dicts]),
+            'exclusion': self.encode_text_fields([t['exclusion_criteria'] for t in trial_dicts]),
+            'summary': self.encode_text_fields([t['description'] for t in trial_dicts]),
+        }
 
     def encode_diseases(self, diseases):
-        all_embeddings = []
-        n = len(diseases)
-        for i in tqdm(range(0, n, self.batch_size), desc="Embedding diseases"):
-            batch = diseases[i:i + self.batch_size]
-            encoded = self.disease_tokenizer(
+        with span("encode_diseases", items=len(diseases)):
+            return self._cached(DISEASE_MODEL_NAME, diseases, self._embed_diseases)
+
+    def _embed_sponsors(self, sponsor_names):
+        return self._batch_embed_sbert(sponsor_names, self.sponsor_model)
+
+    def _embed_text_fields(self, texts):
+        return self._batch_embed_sbert(texts, self.text_model)
+
+    def _tokenize_diseases(self, batch):
+        with span("tokenize_diseases", items=len(batch)):
+            return self.disease_tokenizer(
                 batch,
                 padding=True,
                 truncation=True,
                 max_length=512,
                 return_tensors='pt'
-            ).to(self.device)
+            )
+
+    def _embed_diseases(self, diseases):
+        order = self._length_order(diseases)
+        buckets = [
+            [diseases[j] for j in order[i:i + self.batch_size]]
+            for i in range(0, len(diseases), self.batch_size)
+        ]
+        if not buckets:
+            return np.empty((0, 0), dtype=np.float32)
+
+        all_embeddings = []
+        # Tokenize the next bucket on a background thread while the model runs
+        # the current one (fast tokenizers release the GIL)
+        with ThreadPoolExecutor(max_workers=1) as tokenizer_pool:
+            pending = tokenizer_pool.submit(self._tokenize_diseases, buckets[0])
+            for i in tqdm(range(len(buckets)), desc="Embedding diseases"):
+                encoded = pending.result().to(self.device)
+                if i + 1 < len(buckets):
+                    pending = tokenizer_pool.submit(self._tokenize_diseases, buckets[i + 1])
 
-            with torch.no_grad():
-                output = self.disease_model(**encoded)
-                cls_embeddings = output.last_hidden_state[:, 0, :]  # CLS token
-                cls_np = cls_embeddings.cpu().numpy()
-                all_embeddings.append(cls_np)
+                with torch.no_grad():
+                    output = self.disease_model(**encoded)
+                    cls_embeddings = output.last_hidden_state[:, 0, :]  # CLS token
+                    cls_np = cls_embeddings.cpu().numpy()
+                    all_embeddings.append(cls_np)
 
-        return np.vstack(all_embeddings)
\ No newline at end of file
+        return self._restore_order(np.vstack(all_embeddings), order)
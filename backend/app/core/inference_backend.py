@@ -0,0 +1,114 @@
+import os
+from types import SimpleNamespace
+
+import torch
+import torch.nn as nn
+
+# fp32: reference; int8: dynamic quantization of Linear layers;
+# compile: torch.compile of the transformer; onnx: ONNX Runtime execution
+BACKENDS = ("fp32", "int8", "compile", "onnx")
+
+
+def check_backend(backend: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+    return backend
+
+
+def quantize_linear(module: nn.Module) -> nn.Module:
+    """
+    Dynamic int8 quantization of every nn.Linear (weights int8, activations
+    quantized per batch). CPU only.
+    """
+    from torch.ao.quantization import quantize_dynamic
+    return quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def sentence_transformer_kwargs(backend: str) -> dict:
+    """
+    Extra SentenceTransformer constructor arguments for a backend. The onnx
+    backend is handled natively by sentence-transformers (needs onnxruntime).
+    """
+    return {"backend": "onnx"} if backend == "onnx" else {}
+
+
+def optimize_sentence_transformer(model, backend: str):
+    if backend == "int8":
+        quantize_linear(model)
+    elif backend == "compile":
+        # Compile the inner Hugging Face model; encode() keeps working unchanged
+        model[0].auto_model = torch.compile(model[0].auto_model, dynamic=True)
+    return model
+
+
+class OnnxEncoder:
+    """
+    Runs an exported Hugging Face encoder with ONNX Runtime, behind the same
+    `model(**encoded).last_hidden_state` interface as the torch model.
+    """
+
+    def __init__(self, path: str, num_threads: int = None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("The onnx backend requires onnxruntime (pip install onnxruntime)") from e
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, **encoded):
+        feeds = {name: encoded[name].cpu().numpy() for name in self.input_names}
+        (hidden,) = self.session.run(["last_hidden_state"], feeds)
+        return SimpleNamespace(last_hidden_state=torch.from_numpy(hidden))
+
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+
+def export_encoder_onnx(model: nn.Module, tokenizer, path: str) -> str:
+    """
+    Export a Hugging Face encoder to ONNX with dynamic batch and sequence axes.
+    Reuses an existing export at path.
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    sample = tokenizer(["onnx export"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    class _Wrapper(nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(input_names, inputs))).last_hidden_state
+
+    torch.onnx.export(
+        _Wrapper(model.cpu().eval()),
+        tuple(sample[name] for name in input_names),
+        path,
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+    )
+    return path
+
+
+def optimize_encoder(model: nn.Module, tokenizer, backend: str, onnx_path: str = None):
+    if backend == "int8":
+        return quantize_linear(model)
+    if backend == "compile":
+        return torch.compile(model, dynamic=True)
+    if backend == "onnx":
+        return OnnxEncoder(export_encoder_onnx(model, tokenizer, onnx_path), num_threads=torch.get_num_threads())
+    return model
@@ -0,0 +1,439 @@
+"""
+Durable prediction jobs for large portfolios.
+
+A job is a list of NCTIDs, or of uploaded study records, persisted in SQLite
+with one row per trial. JobRunner works through queued jobs on its own
+thread and event loop, one batch at a time, and commits every batch's
+results before taking the next; after a restart, running jobs go back to
+the queue and only their unscored trials are processed again. Each job
+records the process running it (pid plus process start time, so a restarted
+server that gets the same pid back is not mistaken for the old one), so
+several server processes can share one store without requeueing each
+other's work. Results are numbered in
+completion order so a download can follow a running job.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+FINISHED = (COMPLETED, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    source TEXT NOT NULL,
+    n_samples INTEGER NOT NULL,
+    adaptive INTEGER,
+    uncertainty_mode TEXT NOT NULL DEFAULT 'mc',
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    nctid TEXT NOT NULL,
+    study BLOB,
+    result TEXT,
+    position INTEGER,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS job_items_position ON job_items (job_id, position);
+"""
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _gunzip(body: bytes, max_bytes: Optional[int]) -> bytes:
+    # Member by member (gzip allows several), never inflating past max_bytes
+    out = bytearray()
+    while body:
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out += inflater.decompress(body, 0 if max_bytes is None else max_bytes + 1 - len(out))
+        if max_bytes is not None and len(out) > max_bytes:
+            raise UploadTooLarge(f"Upload decompresses to more than {max_bytes} bytes")
+        if not inflater.eof:
+            raise ValueError("Truncated gzip upload")
+        body = inflater.unused_data
+    return bytes(out)
+
+
+def parse_upload(body: bytes, max_bytes: Optional[int] = None) -> List[dict]:
+    """
+    Study records from an uploaded file: JSON Lines, one study, a list of
+    studies or an API page ({"studies": [...]}), optionally gzip-compressed.
+    Raises:
+        UploadTooLarge: if the body decompresses to more than max_bytes
+    """
+    if body[:2] == b"\x1f\x8b":
+        body = _gunzip(body, max_bytes)
+    text = body.decode("utf-8").strip()
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict) and "studies" in data:
+        data = data["studies"]
+    return data if isinstance(data, list) else [data]
+
+
+def _process_start(pid: int) -> Optional[str]:
+    # Start time in clock ticks since boot (field 22 of /proc/<pid>/stat); None off Linux
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+_tokens: Dict[int, str] = {}
+
+
+def process_token() -> str:
+    """
+    Identity of this process as a job owner: "<pid>:<start time>", or
+    "<pid>:<random id>" where the start time cannot be read.
+    """
+    pid = os.getpid()
+    if pid not in _tokens:
+        _tokens[pid] = f"{pid}:{_process_start(pid) or uuid.uuid4().hex}"
+    return _tokens[pid]
+
+
+def _alive(owner) -> bool:
+    if not owner:
+        return False
+    if owner == process_token():
+        return True
+    pid_text, _, started = str(owner).partition(":")
+    pid = int(pid_text)
+    if pid == os.getpid():
+        # Our pid, but an earlier process's token: the server was restarted
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # The pid may have been reused by an unrelated process since
+    current = _process_start(pid)
+    return not (started and current and current != started)
+
+
+class JobStore:
+    """
+    SQLite persistence for jobs and their per-trial results. Same connection
+    handling as StudyStore: one shared connection behind a lock, reopened
+    after a fork.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "uncertainty_mode" not in columns:
+                # Stores created before jobs recorded their uncertainty mode
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN uncertainty_mode TEXT NOT NULL DEFAULT 'mc'")
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = self._pid = None
+
+    def _transaction(self, fn: Callable):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def create(self, nctids: Optional[List[str]] = None, studies: Optional[List[Tuple[str, dict]]] = None,
+               n_samples: int = 1000, adaptive: Optional[bool] = None, uncertainty_mode: str = "mc") -> dict:
+        """
+        Queue a job over nctids, or over (nctid, study JSON) pairs from an upload.
+        """
+        job_id = uuid.uuid4().hex
+        if studies is not None:
+            source = "upload"
+            rows = [(job_id, seq, nctid, zlib.compress(json.dumps(study).encode("utf-8")))
+                    for seq, (nctid, study) in enumerate(studies)]
+        else:
+            source = "nctids"
+            rows = [(job_id, seq, nctid, None) for seq, nctid in enumerate(nctids or [])]
+
+        def insert(conn):
+            conn.execute(
+                "INSERT INTO jobs (id, status, source, n_samples, adaptive, uncertainty_mode, total, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, source, n_samples, None if adaptive is None else int(adaptive), uncertainty_mode,
+                 len(rows), time.time()),
+            )
+            conn.executemany("INSERT INTO job_items (job_id, seq, nctid, study) VALUES (?, ?, ?, ?)", rows)
+
+        self._transaction(insert)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            names = [d[0] for d in cursor.description]
+        if row is None:
+            return None
+        job = dict(zip(names, row))
+        job["job_id"] = job.pop("id")
+        job["adaptive"] = None if job["adaptive"] is None else bool(job["adaptive"])
+        return job
+
+    def claim_next(self) -> Optional[dict]:
+        """
+        Mark the oldest queued job running under this process and return it
+        (None if the queue is empty).
+        """
+        def claim(conn):
+            row = conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = ?, owner = ?, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                         (RUNNING, process_token(), time.time(), row[0]))
+            return row[0]
+
+        job_id = self._transaction(claim)
+        return self.get(job_id) if job_id else None
+
+    def pending_items(self, job_id: str, limit: int) -> List[dict]:
+        """
+        The next unscored trials of a job: dicts with seq, nctid and the uploaded study (or None).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, nctid, study FROM job_items WHERE job_id = ? AND position IS NULL ORDER BY seq LIMIT ?",
+                (job_id, limit),
+            ).fetchall()
+        return [{"seq": seq, "nctid": nctid, "study": json.loads(zlib.decompress(study)) if study else None}
+                for seq, nctid, study in rows]
+
+    def complete(self, job_id: str, results: List[Tuple[int, dict]]) -> bool:
+        """
+        Store the results of one batch ((seq, result) pairs) and advance the
+        job's counters. Returns False, storing nothing, if the job is no longer
+        running under this process (it was requeued and maybe claimed again).
+        """
+        def store(conn):
+            status, owner, done, failed = conn.execute(
+                "SELECT status, owner, done, failed FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if status != RUNNING or owner != process_token():
+                return False
+            position = done + failed
+            n_failed = 0
+            for seq, result in results:
+                position += 1
+                n_failed += "error" in result
+                conn.execute("UPDATE job_items SET result = ?, position = ? WHERE job_id = ? AND seq = ?",
+                             (json.dumps(result), position, job_id, seq))
+            conn.execute("UPDATE jobs SET done = done + ?, failed = failed + ? WHERE id = ?",
+                         (len(results) - n_failed, n_failed, job_id))
+            return True
+
+        return self._transaction(store)
+
+    def finish(self, job_id: str, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                               (FAILED if error else COMPLETED, error, time.time(), job_id))
+
+    def release(self, owner: Optional[str] = None, job_id: Optional[str] = None) -> int:
+        """
+        Requeue the running jobs of one process (default: this one), or only
+        job_id among them. Returns how many.
+        """
+        query, params = "UPDATE jobs SET status = ? WHERE status = ? AND owner = ?", [QUEUED, RUNNING]
+        params.append(owner or process_token())
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        with self._lock:
+            return self._conn.execute(query, params).rowcount
+
+    def recover(self) -> int:
+        """
+        Requeue jobs left running by processes that no longer exist (a
+        restart, or a crashed sibling worker). Returns how many.
+        """
+        with self._lock:
+            owners = [r[0] for r in self._conn.execute("SELECT DISTINCT owner FROM jobs WHERE status = ?", (RUNNING,))]
+        return sum(self.release(owner) for owner in owners if not _alive(owner))
+
+    def results(self, job_id: str, after: int = 0, limit: int = 500) -> List[Tuple[int, dict]]:
+        """
+        (position, result) pairs completed after position `after`, in completion order.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT position, result FROM job_items WHERE job_id = ? AND position > ? ORDER BY position LIMIT ?",
+                (job_id, after, limit),
+            ).fetchall()
+        return [(position, json.loads(result)) for position, result in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in (QUEUED, RUNNING, COMPLETED, FAILED)} | dict(rows)
+
+
+class JobRunner:
+    """
+    Processes queued jobs on a dedicated thread with its own event loop, so
+    job work never occupies the API's event loop or request threadpool.
+
+    score_batch(items, job) is a coroutine returning one result dict per
+    item. At most `concurrency` jobs run at once; before each batch a
+    runner waits (up to max_yield seconds) while busy() reports interactive
+    requests in flight, so large jobs only fill the gaps between them.
+    on_exit() is awaited on the runner's loop when it stops (e.g. to close
+    an HTTP client bound to that loop).
+    """
+
+    def __init__(self, store: JobStore, score_batch: Callable, concurrency: int = 1, batch_size: int = 32,
+                 busy: Optional[Callable[[], bool]] = None, max_yield: float = 5.0, poll_interval: float = 1.0,
+                 on_exit: Optional[Callable] = None):
+        self.store = store
+        self.score_batch = score_batch
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.busy = busy or (lambda: False)
+        self.max_yield = max_yield
+        self.poll_interval = poll_interval
+        self.on_exit = on_exit
+
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._lock = threading.Lock()
+        self.batches = 0
+
+    def start(self):
+        """
+        Requeue interrupted jobs and start the runner thread (idempotent).
+        """
+        with self._lock:
+            if self._thread is None:
+                recovered = self.store.recover()
+                if recovered:
+                    print(f"[JobRunner] Requeued {recovered} interrupted job(s)")
+                self._stopping = False
+                ready = threading.Event()
+                self._thread = threading.Thread(target=asyncio.run, args=(self._main(ready),),
+                                                name="job-runner", daemon=True)
+                self._thread.start()
+                ready.wait(5)
+
+    def notify(self):
+        """
+        Wake idle workers (a job was queued).
+        """
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def stop(self, timeout: float = 10.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping = True
+            self.notify()
+            thread.join(timeout)
+            if thread.is_alive():
+                # A batch is still running; its worker requeues the job once the batch returns
+                print(f"[JobRunner] Still finishing a batch after {timeout}s; its job is requeued when done")
+            else:
+                self.store.release()
+
+    async def _main(self, ready: threading.Event):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        ready.set()
+        try:
+            await asyncio.gather(*(self._worker() for _ in range(self.concurrency)))
+        finally:
+            if self.on_exit is not None:
+                await self.on_exit()
+
+    async def _worker(self):
+        while not self._stopping:
+            job = await asyncio.to_thread(self.store.claim_next)
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(job)
+
+    async def _yield_to_interactive(self):
+        deadline = time.monotonic() + self.max_yield
+        while self.busy() and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+
+    async def _run_job(self, job: dict):
+        job_id = job["job_id"]
+        print(f"[JobRunner] Job {job_id}: {job['total'] - job['done'] - job['failed']} trials to score")
+        try:
+            while not self._stopping:
+                items = await asyncio.to_thread(self.store.pending_items, job_id, self.batch_size)
+                if not items:
+                    break
+                await self._yield_to_interactive()
+                results = await self.score_batch(items, job)
+                stored = await asyncio.to_thread(self.store.complete, job_id,
+                                                 [(i["seq"], r) for i, r in zip(items, results)])
+                if not stored:
+                    print(f"[JobRunner] Job {job_id} was requeued meanwhile; dropping this batch")
+                    return
+                self.batches += 1
+            else:
+                # Stopping: back to the queue for the next runner
+                await asyncio.to_thread(self.store.release, None, job_id)
+                return
+            await asyncio.to_thread(self.store.finish, job_id)
+            print(f"[JobRunner] Job {job_id} completed")
+        except Exception as e:
+            await asyncio.to_thread(self.store.finish, job_id, str(e))
+            print(f"[JobRunner] Job {job_id} failed: {e}")
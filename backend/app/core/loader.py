@@ -0,0 +1,111 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+# Small dummy trial used to prime kernels and allocator pools after loading
+WARMUP_TRIAL = {
+    "sponsor": "Warmup Pharma",
+    "diseases": "Hypertension",
+    "inclusion_criteria": "Adults aged 18 to 65 years.",
+    "exclusion_criteria": "Pregnant or breastfeeding women.",
+    "description": "A randomized study to warm up the inference pipeline.",
+    "phase": "phase 2"
+}
+
+
+class PredictorLoader:
+    """
+    Builds the TrialPredictor off the request path and tracks per-component
+    load state for the readiness probe.
+
+    factory(on_progress) must return a predictor and call
+    on_progress(component, state) as each model is loaded. preload() builds
+    it up front (app.serve, before forking workers); start() then only runs
+    the warmup and marks it ready.
+    """
+
+    def __init__(self, factory: Callable, warmup: bool = False, warmup_batch: int = 4):
+        self.factory = factory
+        self.warmup = warmup
+        self.warmup_batch = warmup_batch
+
+        self.predictor = None
+        self._preloaded = None
+        self.error: Optional[str] = None
+        self.components: Dict[str, str] = {}
+        self.load_seconds: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _progress(self, component: str, state: str):
+        self.components[component] = state
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            predictor = self._preloaded or self.factory(self._progress)
+            if self.warmup:
+                self._progress("warmup", LOADING)
+                predictor.predict_batch([WARMUP_TRIAL] * self.warmup_batch, n_samples=32)
+                self._progress("warmup", READY)
+            self.predictor = predictor
+            self.load_seconds = round(time.perf_counter() - started, 2)
+            print(f"[PredictorLoader] Ready in {self.load_seconds}s")
+        except Exception as e:
+            self.error = str(e)
+            for component, state in self.components.items():
+                if state == LOADING:
+                    self.components[component] = FAILED
+            print(f"[PredictorLoader] Failed to load predictor: {e}")
+        finally:
+            self._done.set()
+
+    def preload(self):
+        """
+        Build the predictor in the calling thread without warming it up, so
+        no inference (and no torch thread pool) runs before a fork.
+        """
+        started = time.perf_counter()
+        self._preloaded = self.factory(self._progress)
+        print(f"[PredictorLoader] Preloaded in {round(time.perf_counter() - started, 2)}s")
+
+    def start(self):
+        """
+        Start loading in a background thread (idempotent).
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name="predictor-loader", daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None):
+        """
+        Block until loading finished; returns the predictor or raises if it failed.
+        """
+        self.start()
+        self._done.wait(timeout)
+        if self.predictor is None:
+            raise RuntimeError(self.error or "Predictor is still loading")
+        return self.predictor
+
+    def is_ready(self) -> bool:
+        return self.predictor is not None
+
+    def status(self) -> dict:
+        if self.predictor is not None:
+            state = READY
+        elif self.error is not None:
+            state = FAILED
+        elif self._thread is not None:
+            state = LOADING
+        else:
+            state = PENDING
+        return {
+            "status": state,
+            "components": dict(self.components),
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
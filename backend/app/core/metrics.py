@@ -0,0 +1,395 @@
+"""
+In-process metrics in the Prometheus text exposition format, plus per-request
+stage timings for the JSON access log.
+
+Counters, gauges and histograms are plain dicts keyed by label values behind
+one lock each; span(stage) times a block into the stage histogram and into
+the current request's timings (a contextvar, so it follows the request into
+run_in_threadpool workers). Collectors registered on the registry are called
+at scrape time for values that already live elsewhere (cache stats, process
+RSS), so they cost nothing on the request path.
+"""
+import bisect
+import contextvars
+import json
+import math
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Seconds; spans range from sub-millisecond parsing to multi-second MC batches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, value: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value: float = 1, **labels):
+        self.inc(-value, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        out = []
+        with self._lock:
+            items = [(key, [list(s[0]), s[1], s[2]]) for key, s in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                out.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            out.append((f"{self.name}_sum", labels, total))
+            out.append((f"{self.name}_count", labels, count))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collector: Callable):
+        """
+        collector() returns metric families computed at scrape time, as
+        [(name, type, help, [(labels dict, value), ...]), ...].
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"[metrics] Collector failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter("lucent_http_requests_total", "HTTP requests by route and status.", ("route", "status"))
+REQUEST_SECONDS = REGISTRY.histogram("lucent_http_request_duration_seconds", "HTTP request latency.", ("route",))
+IN_FLIGHT = REGISTRY.gauge("lucent_http_requests_in_flight", "HTTP requests currently being served.")
+STAGE_SECONDS = REGISTRY.histogram("lucent_stage_duration_seconds", "Pipeline stage latency.", ("stage",))
+STAGE_ITEMS = REGISTRY.counter("lucent_stage_items_total", "Trials (or texts) processed per stage.", ("stage",))
+ERRORS = REGISTRY.counter("lucent_errors_total", "Failed pipeline stages and request errors.", ("stage",))
+
+
+class RequestContext:
+    """
+    Stage timings (ms) and extra fields collected for one access log line.
+    """
+
+    __slots__ = ("stages", "fields")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.fields: dict = {}
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("lucent_request", default=None)
+
+
+def current_request() -> Optional[RequestContext]:
+    return _current.get()
+
+
+def annotate(**fields):
+    """
+    Add fields to the current request's access log line (no-op outside a request).
+    """
+    ctx = _current.get()
+    if ctx is not None:
+        ctx.fields.update(fields)
+
+
+def merge_stages(ctx: Optional[RequestContext], stages: Dict[str, float]):
+    if ctx is not None:
+        for stage, ms in stages.items():
+            ctx.stages[stage] = ctx.stages.get(stage, 0.0) + ms
+
+
+def run_collecting(fn: Callable, *args, **kwargs) -> Tuple[object, Dict[str, float]]:
+    """
+    Run fn under a fresh RequestContext and return (result, stage timings), for
+    work shared by several requests (e.g. a micro-batch).
+    """
+    ctx = RequestContext()
+    token = _current.set(ctx)
+    try:
+        return fn(*args, **kwargs), ctx.stages
+    finally:
+        _current.reset(token)
+
+
+class span:
+    """
+    Time a pipeline stage:
+
+        with span("mc_sample", items=len(trials)):
+            ...
+    """
+
+    __slots__ = ("stage", "items", "started")
+
+    def __init__(self, stage: str, items: int = 0):
+        self.stage = stage
+        self.items = items
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        if self.items:
+            STAGE_ITEMS.inc(self.items, stage=self.stage)
+        if exc_type is not None:
+            ERRORS.inc(stage=self.stage)
+        ctx = _current.get()
+        if ctx is not None:
+            ctx.stages[self.stage] = ctx.stages.get(self.stage, 0.0) + elapsed * 1000
+        return False
+
+
+def memory_breakdown(pid="self") -> Optional[Dict[str, int]]:
+    """
+    Resident memory of a process split from /proc/<pid>/smaps_rollup, in
+    bytes: shared pages (also mapped by another process, e.g. weights
+    inherited copy-on-write or a mapped weights file), private pages, and
+    the proportional set size. None where smaps_rollup is unavailable.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except (OSError, ValueError):
+        return None
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def process_stats() -> dict:
+    """
+    Resident memory, CPU time and thread counts of this process. torch
+    thread settings are only reported once torch has been imported.
+    """
+    stats = {"threads": threading.active_count()}
+    try:
+        with open("/proc/self/statm") as f:
+            stats["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stats["rss_bytes"] = rss if sys.platform == "darwin" else rss * 1024
+    times = os.times()
+    stats["cpu_seconds"] = times.user + times.system
+    try:
+        stats["open_fds"] = len(os.listdir("/proc/self/fd"))
+    except OSError:
+        pass
+    memory = memory_breakdown()
+    if memory is not None:
+        stats["memory_bytes"] = memory
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        stats["torch_threads"] = torch.get_num_threads()
+        stats["torch_interop_threads"] = torch.get_num_interop_threads()
+    return stats
+
+
+def _process_collector():
+    stats = process_stats()
+    families = [
+        ("process_resident_memory_bytes", "gauge", "Resident memory size in bytes.", [({}, stats["rss_bytes"])]),
+        ("process_cpu_seconds_total", "counter", "User and system CPU time in seconds.", [({}, stats["cpu_seconds"])]),
+        ("process_threads", "gauge", "Python threads alive.", [({}, stats["threads"])]),
+    ]
+    if "open_fds" in stats:
+        families.append(("process_open_fds", "gauge", "Open file descriptors.", [({}, stats["open_fds"])]))
+    if "memory_bytes" in stats:
+        families.append(("lucent_process_memory_bytes", "gauge",
+                         "Resident memory by sharing: shared, private (unique to this process) and pss.",
+                         [({"kind": kind}, value) for kind, value in stats["memory_bytes"].items() if kind != "rss"]))
+    if "torch_threads" in stats:
+        families.append(("lucent_torch_threads", "gauge", "torch intra-op / inter-op thread counts.", [
+            ({"kind": "intra_op"}, stats["torch_threads"]),
+            ({"kind": "inter_op"}, stats["torch_interop_threads"]),
+        ]))
+    return families
+
+
+REGISTRY.register_collector(_process_collector)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request count, latency and in-flight gauge per route
+    template, and one JSON access log line per request with its stage timings.
+    """
+
+    def __init__(self, app, access_log: bool = True, stream=None, exclude=("/metrics",)):
+        self.app = app
+        self.access_log = access_log
+        self.stream = stream
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        ctx = RequestContext()
+        token = _current.set(ctx)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec()
+            _current.reset(token)
+            # Route template, not the raw path, keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUESTS.inc(route=route, status=status["code"])
+            REQUEST_SECONDS.observe(elapsed, route=route)
+            if self.access_log and route not in self.exclude:
+                self._log(scope, route, status["code"], elapsed, ctx)
+
+    def _log(self, scope, route, status, elapsed, ctx):
+        record = {
+            "ts": round(time.time(), 3),
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "route": route,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 3),
+            "stages_ms": {k: round(v, 3) for k, v in ctx.stages.items()},
+            **ctx.fields,
+        }
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps(record, default=str) + "\n")
@@ -0,0 +1,110 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from app.core.generate_embeddings import TrialEmbedder
+
+# Per-process embedder, created once by the pool initializer
+_worker_embedder = None
+
+
+def _init_worker(embedder_cls, device, batch_size, num_threads, backend):
+    global _worker_embedder
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    _worker_embedder = embedder_cls(device=device, batch_size=batch_size, backend=backend)
+
+
+def _worker_encode(method: str, texts: list) -> np.ndarray:
+    return getattr(_worker_embedder, method)(texts)
+
+
+def _worker_encoder_info() -> dict:
+    return _worker_embedder.encoder_info()
+
+
+def _worker_ping(delay: float) -> int:
+    # Holds the worker briefly so each ping lands on a different process
+    time.sleep(delay)
+    return os.getpid()
+
+
+class ParallelEmbedder(TrialEmbedder):
+    """
+    Drop-in TrialEmbedder that runs the encoders in a pool of worker processes.
+
+    Each worker owns its own copy of the three models and a fixed intra-op
+    thread count, so workers do not oversubscribe the cores. The five fields
+    of a trial are encoded concurrently, and large batches are split into
+    shards spread across the workers. Caching stays in the parent process.
+    """
+
+    def __init__(self, workers: int = None, threads_per_worker: int = None, device="cpu",
+                 batch_size=64, cache=None, shard_size: int = 256, embedder_cls=TrialEmbedder, backend="fp32"):
+        cores = os.cpu_count() or 1
+        self.workers = workers or min(5, cores)
+        self.threads_per_worker = threads_per_worker or max(1, cores // self.workers)
+        self.device = torch.device(device)
+        self.backend = backend
+        self.batch_size = batch_size
+        self.cache = cache
+        self.shard_size = shard_size
+        print(f"[ParallelEmbedder] {self.workers} workers x {self.threads_per_worker} threads")
+
+        # spawn, not fork: forking a process that already ran torch kernels can deadlock
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(embedder_cls, str(self.device), batch_size, self.threads_per_worker, backend),
+        )
+        # Threads that fan a trial's fields out to the pool
+        self._dispatch = ThreadPoolExecutor(max_workers=5)
+
+    def _sharded(self, method: str, texts: list) -> np.ndarray:
+        shards = [texts[i:i + self.shard_size] for i in range(0, len(texts), self.shard_size)]
+        futures = [self.pool.submit(_worker_encode, method, shard) for shard in shards]
+        return np.vstack([f.result() for f in futures])
+
+    def _embed_sponsors(self, sponsor_names):
+        return self._sharded("encode_sponsors", sponsor_names)
+
+    def _embed_text_fields(self, texts):
+        return self._sharded("encode_text_fields", texts)
+
+    def _embed_diseases(self, diseases):
+        return self._sharded("encode_diseases", diseases)
+
+    def encoder_info(self) -> dict:
+        # The models only exist in the workers
+        return self.pool.submit(_worker_encoder_info).result()
+
+    def encode_trials(self, trial_dicts):
+        """
+        Same as TrialEmbedder.encode_trials, with the five fields encoded concurrently.
+        """
+        jobs = {
+            'sponsor': (self.encode_sponsors, [t['sponsor'] for t in trial_dicts]),
+            'disease': (self.encode_diseases, [t['diseases'] for t in trial_dicts]),
+            'inclusion': (self.encode_text_fields, [t['inclusion_criteria'] for t in trial_dicts]),
+            'exclusion': (self.encode_text_fields, [t['exclusion_criteria'] for t in trial_dicts]),
+            'summary': (self.encode_text_fields, [t['description'] for t in trial_dicts]),
+        }
+        futures = {field: self._dispatch.submit(fn, texts) for field, (fn, texts) in jobs.items()}
+        return {field: future.result() for field, future in futures.items()}
+
+    def start(self):
+        """
+        Spawn every worker and wait until each has loaded its models; the pool
+        otherwise starts workers lazily on the first request.
+        """
+        futures = [self.pool.submit(_worker_ping, 0.1) for _ in range(self.workers)]
+        return len({f.result() for f in futures})
+
+    def close(self):
+        self._dispatch.shutdown()
+        self.pool.shutdown()
@@ -1,3 +1,6 @@
+from typing import Any, Dict, Iterable, List
+
+PARSED_COLUMNS = ("sponsor", "has_results", "brief_summary", "eligibility", "diseases", "phase")
 
 
 def parse_trial_json(data: dict):
@@ -34,6 +37,29 @@ def parse_trial_json(data: dict):
         "phase": phase
     }
 
+
+def parse_trials(studies: Iterable[dict]) -> Dict[str, List[Any]]:
+    """
+    Column-oriented parse_trial_json over many studies.
+    Args:
+        studies: ClinicalTrials.gov v2 study JSON dicts
+    Returns:
+        dict of PARSED_COLUMNS -> list with one value per study
+    """
+    columns = {name: [] for name in PARSED_COLUMNS}
+    sponsor, has_results, summary, eligibility, diseases, phase = (columns[name] for name in PARSED_COLUMNS)
+    for data in studies:
+        protocol = data.get('protocolSection', {})
+        sponsor.append(protocol.get('sponsorCollaboratorsModule', {}).get('leadSponsor', {}).get('name', ""))
+        has_results.append(data.get('hasResults', False))
+        summary.append(protocol.get('descriptionModule', {}).get('briefSummary', ""))
+        eligibility.append(protocol.get('eligibilityModule', {}).get('eligibilityCriteria', ""))
+        diseases.append(protocol.get('conditionsModule', {}).get('conditions', []))
+        phase_list = protocol.get('designModule', {}).get('phases', [])
+        phase.append(phase_list[0] if phase_list else "NA")
+    return columns
+
+
 if __name__ == "__main__":
     from app.services.clinicaltrials_api import fetch_nctid_data
     nctid = "NCT06056323"  # Example NCTID
@@ -1,3 +1,9 @@
+import copy
+import hashlib
+import itertools
+from dataclasses import dataclass
+from typing import Optional
+
 import torch
 import numpy as np
 
@@ -7,24 +13,112 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 from app.core.generate_embeddings import TrialEmbedder  
 from app.models.model import MultiInputNN
+from app.models.uncertainty import FastUncertainty
+from app.models.weights import load_weights
+from app.core.metrics import span
 
 # Ensure phase_labels are in this exact order
 phase_labels = ['early phase 1', 'phase 1', 'phase 1/phase 2', 'phase 2', 'phase 2/phase 3', 'phase 3', 'phase 4']
 
+# MC dropout, or one of its sampling-free approximations (app.models.uncertainty)
+UNCERTAINTY_MODES = ("mc", "moments", "masks")
+
+# (preprocess_trial key, embedder method) per model tower, in tower order
+SCENARIO_FIELDS = (
+    ("sponsor", "encode_sponsors"),
+    ("diseases", "encode_diseases"),
+    ("inclusion_criteria", "encode_text_fields"),
+    ("exclusion_criteria", "encode_text_fields"),
+    ("description", "encode_text_fields"),
+)
+
+@dataclass
+class AdaptiveSampling:
+    """
+    Early stopping for MC dropout: a trial stops sampling once the standard
+    error of its mean probability is <= sem_tol and the standard error of its
+    std estimate (std / sqrt(2(n - 1))) is <= std_tol. n_samples stays the
+    hard cap.
+    """
+    sem_tol: float = 1e-3
+    std_tol: float = 1e-3
+    block_size: int = 64
+    min_samples: int = 64
+
+
 class TrialPredictor:
-    def __init__(self, model_path: str, device=None):
+    def __init__(self, model_path: str, device=None, mc_chunk_size: int = 1024, embedding_cache=None,
+                 embedder=None, on_progress=None, embed_backend="fp32", optimize_model: bool = False,
+                 load_embedder: bool = True):
         self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
         print(f"[TrialPredictor] Using device: {self.device}")
 
+        # on_progress(component, state) reports model load state, e.g. to /readyz
+        report = on_progress or (lambda component, state: None)
+
         # Load model
+        report("weights", "loading")
         self.model = MultiInputNN(sponsor_dim=384, disease_dim=768, text_dim=768, num_features=len(phase_labels))
-        self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+        # Memory-mapped, so processes serving the same file share its pages
+        load_weights(self.model, model_path, self.device)
+        self.weights_checksum = self._file_checksum(model_path)
 
         self.model.to(self.device)
         self.model.eval()
+        if optimize_model:
+            self.model = self._optimized(self.model)
+        # self.model stays in eval mode; MC dropout runs on mc_model, which
+        # shares its weights with dropout always on, so concurrent callers
+        # never switch dropout under each other
+        self.mc_model = self._mc_twin(self.model)
+        report("weights", "ready")
+
+        # Max rows per batched MC dropout forward pass (bounds peak memory)
+        self.mc_chunk_size = mc_chunk_size
+        self._fast_uncertainty = None
+
+        # Embedder (a ParallelEmbedder or other TrialEmbedder may be passed in); scoring
+        # precomputed embeddings (predict_embeddings) needs none
+        self.embedder = embedder
+        if embedder is None and load_embedder:
+            self.embedder = TrialEmbedder(device=self.device, cache=embedding_cache, on_progress=on_progress,
+                                          backend=embed_backend)
+
+    @staticmethod
+    def _optimized(model: MultiInputNN):
+        """
+        BatchNorm-folded, tower-fused copy of the model, checked against it
+        on random inputs before it replaces the reference.
+        """
+        from app.models.optimized import check_equivalence, optimize_model
+
+        optimized = optimize_model(model)
+        diff = check_equivalence(model, optimized, batch_size=16, n_samples=0)["max_abs_logit_diff"]
+        if diff > 1e-4:
+            raise RuntimeError(f"Optimized model differs from the loaded weights (max logit diff {diff:.3g})")
+        print(f"[TrialPredictor] Using optimized model (max logit diff {diff:.2g})")
+        return optimized
+
+    @staticmethod
+    def _mc_twin(model):
+        """
+        Copy of model sharing its parameters and buffers, with dropout on.
+        """
+        shared = {id(t): t for t in itertools.chain(model.parameters(), model.buffers())}
+        twin = copy.deepcopy(model, shared)
+        twin.enable_mc_dropout()
+        return twin
 
-        # Embedder
-        self.embedder = TrialEmbedder(device=self.device)
+    @staticmethod
+    def _file_checksum(path: str) -> str:
+        """
+        SHA-256 of the weights file, used to invalidate cached predictions.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()[:16]
 
     def _encode_phase(self, phase: str) -> np.ndarray:
         """
@@ -38,40 +132,55 @@ class TrialPredictor:
             pass  # all zeros if unknown phase
         return one_hot
 
-    def predict(self, trial_dict: dict) -> dict:
+    def prepare_inputs(self, trial_dicts: list) -> tuple:
         """
-        Predict success for a single preprocessed trial.
+        Embed a batch of preprocessed trials and build the six model input tensors.
         Args:
-            trial_dict: output of preprocess_trial()
+            trial_dicts: list of preprocess_trial() outputs
         Returns:
-            Dictionary with predicted probability and label
+            (sponsor, disease, inclusion, exclusion, summary, phase) tensors, each [B, D]
         """
-        # 1. Embeddings
-        sponsor_emb = self.embedder.encode_sponsors([trial_dict['sponsor']])
-        disease_emb = self.embedder.encode_diseases([trial_dict['diseases']])
-        incl_emb = self.embedder.encode_text_fields([trial_dict['inclusion_criteria']])
-        excl_emb = self.embedder.encode_text_fields([trial_dict['exclusion_criteria']])
-        summary_emb = self.embedder.encode_text_fields([trial_dict['description']])
+        # 1. Embeddings, one multi-row batch per field
+        with span("embed", items=len(trial_dicts)):
+            emb = self.embedder.encode_trials(trial_dicts)
 
-        # 2. One-hot numerical features (only phase)
-        phase_oh = self._encode_phase(trial_dict['phase'])
-        phase_tensor = torch.tensor(np.array(phase_oh, ndmin=2), dtype=torch.float32)
+        return self.input_tensors(emb, [t['phase'] for t in trial_dicts])
 
+    def input_tensors(self, embeddings: dict, phases: list) -> tuple:
+        """
+        Build the six model input tensors from per-field embeddings and phases.
+        Args:
+            embeddings: encode_trials() output, or FeatureStore rows (float16 or float32)
+            phases: preprocessed phase per trial
+        Returns:
+            (sponsor, disease, inclusion, exclusion, summary, phase) tensors, each [B, D]
+        """
+        # One-hot numerical features (only phase)
+        phase_oh = np.stack([self._encode_phase(phase) for phase in phases])
 
-        # 3. Move to device
-        sponsor_tensor = torch.tensor(sponsor_emb, dtype=torch.float32).to(self.device)
-        disease_tensor = torch.tensor(disease_emb, dtype=torch.float32).to(self.device)
-        incl_tensor = torch.tensor(incl_emb, dtype=torch.float32).to(self.device)
-        excl_tensor = torch.tensor(excl_emb, dtype=torch.float32).to(self.device)
-        summary_tensor = torch.tensor(summary_emb, dtype=torch.float32).to(self.device)
-        phase_tensor = torch.from_numpy(np.array(phase_oh, dtype=np.float32)).unsqueeze(0).to(self.device)
+        fields = ('sponsor', 'disease', 'inclusion', 'exclusion', 'summary')
+        tensors = [self._as_tensor(embeddings[f]) for f in fields]
+        tensors.append(torch.from_numpy(phase_oh).to(self.device))
+        return tuple(tensors)
 
+    def _as_tensor(self, rows) -> torch.Tensor:
+        rows = np.asarray(rows, dtype=np.float32)
+        if not rows.flags.writeable:
+            rows = rows.copy()  # read-only memory map; torch needs a writable buffer
+        return torch.from_numpy(rows).to(self.device)
 
-        # 4. Prediction
-        self.model.eval()
+    def predict(self, trial_dict: dict) -> dict:
+        """
+        Predict success for a single preprocessed trial.
+        Args:
+            trial_dict: output of preprocess_trial()
+        Returns:
+            Dictionary with predicted probability and label
+        """
+        inputs = self.prepare_inputs([trial_dict])
 
         with torch.no_grad():
-            output = self.model(sponsor_tensor, disease_tensor, incl_tensor, excl_tensor, summary_tensor, phase_tensor)
+            output = self.model(*inputs)
             prob = torch.sigmoid(output).item()
             label = int(prob >= 0.5)
 
@@ -80,50 +189,229 @@ class TrialPredictor:
             "label": label
         }
     
-    def predict_with_uncertainty(self, trial_dict: dict, n_samples: int = 20) -> dict:
-        # 1. Encode features once
-        sponsor_emb = self.embedder.encode_sponsors([trial_dict['sponsor']])
-        disease_emb = self.embedder.encode_diseases([trial_dict['diseases']])
-        incl_emb = self.embedder.encode_text_fields([trial_dict['inclusion_criteria']])
-        excl_emb = self.embedder.encode_text_fields([trial_dict['exclusion_criteria']])
-        summary_emb = self.embedder.encode_text_fields([trial_dict['description']])
-        phase_oh = self._encode_phase(trial_dict['phase'])
-        phase_tensor = torch.from_numpy(np.array(phase_oh, dtype=np.float32)).unsqueeze(0).to(self.device)
-
-
-        # Move to device
-        sponsor_tensor = torch.tensor(sponsor_emb, dtype=torch.float32).to(self.device)
-        disease_tensor = torch.tensor(disease_emb, dtype=torch.float32).to(self.device)
-        incl_tensor = torch.tensor(incl_emb, dtype=torch.float32).to(self.device)
-        excl_tensor = torch.tensor(excl_emb, dtype=torch.float32).to(self.device)
-        summary_tensor = torch.tensor(summary_emb, dtype=torch.float32).to(self.device)
-
-       # Deterministic prediction
-        self.model.eval()
-        with torch.no_grad():
-            det_output = self.model(sponsor_tensor, disease_tensor, incl_tensor, excl_tensor, summary_tensor, phase_tensor)
-            deterministic_prob = torch.sigmoid(det_output).item()
+    def predict_with_uncertainty(self, trial_dict: dict, n_samples: int = 20, chunk_size: int = None,
+                                 adaptive: Optional[AdaptiveSampling] = None, uncertainty_mode: str = "mc") -> dict:
+        return self.predict_batch([trial_dict], n_samples=n_samples, chunk_size=chunk_size, adaptive=adaptive,
+                                  uncertainty_mode=uncertainty_mode)[0]
 
+    def predict_batch(self, trial_dicts: list, n_samples: int = 20, chunk_size: int = None,
+                      adaptive: Optional[AdaptiveSampling] = None, uncertainty_mode: str = "mc") -> list:
+        """
+        Predict success with MC dropout uncertainty for a batch of trials.
+        Embeddings, the deterministic forward and the MC sampling all run
+        batched over the whole list.
+        Args:
+            trial_dicts: list of preprocess_trial() outputs
+            n_samples: MC samples per trial (the cap when adaptive is set)
+            adaptive: stop sampling each trial once its estimates converge
+            uncertainty_mode: "mc" (MC dropout), or a sampling-free
+                approximation: "moments" or "masks" (see app.models.uncertainty)
+        Returns:
+            List of result dictionaries, in input order
+        """
+        if not trial_dicts:
+            return []
+        return self.predict_inputs(self.prepare_inputs(trial_dicts), n_samples=n_samples, chunk_size=chunk_size,
+                                   adaptive=adaptive, uncertainty_mode=uncertainty_mode)
 
-        # Enable MC dropout
-        self.model.enable_mc_dropout()
-        preds = []
-        with torch.no_grad():
-            for _ in range(n_samples):
-                out = self.model(sponsor_tensor, disease_tensor, incl_tensor, excl_tensor, summary_tensor, phase_tensor)
-                preds.append(torch.sigmoid(out).item())
+    def predict_embeddings(self, embeddings: dict, phases: list, n_samples: int = 20, chunk_size: int = None,
+                           adaptive: Optional[AdaptiveSampling] = None, uncertainty_mode: str = "mc") -> list:
+        """
+        predict_batch() for trials whose embeddings are already computed, e.g.
+        batches read from a FeatureStore. The encoders are not used.
+        """
+        if not len(phases):
+            return []
+        return self.predict_inputs(self.input_tensors(embeddings, phases), n_samples=n_samples,
+                                   chunk_size=chunk_size, adaptive=adaptive, uncertainty_mode=uncertainty_mode)
+
+    def predict_inputs(self, inputs: tuple, n_samples: int = 20, chunk_size: int = None,
+                       adaptive: Optional[AdaptiveSampling] = None, uncertainty_mode: str = "mc") -> list:
+        """
+        Deterministic forward plus MC dropout (or its uncertainty_mode
+        approximation) over prepared input tensors.
+        Returns:
+            List of result dictionaries, one per input row
+        """
+        if uncertainty_mode not in UNCERTAINTY_MODES:
+            raise ValueError(f"Unknown uncertainty_mode {uncertainty_mode!r}; expected one of {UNCERTAINTY_MODES}")
+        batch_size = inputs[0].shape[0]
 
-        preds_np = np.array(preds)
-        prob_mean = preds_np.mean()
-        prob_std = preds_np.std()
-        label = int(prob_mean >= 0.5)
+        # Deterministic prediction
+        with span("forward", items=batch_size), torch.no_grad():
+            deterministic = torch.sigmoid(self.model(*inputs)).view(-1).cpu().numpy()
 
-        return {
-            "probability": round(prob_mean, 4),
-            "uncertainty": round(prob_std, 4),
-            "label": label,
-            "deterministic": round(deterministic_prob, 4)
-        }
+        if uncertainty_mode == "moments":
+            with span("moments", items=batch_size):
+                mean, std = self.fast_uncertainty.moments(inputs)
+            return [{
+                "probability": round(float(m), 4),
+                "uncertainty": round(float(sd), 4),
+                "label": int(m >= 0.5),
+                "deterministic": round(float(det_prob), 4),
+                "n_samples_used": 0
+            } for det_prob, m, sd in zip(deterministic, mean.tolist(), std.tolist())]
+        if uncertainty_mode == "masks":
+            with span("fixed_masks", items=batch_size):
+                samples = self.fast_uncertainty.masked_samples(inputs).cpu().numpy().astype(np.float64)
+            return self._summarize(deterministic, samples)
+
+        # MC dropout: all samples drawn in a few batched forward passes
+        with span("mc_sample", items=batch_size):
+            if adaptive is not None:
+                preds_np = self.mc_sample_adaptive(inputs, n_samples, adaptive, chunk_size=chunk_size)
+            else:
+                preds_np = self.mc_sample(inputs, n_samples, chunk_size=chunk_size).astype(np.float64)
+
+        return self._summarize(deterministic, preds_np)
+
+    @property
+    def fast_uncertainty(self) -> FastUncertainty:
+        """
+        Moment propagation and fixed-mask sampling over the folded model, built on first use.
+        """
+        if self._fast_uncertainty is None:
+            from app.models.optimized import OptimizedMultiInputNN, optimize_model
+
+            model = self.model if isinstance(self.model, OptimizedMultiInputNN) else optimize_model(self.model)
+            self._fast_uncertainty = FastUncertainty(model)
+        return self._fast_uncertainty
+
+    @staticmethod
+    def _summarize(deterministic, samples) -> list:
+        results = []
+        for det_prob, preds in zip(deterministic, samples):
+            prob_mean = float(preds.mean())
+            prob_std = float(preds.std())
+            results.append({
+                "probability": round(prob_mean, 4),
+                "uncertainty": round(prob_std, 4),
+                "label": int(prob_mean >= 0.5),
+                "deterministic": round(float(det_prob), 4),
+                "n_samples_used": len(preds)
+            })
+        return results
+
+    def predict_scenarios(self, base: dict, variants: list, n_samples: int = 20, chunk_size: int = None) -> list:
+        """
+        Score a trial and what-if variants of it in one pass, recomputing only
+        what each variant changes.
+
+        The base trial is embedded and run through all five towers once.
+        A variant gets fresh embeddings and tower outputs only for the fields
+        that differ from the base (a phase change touches no tower at all);
+        every other tower output is shared. Fusion and the head, which are
+        small, then run over all variants at once. In MC dropout the shared
+        tower samples (and their dropout masks) are reused across variants,
+        so differences between variants carry less sampling noise than
+        separate predictions would.
+        Args:
+            base: preprocess_trial() output
+            variants: preprocess_trial()-shaped dicts, e.g. apply_overrides(base, ...)
+            n_samples: MC samples per trial
+        Returns:
+            List of result dictionaries: the base first, then one per variant
+        """
+        trials = [base] + list(variants)
+        n_rows = len(trials)
+        with span("embed", items=n_rows):
+            emb = self.embedder.encode_trials([base])
+            # (tower index, variant rows whose input differs from the base, their embeddings)
+            changed = []
+            for index, (key, encode) in enumerate(SCENARIO_FIELDS):
+                rows = [i for i in range(1, n_rows) if trials[i][key] != base[key]]
+                if rows:
+                    x = getattr(self.embedder, encode)([trials[i][key] for i in rows])
+                    changed.append((index, torch.as_tensor(rows, device=self.device), self._as_tensor(x)))
+        base_inputs = self.input_tensors(emb, [base["phase"]])
+        phase_oh = torch.from_numpy(np.stack([self._encode_phase(t["phase"]) for t in trials])).to(self.device)
+
+        def modalities(model, reps):
+            # [n_rows, reps, 5, D]: the base towers everywhere, changed towers replaced
+            shared = model.towers(*base_inputs[:5], reps=reps)
+            stack = shared.unsqueeze(0).expand(n_rows, *shared.shape).clone()
+            for index, rows, x in changed:
+                stack[rows, :, index] = model.tower(index, x, reps=reps).view(len(rows), reps, -1)
+            return stack
+
+        with span("forward", items=n_rows), torch.no_grad():
+            logits = self.model.head(modalities(self.model, 1)[:, 0], phase_oh)
+            deterministic = torch.sigmoid(logits).view(-1).cpu().numpy()
+
+        samples_per_chunk = max(1, (chunk_size or self.mc_chunk_size) // n_rows)
+        chunks = []
+        with span("mc_sample", items=n_rows), torch.no_grad():
+            for start in range(0, n_samples, samples_per_chunk):
+                reps = min(samples_per_chunk, n_samples - start)
+                stack = modalities(self.mc_model, reps)
+                logits = self.mc_model.head(stack.reshape(n_rows * reps, *stack.shape[2:]),
+                                            phase_oh.repeat_interleave(reps, dim=0))
+                chunks.append(torch.sigmoid(logits).view(n_rows, reps).cpu())
+        samples = torch.cat(chunks, dim=1).numpy().astype(np.float64) if chunks else np.empty((n_rows, 0))
+        return self._summarize(deterministic, samples)
+
+    def mc_sample_adaptive(self, inputs, max_samples: int, stopping: AdaptiveSampling,
+                           chunk_size: int = None) -> list:
+        """
+        Draw MC dropout samples in blocks, re-running only the trials whose
+        estimates have not converged yet (see AdaptiveSampling).
+        Returns:
+            List of float64 sample arrays, one per trial, of varying length
+        """
+        batch_size = inputs[0].shape[0]
+        samples = [[] for _ in range(batch_size)]
+        active = np.arange(batch_size)
+        drawn = 0
+        while active.size and drawn < max_samples:
+            reps = min(stopping.block_size, max_samples - drawn)
+            index = torch.as_tensor(active, device=inputs[0].device)
+            block = self.mc_sample(tuple(t.index_select(0, index) for t in inputs), reps, chunk_size=chunk_size)
+            for row, trial in zip(block.astype(np.float64), active):
+                samples[trial].append(row)
+            drawn += reps
+            if drawn < stopping.min_samples or drawn < 2:
+                continue
+
+            std = np.array([np.concatenate(samples[t]).std(ddof=1) for t in active])
+            converged = (std / np.sqrt(drawn) <= stopping.sem_tol) & \
+                        (std / np.sqrt(2 * (drawn - 1)) <= stopping.std_tol)
+            active = active[~converged]
+        return [np.concatenate(s) if s else np.empty(0) for s in samples]
+
+    def mc_sample(self, inputs, n_samples: int, chunk_size: int = None) -> np.ndarray:
+        """
+        Draw MC dropout samples for a batch of trials.
+
+        Every trial row is replicated along the batch dimension so that each
+        replica gets its own dropout mask; BatchNorm runs on running stats in
+        eval mode, so a replicated row is equivalent to a separate forward pass.
+        Args:
+            inputs: tuple of the six model input tensors, each [B, D]
+            n_samples: number of dropout samples per trial
+            chunk_size: max rows per forward pass (defaults to self.mc_chunk_size)
+        Returns:
+            np.ndarray of sigmoid probabilities with shape [B, n_samples]
+        """
+        chunk_size = chunk_size or self.mc_chunk_size
+        batch_size = inputs[0].shape[0]
+        samples_per_chunk = max(1, chunk_size // batch_size)
+        # The optimized model replicates after its dropout-free prefix instead
+        forward_repeated = getattr(self.mc_model, "forward_repeated", None)
+
+        chunks = []
+        with torch.no_grad():
+            for start in range(0, n_samples, samples_per_chunk):
+                reps = min(samples_per_chunk, n_samples - start)
+                if forward_repeated is not None:
+                    logits = forward_repeated(inputs, reps)
+                else:
+                    logits = self.mc_model(*[t.repeat_interleave(reps, dim=0) for t in inputs])
+                out = torch.sigmoid(logits).view(batch_size, reps)
+                chunks.append(out.cpu())
+
+        if not chunks:
+            return np.empty((batch_size, 0), dtype=np.float32)
+        return torch.cat(chunks, dim=1).numpy()
     
 if __name__ == "__main__":
     from app.core.parsing import parse_trial_json
@@ -1,5 +1,12 @@
 import re
-from typing import Dict, Any
+from typing import Any, Dict, List
+
+_MULTI_SPACE = re.compile(r'\s{2,}')
+# Whitespace other than ' ' (str.split and \s agree on what whitespace is)
+_OTHER_SPACE = re.compile(r'[^\S ]')
+_ASCII_OTHER_SPACE = ('\t', '\n', '\r', '\x0b', '\x0c', '\x1c', '\x1d', '\x1e', '\x1f')
+
+TRIAL_COLUMNS = ("sponsor", "description", "inclusion_criteria", "exclusion_criteria", "diseases", "phase")
 
 def normalize_phase(phase_raw: str) -> str:
     """
@@ -20,6 +27,19 @@ def normalize_phase(phase_raw: str) -> str:
     key = phase_raw.replace(" ", "").replace("-", "").lower()
     return mapping.get(key, phase_raw.lower())
 
+def _collapse_whitespace(text: str) -> str:
+    """
+    Same as _MULTI_SPACE.sub(' ', text).strip(). When ' ' is the only
+    whitespace in text, split/join gives that result without the regex.
+    """
+    if text.isascii():
+        plain = not any(c in text for c in _ASCII_OTHER_SPACE)
+    else:
+        plain = _OTHER_SPACE.search(text) is None
+    if plain:
+        return ' '.join(text.split())
+    return _MULTI_SPACE.sub(' ', text).strip()
+
 def clean_criteria(text: str) -> str:
     """
     Cleans and normalizes eligibility criteria text.
@@ -29,8 +49,7 @@ def clean_criteria(text: str) -> str:
     text = text.replace('\r', '').replace('\n', ' ').replace(':', ' ')
     for w in ['Inclusion', 'inclusion', 'INCLUSION', 'Criteria', 'criteria', 'CRITERIA']:
         text = text.replace(w, '')
-    text = re.sub(r'\s{2,}', ' ', text)
-    return text.strip()
+    return _collapse_whitespace(text)
 
 def split_criteria(text: str) -> (str, str):
     """
@@ -50,8 +69,7 @@ def clean_and_join_diseases(diseases) -> str:
     if not diseases:
         return ''
     cleaned = [d.replace('[', '').replace(']', '').replace("'", '').strip() for d in diseases]
-    cleaned = [re.sub(r'\s{2,}', ' ', d) for d in cleaned if d]
-    return ', '.join(cleaned)
+    return ', '.join([_MULTI_SPACE.sub(' ', d) for d in cleaned if d])
 
 def preprocess_trial(
     parsed_trial: Dict[str, Any], 
@@ -84,6 +102,83 @@ def preprocess_trial(
         "phase": phase_norm
     }
 
+def apply_overrides(trial: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A copy of a preprocess_trial() output with some fields replaced, each
+    override normalized the way preprocess_trial normalizes that field.
+    Args:
+        trial (dict): Output from preprocess_trial
+        overrides (dict): TRIAL_COLUMNS -> string (None for empty); diseases
+            may also be a list of strings
+    Returns:
+        dict: ready-to-infer fields
+    Raises:
+        ValueError: on an unknown field or a value of the wrong type
+    """
+    unknown = sorted(set(overrides) - set(TRIAL_COLUMNS))
+    if unknown:
+        raise ValueError(f"Unknown trial fields {unknown}; expected some of {list(TRIAL_COLUMNS)}")
+    out = dict(trial)
+    for key, value in overrides.items():
+        if value is None:
+            value = ""
+        items = value if key == "diseases" and isinstance(value, list) else [value]
+        if not all(isinstance(item, str) for item in items):
+            expected = "a string or a list of strings" if key == "diseases" else "a string"
+            raise ValueError(f"Override {key!r} must be {expected}, got {value!r}")
+        if key == "phase":
+            value = normalize_phase(value)
+        elif key == "diseases":
+            value = clean_and_join_diseases(value if isinstance(value, list) else [value])
+        elif key in ("inclusion_criteria", "exclusion_criteria"):
+            value = clean_criteria(value)
+        else:
+            value = value.strip()
+        out[key] = value
+    return out
+
+def preprocess_trials(parsed: Dict[str, List[Any]]) -> Dict[str, List[str]]:
+    """
+    Column-oriented preprocess_trial: same output values, one list per field.
+    Phases repeat heavily across a registry, so each distinct value is
+    normalized once.
+    Args:
+        parsed (dict): Output from parse_trials
+    Returns:
+        dict of TRIAL_COLUMNS -> list with one string per trial
+    """
+    n = len(parsed["sponsor"])
+    phases = {}
+    phase_norm = []
+    for raw in parsed.get("phase") or [""] * n:
+        norm = phases.get(raw)
+        if norm is None:
+            norm = phases[raw] = normalize_phase(raw)
+        phase_norm.append(norm)
+
+    inclusion, exclusion = [], []
+    for text in parsed.get("eligibility") or [""] * n:
+        inc, exc = split_criteria(clean_criteria(text))
+        inclusion.append(inc)
+        exclusion.append(exc)
+
+    return {
+        "sponsor": list(parsed["sponsor"]),
+        "description": [d.strip() for d in parsed.get("brief_summary") or [""] * n],
+        "inclusion_criteria": inclusion,
+        "exclusion_criteria": exclusion,
+        "diseases": [clean_and_join_diseases(d) for d in parsed.get("diseases") or [[]] * n],
+        "phase": phase_norm,
+    }
+
+
+def trial_rows(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Rows (preprocess_trial dicts) from preprocess_trials columns, for the predictor.
+    """
+    return [dict(zip(TRIAL_COLUMNS, values)) for values in zip(*(columns[name] for name in TRIAL_COLUMNS))]
+
+
 # Example usage (requires correct import paths and supporting code):
 if __name__ == "__main__":
     from app.core.parsing import parse_trial_json
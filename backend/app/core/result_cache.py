@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class CachedPrediction:
+    nctid: str
+    version: str
+    model_checksum: str
+    result: dict
+    stored_at: float
+
+
+class PredictionCache:
+    """
+    LRU cache of /predict responses keyed by NCTID.
+
+    An entry is only valid for the study version (ClinicalTrials.gov
+    lastUpdatePostDate) and model weights checksum it was computed with.
+    Entries older than the TTL are stale: the caller revalidates them with a
+    cheap version lookup and either refreshes them or recomputes. If the
+    version lookup itself fails (e.g. the registry is down), the stale entry
+    is served as is, and left stale, rather than failing the request.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 900.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, CachedPrediction]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.revalidation_errors = 0
+
+    def get(self, nctid: str, model_checksum: str) -> Optional[CachedPrediction]:
+        """
+        Returns the entry for nctid, or None if absent or computed with other weights.
+        """
+        with self._lock:
+            entry = self._entries.get(nctid)
+            if entry is None or entry.model_checksum != model_checksum:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(nctid)
+            return entry
+
+    def is_fresh(self, entry: CachedPrediction) -> bool:
+        return self._clock() - entry.stored_at < self.ttl
+
+    def lookup(self, nctid: str, model_checksum: str, fetch_version) -> Optional[dict]:
+        """
+        Returns a cached result if it is still valid, revalidating stale entries
+        through fetch_version(nctid). Returns None when the caller must recompute.
+        """
+        entry = self.get(nctid, model_checksum)
+        if entry is None:
+            return None
+        if self.is_fresh(entry):
+            return self._hit(entry)
+        try:
+            current_version = fetch_version(nctid)
+        except Exception as e:
+            return self._unverified(entry, e)
+        return self._revalidate(entry, current_version)
+
+    async def alookup(self, nctid: str, model_checksum: str, fetch_version) -> Optional[dict]:
+        """
+        Same as lookup, for an async fetch_version coroutine function.
+        """
+        entry = self.get(nctid, model_checksum)
+        if entry is None:
+            return None
+        if self.is_fresh(entry):
+            return self._hit(entry)
+        try:
+            current_version = await fetch_version(nctid)
+        except Exception as e:
+            return self._unverified(entry, e)
+        return self._revalidate(entry, current_version)
+
+    def fresh(self, nctid: str, model_checksum: str) -> bool:
+        """
+        Whether nctid has an entry within the TTL, e.g. to tell a revalidated
+        lookup result from one served unverified.
+        """
+        with self._lock:
+            entry = self._entries.get(nctid)
+        return entry is not None and entry.model_checksum == model_checksum and self.is_fresh(entry)
+
+    def stale(self, nctid: str, model_checksum: str) -> Optional[dict]:
+        """
+        Returns the entry's result whether or not it is past the TTL, without
+        revalidating it; for serving under load, when any answer beats none.
+        """
+        with self._lock:
+            entry = self._entries.get(nctid)
+            if entry is None or entry.model_checksum != model_checksum:
+                return None
+            self.stale_hits += 1
+            return entry.result
+
+    def _hit(self, entry: CachedPrediction) -> dict:
+        with self._lock:
+            self.hits += 1
+        return entry.result
+
+    def _unverified(self, entry: CachedPrediction, error: Exception) -> dict:
+        # stored_at is left alone, so the next lookup tries to revalidate again
+        print(f"[PredictionCache] Could not revalidate {entry.nctid}; serving the stale result: {error}")
+        with self._lock:
+            self.revalidation_errors += 1
+            self.stale_hits += 1
+        return entry.result
+
+    def _revalidate(self, entry: CachedPrediction, current_version: str) -> Optional[dict]:
+        with self._lock:
+            if current_version == entry.version:
+                entry.stored_at = self._clock()
+                self.revalidations += 1
+                return entry.result
+            self._entries.pop(entry.nctid, None)
+            self.misses += 1
+        return None
+
+    def put(self, nctid: str, version: str, model_checksum: str, result: dict):
+        with self._lock:
+            self._entries[nctid] = CachedPrediction(nctid, version, model_checksum, result, self._clock())
+            self._entries.move_to_end(nctid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "revalidation_errors": self.revalidation_errors,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,344 @@
+"""
+Persisted nearest-neighbour index over trial embeddings.
+
+An index directory holds one row per trial:
+
+    meta.json     dim, count, fields and (optionally) the IVF-PQ parameters
+    vectors.f32   raw float32 matrix [count, dim], read through np.memmap
+    ids.txt       one NCTID per line, in row order
+    records.bin   stored predictions (RECORD_DTYPE), read through np.memmap
+
+FlatIndex searches it exactly with chunked matrix products. IVFPQIndex adds
+an inverted-file coarse quantizer with product-quantized residuals (the
+`ivf_*.npy` / `pq_*.npy` files): queries scan only the nprobe closest lists
+using the compact codes, then the best candidates are re-scored exactly
+against the memory-mapped vectors.
+"""
+import json
+import math
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Embedding fields concatenated into a trial vector
+INDEX_FIELDS = ("summary", "disease", "inclusion", "exclusion")
+
+# Stored prediction per row
+RECORD_DTYPE = np.dtype([
+    ("probability", "<f4"),
+    ("uncertainty", "<f4"),
+    ("deterministic", "<f4"),
+    ("label", "<i1"),
+    ("phase", "<U16"),
+])
+
+
+def trial_vectors(embeddings: Dict[str, np.ndarray], fields=INDEX_FIELDS) -> np.ndarray:
+    """
+    Build unit-norm trial vectors from TrialEmbedder.encode_trials() output.
+    Each field is L2-normalized before concatenation so every field carries
+    equal weight in the inner product.
+    Returns:
+        np.ndarray of shape [B, sum of field dims], float32
+    """
+    parts = []
+    for field in fields:
+        x = np.asarray(embeddings[field], dtype=np.float32)
+        parts.append(x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12))
+    return np.hstack(parts) / np.float32(math.sqrt(len(fields)))
+
+
+class IndexWriter:
+    """
+    Streams trial vectors and predictions into a new index directory.
+    """
+
+    def __init__(self, path: str, fields=INDEX_FIELDS):
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name in ("meta.json", "vectors.f32", "ids.txt", "records.bin") or name.startswith(("ivf_", "pq_")):
+                os.remove(os.path.join(path, name))
+        self.path = path
+        self.fields = list(fields)
+        self.dim = None
+        self.count = 0
+        self._vectors = open(os.path.join(path, "vectors.f32"), "ab")
+        self._ids = open(os.path.join(path, "ids.txt"), "a", encoding="utf-8")
+        self._records = open(os.path.join(path, "records.bin"), "ab")
+
+    def append(self, nctids: List[str], vectors: np.ndarray, records: List[dict]):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        rows = np.zeros(len(records), dtype=RECORD_DTYPE)
+        for row, record in zip(rows, records):
+            for name in RECORD_DTYPE.names:
+                value = record.get(name)
+                row[name] = value if value is not None else ("" if name == "phase" else 0)
+        self._vectors.write(vectors.tobytes())
+        self._ids.write("".join(f"{n}\n" for n in nctids))
+        self._records.write(rows.tobytes())
+        self.count += len(nctids)
+
+    def close(self):
+        for f in (self._vectors, self._ids, self._records):
+            f.close()
+        # meta.json last: an index without it is incomplete
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"dim": self.dim or 0, "count": self.count, "fields": self.fields, "ivfpq": None}, f)
+
+
+class VectorIndex(ABC):
+    """
+    Memory-mapped rows shared by the flat and IVF-PQ indexes. Opening an
+    index maps the files; nothing is read until it is searched.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.dim = self.meta["dim"]
+        count = self.meta["count"]
+        with open(os.path.join(path, "ids.txt"), encoding="utf-8") as f:
+            self.ids = f.read().split()
+        if count:
+            self.vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r",
+                                     shape=(count, self.dim))
+            self.records = np.memmap(os.path.join(path, "records.bin"), dtype=RECORD_DTYPE, mode="r",
+                                     shape=(count,))
+        else:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+        self._rows = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, nctid: str) -> bool:
+        return self.row(nctid) is not None
+
+    def row(self, nctid: str) -> Optional[int]:
+        if self._rows is None:
+            self._rows = {nctid: i for i, nctid in enumerate(self.ids)}
+        return self._rows.get(nctid)
+
+    def vector(self, nctid: str) -> np.ndarray:
+        return np.array(self.vectors[self.row(nctid)])
+
+    @abstractmethod
+    def _search(self, query: np.ndarray, k: int):
+        """
+        (rows, scores) of the k best rows for query, best first.
+        """
+
+    def search(self, query: np.ndarray, k: int = 10, exclude: Optional[str] = None) -> List[dict]:
+        """
+        Top-k rows by inner product with a trial vector.
+        Returns:
+            List of {"nctid", "score", "phase", "probability", ...}, best first
+        """
+        if not len(self):
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        rows, scores = self._search(query, min(k + (exclude is not None), len(self)))
+        results = []
+        for row, score in zip(rows, scores):
+            nctid = self.ids[row]
+            if nctid == exclude:
+                continue
+            record = self.records[row]
+            results.append({
+                "nctid": nctid,
+                "score": round(float(score), 4),
+                "phase": str(record["phase"]),
+                "probability": round(float(record["probability"]), 4),
+                "uncertainty": round(float(record["uncertainty"]), 4),
+                "label": int(record["label"]),
+                "deterministic": round(float(record["deterministic"]), 4),
+            })
+        return results[:k]
+
+    def similar(self, nctid: str, k: int = 10) -> List[dict]:
+        """
+        Neighbours of an indexed trial, excluding the trial itself.
+        """
+        return self.search(self.vector(nctid), k, exclude=nctid)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class FlatIndex(VectorIndex):
+    """
+    Exact search: one matrix product over the whole matrix, in chunks.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = 65536):
+        super().__init__(path)
+        self.chunk_rows = chunk_rows
+
+    def _search(self, query, k):
+        scores = np.concatenate([
+            self.vectors[start:start + self.chunk_rows] @ query
+            for start in range(0, len(self), self.chunk_rows)
+        ])
+        rows = _top_k(scores, k)
+        return rows, scores[rows]
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray, chunk_rows: int = 8192) -> np.ndarray:
+    """
+    Nearest centroid (L2) of every row of x.
+    """
+    half_sq = 0.5 * (centroids * centroids).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk_rows):
+        block = np.asarray(x[start:start + chunk_rows], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T - half_sq, axis=1)
+    return out
+
+
+def _kmeans(x: np.ndarray, k: int, n_iter: int, rng: np.random.Generator) -> np.ndarray:
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters from random points
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+def _default_subspaces(dim: int) -> int:
+    for m in (64, 48, 32, 16, 8, 4, 2):
+        if dim % m == 0 and dim // m >= 4:
+            return m
+    return 1
+
+
+def train_ivfpq(path: str, nlist: Optional[int] = None, m: Optional[int] = None, n_iter: int = 20,
+                train_size: Optional[int] = None, seed: int = 0) -> dict:
+    """
+    Train the IVF-PQ structures for an index directory written by IndexWriter
+    and record them in meta.json.
+    Args:
+        nlist: number of inverted lists (default ~4 * sqrt(count))
+        m: number of PQ subspaces, must divide dim (default up to 64)
+        train_size: rows sampled for k-means (default 40 per list, at least 10k)
+    Returns:
+        The IVF-PQ parameters written to meta.json
+    """
+    index = FlatIndex(path)
+    n, dim = len(index), index.dim
+    if not n:
+        raise ValueError(f"Index at {path} is empty")
+    nlist = min(nlist or max(1, int(4 * math.sqrt(n))), n)
+    m = m or _default_subspaces(dim)
+    if dim % m:
+        raise ValueError(f"PQ subspaces m={m} must divide the vector dimension {dim}")
+    dsub = dim // m
+
+    rng = np.random.default_rng(seed)
+    train_size = min(n, train_size or max(10000, 40 * nlist))
+    sample = np.asarray(index.vectors[np.sort(rng.choice(n, train_size, replace=False))])
+
+    centroids = _kmeans(sample, nlist, n_iter, rng)
+    residuals = sample - centroids[_assign(sample, centroids)]
+    codebooks = np.stack([
+        _kmeans(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]), 256, n_iter, rng)
+        for j in range(m)
+    ])
+
+    # Encode every row: its list, and the PQ code of its residual
+    lists = np.empty(n, dtype=np.int64)
+    codes = np.empty((n, m), dtype=np.uint8)
+    for start in range(0, n, 65536):
+        block = np.asarray(index.vectors[start:start + 65536])
+        assign = _assign(block, centroids)
+        residual = block - centroids[assign]
+        lists[start:start + len(block)] = assign
+        for j in range(m):
+            codes[start:start + len(block), j] = _assign(residual[:, j * dsub:(j + 1) * dsub], codebooks[j])
+
+    # Store codes grouped by list so a probe reads one contiguous slice
+    order = np.argsort(lists, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=len(centroids)))])
+    np.save(os.path.join(path, "ivf_centroids.npy"), centroids.astype(np.float32))
+    np.save(os.path.join(path, "ivf_offsets.npy"), offsets.astype(np.int64))
+    np.save(os.path.join(path, "ivf_rows.npy"), order.astype(np.int64))
+    np.save(os.path.join(path, "pq_codebooks.npy"), codebooks.astype(np.float32))
+    np.save(os.path.join(path, "pq_codes.npy"), codes[order])
+
+    params = {"nlist": int(len(centroids)), "m": m, "ksub": int(codebooks.shape[1])}
+    index.meta["ivfpq"] = params
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(index.meta, f)
+    return params
+
+
+class IVFPQIndex(VectorIndex):
+    """
+    Approximate search: probe the nprobe nearest inverted lists, score their
+    rows with PQ lookup tables, then re-score the top `rerank` exactly.
+    """
+
+    def __init__(self, path: str, nprobe: int = 16, rerank: int = 256):
+        super().__init__(path)
+        if not self.meta.get("ivfpq"):
+            raise ValueError(f"Index at {path} has no IVF-PQ structures; run train_ivfpq first")
+        self.nprobe = nprobe
+        self.rerank = rerank
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.centroids = np.asarray(load("ivf_centroids.npy"))
+        self.offsets = np.asarray(load("ivf_offsets.npy"))
+        self.list_rows = load("ivf_rows.npy")
+        self.codebooks = np.asarray(load("pq_codebooks.npy"))
+        self.codes = load("pq_codes.npy")
+        self._half_sq = 0.5 * (self.centroids * self.centroids).sum(axis=1)
+
+    def _search(self, query, k):
+        m, ksub, dsub = self.codebooks.shape
+        coarse = self.centroids @ query
+        probe = _top_k(coarse - self._half_sq, min(self.nprobe, len(self.centroids)))
+
+        # Inner product with a residual decomposes over subspaces: one [m, ksub] table per query
+        tables = np.einsum("mkd,md->mk", self.codebooks, query.reshape(m, dsub))
+        subspace = np.arange(m)
+        rows, approx = [], []
+        for lst in probe:
+            start, end = self.offsets[lst], self.offsets[lst + 1]
+            if start == end:
+                continue
+            codes = np.asarray(self.codes[start:end])
+            approx.append(coarse[lst] + tables[subspace, codes].sum(axis=1))
+            rows.append(np.asarray(self.list_rows[start:end]))
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, approx = np.concatenate(rows), np.concatenate(approx)
+
+        candidates = np.sort(rows[_top_k(approx, max(k, self.rerank))])
+        exact = np.asarray(self.vectors[candidates]) @ query
+        top = _top_k(exact, k)
+        return candidates[top], exact[top]
+
+
+def load_index(path: str, **kwargs) -> VectorIndex:
+    """
+    Open an index directory, as IVF-PQ if it has been trained, else flat.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        trained = bool(json.load(f).get("ivfpq"))
+    return IVFPQIndex(path, **kwargs) if trained else FlatIndex(path)
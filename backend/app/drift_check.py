@@ -0,0 +1,119 @@
+"""
+Accuracy-drift check for the optimized encoder backends.
+
+    python -m app.drift_check tests/fixtures/studies.jsonl --backend int8
+
+Scores a fixture set of study JSON with the fp32 reference encoders and with
+the candidate backend (same MultiInputNN weights). It compares the per-field
+embeddings (cosine similarity) and the final probabilities, reports timings,
+and exits non-zero when drift exceeds the given tolerances.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import torch
+
+from app.bulk_io import iter_studies, list_study_files
+from app.core.inference_backend import BACKENDS
+from app.core.parsing import parse_trial_json
+from app.core.preprocessing import preprocess_trial
+
+EMBEDDING_FIELDS = ("sponsor", "disease", "inclusion", "exclusion", "summary")
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return (a * b).sum(axis=1)
+
+
+def compare_embeddings(reference: dict, candidate: dict) -> dict:
+    """
+    Per-field cosine similarity between reference and candidate embeddings.
+    """
+    report = {}
+    for field in EMBEDDING_FIELDS:
+        cos = _cosine(np.asarray(reference[field], dtype=np.float64), np.asarray(candidate[field], dtype=np.float64))
+        report[field] = {"min_cosine": round(float(cos.min()), 6), "mean_cosine": round(float(cos.mean()), 6)}
+    return report
+
+
+def compare_probabilities(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    diff = np.abs(np.asarray(reference) - np.asarray(candidate))
+    return {
+        "max_abs_diff": round(float(diff.max()), 6),
+        "mean_abs_diff": round(float(diff.mean()), 6),
+        "label_flips": int(((np.asarray(reference) >= 0.5) != (np.asarray(candidate) >= 0.5)).sum()),
+    }
+
+
+def _score(predictor, trials: list, n_samples: int, seed: int):
+    started = time.perf_counter()
+    embeddings = predictor.embedder.encode_trials(trials)
+    embed_seconds = time.perf_counter() - started
+
+    inputs = predictor.input_tensors(embeddings, [t["phase"] for t in trials])
+    predictor.model.eval()
+    with torch.no_grad():
+        deterministic = torch.sigmoid(predictor.model(*inputs)).view(-1).cpu().numpy()
+    # Same seed for both predictors, so MC drift reflects the encoders only
+    torch.manual_seed(seed)
+    mc_mean = predictor.mc_sample(inputs, n_samples).mean(axis=1)
+    return embeddings, deterministic, mc_mean, embed_seconds
+
+
+def run_drift_check(trials: list, reference, candidate, n_samples: int = 200, seed: int = 0) -> dict:
+    ref_emb, ref_det, ref_mc, ref_seconds = _score(reference, trials, n_samples, seed)
+    cand_emb, cand_det, cand_mc, cand_seconds = _score(candidate, trials, n_samples, seed)
+    return {
+        "trials": len(trials),
+        "embeddings": compare_embeddings(ref_emb, cand_emb),
+        "deterministic": compare_probabilities(ref_det, cand_det),
+        "mc_probability": compare_probabilities(ref_mc, cand_mc),
+        "embed_seconds": {"reference": round(ref_seconds, 4), "candidate": round(cand_seconds, 4)},
+        "speedup": round(ref_seconds / cand_seconds, 2) if cand_seconds else None,
+    }
+
+
+def check_tolerances(report: dict, min_cosine: float, max_prob_drift: float) -> list:
+    """
+    Returns a list of tolerance violations (empty if the backend passes).
+    """
+    failures = []
+    for field, stats in report["embeddings"].items():
+        if stats["min_cosine"] < min_cosine:
+            failures.append(f"{field} embedding min cosine {stats['min_cosine']} < {min_cosine}")
+    for key in ("deterministic", "mc_probability"):
+        if report[key]["max_abs_diff"] > max_prob_drift:
+            failures.append(f"{key} max drift {report[key]['max_abs_diff']} > {max_prob_drift}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare an encoder backend against the fp32 baseline.")
+    parser.add_argument("source", help="Fixture study JSON / JSON Lines file or directory")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "fp32"], required=True)
+    parser.add_argument("--model-path", default="app/models/model_weights.pth")
+    parser.add_argument("--n-samples", type=int, default=200)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--max-prob-drift", type=float, default=0.02)
+    args = parser.parse_args(argv)
+
+    from app.core.predict import TrialPredictor
+
+    trials = [preprocess_trial(parse_trial_json(s)) for _, _, s in iter_studies(list_study_files(args.source))]
+    reference = TrialPredictor(model_path=args.model_path, device="cpu")
+    candidate = TrialPredictor(model_path=args.model_path, device="cpu", embed_backend=args.backend)
+
+    report = run_drift_check(trials, reference, candidate, n_samples=args.n_samples)
+    report["backend"] = args.backend
+    report["failures"] = check_tolerances(report, args.min_cosine, args.max_prob_drift)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
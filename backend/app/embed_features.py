@@ -0,0 +1,81 @@
+"""
+Embed a local ClinicalTrials.gov dump into a feature store (see FeatureStore).
+
+    python -m app.embed_features /data/ctg-studies --output features/ --dtype float16
+
+Studies are read like app.bulk_score (directories or files of study JSON /
+JSON Lines, optionally gzipped), preprocessed and embedded in batches; the
+five field embeddings, phase and study version (lastUpdatePostDate) of each
+trial are appended to the store. Trials already stored at the same version
+are skipped before embedding, so re-running the command resumes an
+interrupted run; a newer version of a stored trial (e.g. from the
+--changed-studies output of app.sync_studies) is embedded again and
+supersedes the old row. Score the store with app.rescore.
+"""
+import argparse
+
+from app.bulk_io import batches, iter_studies, list_study_files, preprocess_batch
+from app.core.feature_store import SHARD_SIZE, FeatureStoreWriter
+from app.services.clinicaltrials_api import study_nctid, study_version
+
+
+def embed_features(source: str, output: str, embedder, batch_size: int = 256, dtype: str = "float16",
+                   shard_size: int = SHARD_SIZE) -> int:
+    """
+    Embeds every study under source that is not in the store at output yet,
+    or only at an older version.
+    Returns:
+        Number of rows added by this run (new trials and updated versions)
+    """
+    writer = FeatureStoreWriter(output, embedder.encoder_info(), dtype=dtype, shard_size=shard_size)
+    if writer.count:
+        print(f"[embed_features] Resuming: {writer.count} trials already stored")
+    added = 0
+    try:
+        for batch in batches(iter_studies(list_study_files(source)), batch_size):
+            nctids, versions, trials = [], [], []
+            studies = [study for _, _, study in batch]
+            for study, trial in zip(studies, preprocess_batch(studies)):
+                nctid = study_nctid(study)
+                if isinstance(trial, Exception):
+                    print(f"[embed_features] Skipping {nctid or 'study'}: {trial}")
+                    continue
+                version = study_version(study)
+                if nctid and not writer.is_current(nctid, version) and nctid not in nctids:
+                    nctids.append(nctid)
+                    versions.append(version)
+                    trials.append(trial)
+            if not trials:
+                continue
+
+            added += writer.append(nctids, embedder.encode_trials(trials), [t["phase"] for t in trials], versions)
+            print(f"[embed_features] {writer.count} rows stored")
+    finally:
+        writer.close()
+    if writer.updated:
+        print(f"[embed_features] {writer.updated} stored trials replaced by a newer study version")
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embed a study dump into a memory-mapped feature store.")
+    parser.add_argument("source", help="Directory or file of study JSON / JSON Lines (optionally .gz)")
+    parser.add_argument("--output", required=True, help="Feature store directory (appended to if it exists)")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float16",
+                        help="Storage dtype of a new store")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Rows per shard of a new store")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--embed-backend", default="fp32")
+    args = parser.parse_args(argv)
+
+    from app.core.generate_embeddings import TrialEmbedder
+
+    embedder = TrialEmbedder(device=args.device, backend=args.embed_backend)
+    added = embed_features(args.source, args.output, embedder, batch_size=args.batch_size, dtype=args.dtype,
+                           shard_size=args.shard_size)
+    print(f"[embed_features] Done: {added} trials added to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,214 @@
+import asyncio
+import json
 import os
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
 from app.core.parsing import parse_trial_json
-from app.core.preprocessing import preprocess_trial
-from app.services.clinicaltrials_api import fetch_nctid_data
-from app.core.predict import TrialPredictor
+from app.core.preprocessing import apply_overrides, preprocess_trial
+from app.services.clinicaltrials_api import study_nctid, study_version
+from app.services.clinicaltrials_async import AsyncClinicalTrialsClient
+from app.services.study_store import StudyStore
+from app.core.embedding_cache import EmbeddingCache
+from app.core.result_cache import PredictionCache
+from app.core.admission import (APPROXIMATE, DETERMINISTIC, FULL, REDUCED, STALE, Admission, AdmissionController,
+                                DeadlineExceeded, Overloaded, parse_deadline, within)
+from app.core.batching import MicroBatcher, predict_isolated
+from app.core.loader import PredictorLoader
+from app.core.jobs import FINISHED, JobRunner, JobStore, UploadTooLarge, parse_upload
+from app.core.vector_index import load_index, trial_vectors
+from app.core.metrics import REGISTRY, ERRORS, MetricsMiddleware, annotate, span
+
+MODEL_PATH = os.getenv("MODEL_PATH", "app/models/model_weights.pth")
+
+# background: load models in a thread after the server binds (default)
+# lazy: load on the first request; eager: load before serving
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+
+# Shared embedding cache (in-process LRU, plus an on-disk tier if a directory is set)
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBED_CACHE_SIZE", "50000")),
+    cache_dir=os.getenv("EMBED_CACHE_DIR") or None,
+)
+
+# Optional multi-process embedding engine (EMBED_WORKERS > 0)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+
+# Encoder inference backend: fp32 (default), int8, compile or onnx
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "fp32")
+
+# Serve the BatchNorm-folded, tower-fused MultiInputNN (MODEL_OPTIMIZED=1)
+MODEL_OPTIMIZED = os.getenv("MODEL_OPTIMIZED", "0") == "1"
+
+# Ensemble of every checkpoint in this directory instead of MODEL_PATH; the
+# directory is re-scanned every ENSEMBLE_REFRESH_SECONDS (or POST /models/refresh)
+ENSEMBLE_DIR = os.getenv("ENSEMBLE_DIR")
+ENSEMBLE_REFRESH_SECONDS = float(os.getenv("ENSEMBLE_REFRESH_SECONDS", "30"))
+
+
+def build_predictor(on_progress):
+    # torch / transformers are imported here, off the server's import path
+    from app.core.predict import TrialPredictor
+
+    embedder = None
+    if EMBED_WORKERS > 0:
+        from app.core.parallel_embeddings import ParallelEmbedder
+        on_progress("embed_workers", "loading")
+        threads = os.getenv("EMBED_THREADS_PER_WORKER")
+        embedder = ParallelEmbedder(workers=EMBED_WORKERS, threads_per_worker=int(threads) if threads else None,
+                                    cache=embedding_cache, backend=EMBED_BACKEND)
+        embedder.start()
+        on_progress("embed_workers", "ready")
+    if ENSEMBLE_DIR:
+        from app.core.ensemble import EnsemblePredictor
+        return EnsemblePredictor(ENSEMBLE_DIR, embedding_cache=embedding_cache, embedder=embedder,
+                                 on_progress=on_progress, embed_backend=EMBED_BACKEND,
+                                 refresh_interval=ENSEMBLE_REFRESH_SECONDS)
+    return TrialPredictor(model_path=MODEL_PATH, embedding_cache=embedding_cache, embedder=embedder,
+                          on_progress=on_progress, embed_backend=EMBED_BACKEND, optimize_model=MODEL_OPTIMIZED)
+
+
+# Loads the predictor off the request path; WARMUP=1 primes it with a dummy batch
+loader = PredictorLoader(build_predictor, warmup=os.getenv("WARMUP", "0") == "1")
+
+
+async def get_predictor():
+    if loader.is_ready():
+        return loader.predictor
+    if STARTUP_MODE == "lazy":
+        try:
+            return await run_in_threadpool(loader.wait)
+        except RuntimeError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    raise HTTPException(status_code=503, detail="Model is loading", headers={"Retry-After": "5"})
+
+
+# Adaptive MC dropout (MC_ADAPTIVE=1): stop sampling a trial once its mean and
+# std estimates converge; the requested n_samples becomes the cap
+MC_ADAPTIVE = os.getenv("MC_ADAPTIVE", "0") == "1"
+
+
+@lru_cache(maxsize=2)
+def mc_adaptive(enabled: bool = MC_ADAPTIVE):
+    if not enabled:
+        return None
+    from app.core.predict import AdaptiveSampling
+    return AdaptiveSampling(
+        sem_tol=float(os.getenv("MC_SEM_TOL", "1e-3")),
+        std_tol=float(os.getenv("MC_STD_TOL", "1e-3")),
+        block_size=int(os.getenv("MC_BLOCK_SIZE", "64")),
+        min_samples=int(os.getenv("MC_MIN_SAMPLES", "64")),
+    )
+
+
+# Optional micro-batching of concurrent /predict requests (MICROBATCH_MAX_WAIT_MS > 0)
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "0"))
+batcher = None
+if MICROBATCH_MAX_WAIT_MS > 0:
+    batcher = MicroBatcher(
+        lambda trials, n_samples: loader.predictor.predict_batch(trials, n_samples=n_samples, adaptive=mc_adaptive()),
+        max_batch_size=int(os.getenv("MICROBATCH_MAX_BATCH", "32")),
+        max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+    )
+
+# Admission control for /predict: requests past ADMISSION_MAX_CONCURRENCY wait
+# in a queue of ADMISSION_MAX_QUEUE, beyond which they get 503 + Retry-After;
+# under pressure, or when a request's deadline (X-Deadline-Ms header, else
+# PREDICT_DEADLINE_MS; 0 disables) is too close, results degrade in steps
+admission = AdmissionController(
+    max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+)
+PREDICT_DEADLINE_MS = float(os.getenv("PREDICT_DEADLINE_MS", "30000"))
+# MC samples at the "reduced" degradation level
+ADMISSION_REDUCED_SAMPLES = int(os.getenv("ADMISSION_REDUCED_SAMPLES", "100"))
+
+# Finished predictions, invalidated by study version and model weights checksum
+result_cache = PredictionCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("RESULT_CACHE_TTL", "900")),
+)
+
+# Local study mirror kept current by app.sync_studies; read before the live API
+STUDY_STORE = os.getenv("STUDY_STORE")
+study_store = StudyStore(STUDY_STORE) if STUDY_STORE else None
+
+# Pooled async ClinicalTrials.gov client shared by all requests
+ct_client = AsyncClinicalTrialsClient(
+    max_concurrency=int(os.getenv("CT_MAX_CONCURRENCY", "10")),
+    timeout=float(os.getenv("CT_TIMEOUT", "10")),
+    max_retries=int(os.getenv("CT_MAX_RETRIES", "3")),
+    retry_after_max=float(os.getenv("CT_RETRY_AFTER_MAX", "120")),
+    store=study_store,
+)
+
+
+# Upper bound on NCTIDs per /predict/batch call
+BATCH_MAX_TRIALS = int(os.getenv("BATCH_MAX_TRIALS", "2000"))
+
+# MC samples behind /predict (and so behind every cached result), and the
+# most any one request may ask for
+PREDICT_N_SAMPLES = 1000
+MC_MAX_SAMPLES = int(os.getenv("MC_MAX_SAMPLES", "10000"))
+
+# uncertainty_mode values accepted by /predict (app.core.predict.UNCERTAINTY_MODES,
+# repeated here to keep torch off the import path): MC dropout, or one of the
+# sampling-free approximations of app.models.uncertainty
+UNCERTAINTY_MODES = ("mc", "moments", "masks")
+
+# Similar-trials index built by app.build_index (memory-mapped, opens instantly)
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR")
+vector_index = load_index(VECTOR_INDEX_DIR, nprobe=int(os.getenv("VECTOR_INDEX_NPROBE", "16"))) \
+    if VECTOR_INDEX_DIR else None
+
+# Upper bound on neighbours per /similar call
+SIMILAR_MAX_K = 100
+
+# Upper bound on what-if variants per /scenarios call
+SCENARIO_MAX_VARIANTS = int(os.getenv("SCENARIO_MAX_VARIANTS", "50"))
+
+# Durable prediction jobs (POST /jobs), persisted in this SQLite file
+JOBS_DB = os.getenv("JOBS_DB")
+job_store = JobStore(JOBS_DB) if JOBS_DB else None
+JOB_MAX_TRIALS = int(os.getenv("JOB_MAX_TRIALS", "50000"))
+# Largest job body accepted, before and after gzip decompression (413 beyond)
+JOB_MAX_UPLOAD_BYTES = int(os.getenv("JOB_MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+
+# Jobs fetch through their own client, bound to the job runner's event loop
+job_ct_client = AsyncClinicalTrialsClient(
+    max_concurrency=int(os.getenv("CT_MAX_CONCURRENCY", "10")),
+    timeout=float(os.getenv("CT_TIMEOUT", "10")),
+    max_retries=int(os.getenv("CT_MAX_RETRIES", "3")),
+    retry_after_max=float(os.getenv("CT_RETRY_AFTER_MAX", "120")),
+    store=study_store,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if STARTUP_MODE == "background":
+        loader.start()
+    elif STARTUP_MODE == "eager":
+        await run_in_threadpool(loader.wait)
+    if job_runner is not None:
+        job_runner.start()
+    yield
+    if job_runner is not None:
+        await run_in_threadpool(job_runner.stop)
+    if batcher is not None:
+        await batcher.stop()
+    await ct_client.aclose()
 
-# Load model once at startup
-predictor = TrialPredictor(model_path="app/models/model_weights.pth")
 
 app = FastAPI(
     title="Lucent",
+    lifespan=lifespan,
     docs_url="/docs",
     redoc_url="/redoc"
 )
@@ -42,14 +239,557 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request metrics and one JSON access log line per request (ACCESS_LOG=0 disables the log)
+app.add_middleware(MetricsMiddleware, access_log=os.getenv("ACCESS_LOG", "1") == "1")
+
+
+def _service_metrics():
+    """
+    Scrape-time view of the caches, batcher, upstream client and loader.
+    """
+    families = []
+    result_stats = result_cache.stats()
+    families.append(("lucent_result_cache_events_total", "counter", "Prediction cache lookups by outcome.", [
+        ({"event": "hit"}, result_stats["hits"]),
+        ({"event": "revalidation"}, result_stats["revalidations"]),
+        ({"event": "miss"}, result_stats["misses"]),
+        ({"event": "stale"}, result_stats["stale_hits"]),
+        ({"event": "revalidation_error"}, result_stats["revalidation_errors"]),
+    ]))
+    embed_stats = embedding_cache.stats()
+    families.append(("lucent_embedding_cache_events_total", "counter", "Embedding cache lookups by outcome.", [
+        ({"event": "hit"}, embed_stats["hits"]),
+        ({"event": "disk_hit"}, embed_stats["disk_hits"]),
+        ({"event": "miss"}, embed_stats["misses"]),
+    ]))
+    families.append(("lucent_cache_entries", "gauge", "Entries held per cache.", [
+        ({"cache": "result"}, result_stats["entries"]),
+        ({"cache": "embedding"}, embed_stats["entries"]),
+    ]))
+    families.append(("lucent_upstream_requests_total", "counter", "ClinicalTrials.gov requests by outcome.", [
+        ({"kind": "sent"}, ct_client.upstream_requests),
+        ({"kind": "coalesced"}, ct_client.coalesced),
+        ({"kind": "local"}, ct_client.local_hits),
+    ]))
+    if job_store is not None:
+        families.append(("lucent_jobs", "gauge", "Prediction jobs by status.",
+                         [({"status": status}, count) for status, count in job_store.counts().items()]))
+    families.append(("lucent_predictor_ready", "gauge", "1 once the models are loaded.",
+                     [({}, int(loader.is_ready()))]))
+    if loader.is_ready() and hasattr(loader.predictor, "members"):
+        families.append(("lucent_ensemble_members", "gauge", "Checkpoints in the served ensemble.",
+                         [({}, len(loader.predictor.members))]))
+    admission_stats = admission.stats()
+    families.append(("lucent_admission_requests", "gauge", "Admitted /predict requests running or queued.", [
+        ({"state": "running"}, admission_stats["running"]),
+        ({"state": "waiting"}, admission_stats["waiting"]),
+    ]))
+    families.append(("lucent_admission_rejected_total", "counter", "/predict requests turned away by outcome.", [
+        ({"reason": "overloaded"}, admission_stats["rejected"]),
+        ({"reason": "deadline"}, admission_stats["expired"]),
+    ]))
+    families.append(("lucent_admission_served_total", "counter", "/predict requests served per degradation level.",
+                     [({"level": name}, count) for name, count in admission_stats["admitted"].items()]))
+    if batcher is not None:
+        stats = batcher.stats()
+        families.append(("lucent_batcher_queue_depth", "gauge", "Requests waiting for a micro-batch.",
+                         [({}, stats["queue_depth"])]))
+        families.append(("lucent_batcher_batches_total", "counter", "Micro-batches scored.",
+                         [({}, stats["batches"])]))
+        families.append(("lucent_batcher_requests_total", "counter", "Requests submitted to the batcher.",
+                         [({}, stats["requests"])]))
+    return families
+
+
+REGISTRY.register_collector(_service_metrics)
+
+# Interactive /predict requests in flight; queued jobs yield to them between batches
+_interactive = {"in_flight": 0}
+
+
+@asynccontextmanager
+async def interactive():
+    _interactive["in_flight"] += 1
+    try:
+        yield
+    finally:
+        _interactive["in_flight"] -= 1
+
+
+def _check_uncertainty_mode(mode: str):
+    if mode not in UNCERTAINTY_MODES:
+        raise HTTPException(status_code=400, detail=f"uncertainty_mode must be one of {', '.join(UNCERTAINTY_MODES)}")
+
+
+def _result_key(predictor, uncertainty_mode: str) -> str:
+    # Results of the approximate modes are cached apart from MC dropout's
+    if uncertainty_mode == "mc":
+        return predictor.weights_checksum
+    return f"{predictor.weights_checksum}:{uncertainty_mode}"
+
+
 @app.get("/predict/{nctid}")
-def predict_trial(nctid: str):
+async def predict_trial(nctid: str, uncertainty_mode: str = "mc", x_deadline_ms: Optional[str] = Header(None)):
+    _check_uncertainty_mode(uncertainty_mode)
+    try:
+        deadline = parse_deadline(x_deadline_ms, PREDICT_DEADLINE_MS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    predictor = await get_predictor()
+    annotate(nctid=nctid)
+    try:
+        async with interactive(), admission.admit(deadline) as admitted:
+            return await _predict_trial(predictor, nctid, uncertainty_mode, admitted)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        ERRORS.inc(stage="deadline")
+        raise HTTPException(status_code=504, detail=str(e))
+
+
+def _degraded(response: dict, admitted: Admission) -> dict:
+    annotate(degradation=admitted.name)
+    return {**response, "degradation": {"level": admitted.level, "name": admitted.name}}
+
+
+async def _predict_trial(predictor, nctid: str, uncertainty_mode: str, admitted: Admission):
+    key = _result_key(predictor, uncertainty_mode)
+    deadline = admitted.deadline
+    level = admitted.level
+    stale = result_cache.stale(nctid, key) if level == STALE else None
+    if stale is not None:
+        annotate(cached=True)
+        admitted.cached = True
+        return _degraded(stale, admitted)
+    # No stale result to serve: the cheapest fresh answer instead
+    admitted.level = level = min(level, DETERMINISTIC)
+    try:
+        with span("cache_lookup"):
+            cached = await within(deadline, result_cache.alookup(nctid, key, ct_client.fetch_version), "cache lookup")
+        if cached is not None:
+            annotate(cached=True)
+            # A result the registry could not revalidate is served as stale
+            admitted.level = FULL if result_cache.fresh(nctid, key) else STALE
+            admitted.cached = True
+            return _degraded(cached, admitted)
+
+        try:
+            with span("fetch"):
+                trial_data = await within(deadline, ct_client.fetch_study(nctid), "fetch")
+        except DeadlineExceeded:
+            # Out of time upstream; an expired result beats none
+            stale = result_cache.stale(nctid, key)
+            if stale is None:
+                raise
+            admitted.level, admitted.cached = STALE, True
+            return _degraded(stale, admitted)
+        with span("parse"):
+            parsed = parse_trial_json(trial_data)
+        with span("preprocess"):
+            prepped = preprocess_trial(parsed)
+        deadline.check("inference")
+
+        # The approximate modes are already cheaper than any MC degradation step
+        if uncertainty_mode != "mc" and level in (REDUCED, APPROXIMATE):
+            admitted.level = level = FULL
+        if level == APPROXIMATE and hasattr(predictor, "members"):
+            # Ensembles have no sampling-free mode
+            admitted.level = level = DETERMINISTIC
+
+        # Model work is CPU-bound; keep it off the event loop
+        if level == DETERMINISTIC:
+            result = await run_in_threadpool(predictor.predict, prepped)
+            result = {"probability": result["probability"], "uncertainty": None, "label": result["label"],
+                      "deterministic": result["probability"], "n_samples_used": 0}
+        elif level == APPROXIMATE or uncertainty_mode != "mc":
+            # Sampling-free modes are a single cheap pass; no need to wait for a micro-batch
+            result = await run_in_threadpool(predictor.predict_with_uncertainty, prepped,
+                                             uncertainty_mode="moments" if level == APPROXIMATE else uncertainty_mode)
+        else:
+            n_samples = PREDICT_N_SAMPLES if level == FULL else min(PREDICT_N_SAMPLES, ADMISSION_REDUCED_SAMPLES)
+            if batcher is not None:
+                result = await batcher.submit(prepped, n_samples=n_samples, deadline=deadline)
+            else:
+                result = await run_in_threadpool(predictor.predict_with_uncertainty, prepped, n_samples=n_samples,
+                                                 adaptive=mc_adaptive())
+        annotate(cached=False, **result)
+        response = {"nctid": nctid, "phase": prepped["phase"] ,**result}
+        # Degraded results are never cached as if they were the requested ones
+        if level == FULL:
+            result_cache.put(nctid, study_version(trial_data), key, response)
+        return _degraded(response, admitted)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        ERRORS.inc(stage="predict")
+        annotate(error=str(e))
+        return {"error": str(e)}
+
+
+class BatchPredictRequest(BaseModel):
+    nctids: List[str]
+    n_samples: int = Field(PREDICT_N_SAMPLES, ge=1, le=MC_MAX_SAMPLES)
+    # None: server default (MC_ADAPTIVE)
+    adaptive: Optional[bool] = None
+    uncertainty_mode: str = "mc"
+
+
+async def score_trials(predictor, nctids: List[str], n_samples: int, adaptive, client,
+                       studies: Optional[dict] = None, stage: str = "predict_batch",
+                       uncertainty_mode: str = "mc") -> dict:
+    """
+    Scores trials in one batched pass: cached results first, then fetched
+    (or, for nctids in studies, the given study JSON), preprocessed and
+    predicted together. Failures stay with their own trial. The result cache
+    holds /predict's results, so it is only read and written when n_samples
+    and adaptive match /predict's.
+    Returns:
+        dict of NCTID -> response (or {"nctid", "error"})
+    """
+    studies = studies or {}
+    results = {}
+    key = _result_key(predictor, uncertainty_mode)
+    use_cache = uncertainty_mode != "mc" or (n_samples == PREDICT_N_SAMPLES and adaptive is mc_adaptive())
+
+    # 1. Cached results, then concurrent fetches for the rest; given studies skip both
+    lookup = [n for n in nctids if n not in studies]
+    if use_cache:
+        with span("cache_lookup", items=len(lookup)):
+            cached = await asyncio.gather(
+                *(result_cache.alookup(n, key, client.fetch_version) for n in lookup),
+                return_exceptions=True,
+            )
+        for nctid, hit in zip(lookup, cached):
+            if isinstance(hit, dict):
+                results[nctid] = hit
+    pending = [n for n in lookup if n not in results]
+    with span("fetch", items=len(pending)):
+        fetched = dict(zip(pending, await client.fetch_many(pending)))
+    fetched.update(studies)
+
+    # 2. Parse and preprocess
+    prepped, versions = {}, {}
+    with span("preprocess", items=len(fetched)):
+        for nctid, trial_data in fetched.items():
+            try:
+                if isinstance(trial_data, Exception):
+                    raise trial_data
+                prepped[nctid] = preprocess_trial(parse_trial_json(trial_data))
+                versions[nctid] = study_version(trial_data)
+            except Exception as e:
+                ERRORS.inc(stage=stage)
+                results[nctid] = {"nctid": nctid, "error": str(e)}
+
+    # 3. One batched embedding + MC pass over every remaining trial
+    if prepped:
+        scored = await run_in_threadpool(
+            predict_isolated, predictor.predict_batch, list(prepped.values()), n_samples=n_samples, adaptive=adaptive,
+            uncertainty_mode=uncertainty_mode,
+        )
+        for (nctid, trial), result in zip(prepped.items(), scored):
+            if isinstance(result, Exception):
+                ERRORS.inc(stage=stage)
+                results[nctid] = {"nctid": nctid, "error": str(result)}
+                continue
+            response = {"nctid": nctid, "phase": trial["phase"], **result}
+            # Uploaded records may differ from the registry's; only registry results are cached
+            if use_cache and nctid not in studies:
+                result_cache.put(nctid, versions[nctid], key, response)
+            results[nctid] = response
+
+    annotate(trials=len(nctids), cached=len(lookup) - len(pending), scored=len(prepped))
+    return results
+
+
+@app.post("/predict/batch")
+async def predict_batch(request: BatchPredictRequest):
+    predictor = await get_predictor()
+    nctids = list(dict.fromkeys(request.nctids))
+    if len(nctids) > BATCH_MAX_TRIALS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_TRIALS} NCTIDs per batch")
+    _check_uncertainty_mode(request.uncertainty_mode)
+
+    async with interactive():
+        results = await score_trials(
+            predictor, nctids, request.n_samples,
+            mc_adaptive(MC_ADAPTIVE if request.adaptive is None else request.adaptive), ct_client,
+            uncertainty_mode=request.uncertainty_mode,
+        )
+    return {"results": [results[n] for n in nctids]}
+
+
+async def _score_job_batch(items: List[dict], job: dict) -> List[dict]:
+    # Runs on the job runner's loop; waits for the models if they are still loading
+    predictor = loader.predictor if loader.is_ready() else await asyncio.to_thread(loader.wait)
+    studies = {item["nctid"]: item["study"] for item in items if item["study"] is not None}
+    adaptive = mc_adaptive(MC_ADAPTIVE if job["adaptive"] is None else job["adaptive"])
+    results = await score_trials(predictor, [item["nctid"] for item in items], job["n_samples"], adaptive,
+                                 job_ct_client, studies, stage="job", uncertainty_mode=job["uncertainty_mode"])
+    return [results[item["nctid"]] for item in items]
+
+
+job_runner = JobRunner(
+    job_store, _score_job_batch,
+    concurrency=int(os.getenv("JOB_CONCURRENCY", "1")),
+    batch_size=int(os.getenv("JOB_BATCH_SIZE", "32")),
+    busy=lambda: _interactive["in_flight"] > 0,
+    max_yield=float(os.getenv("JOB_MAX_YIELD", "5")),
+    on_exit=job_ct_client.aclose,
+) if job_store is not None else None
+
+
+def _job_view(job: dict) -> dict:
+    finished = job["done"] + job["failed"]
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "source": job["source"],
+        "total": job["total"],
+        "done": job["done"],
+        "failed": job["failed"],
+        "progress": round(finished / job["total"], 4) if job["total"] else 1.0,
+        "n_samples": job["n_samples"],
+        "adaptive": job["adaptive"],
+        "uncertainty_mode": job["uncertainty_mode"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "results_url": f"/jobs/{job['job_id']}/results",
+    }
+
+
+def _require_jobs():
+    if job_store is None:
+        raise HTTPException(status_code=404, detail="No job store configured (JOBS_DB)")
+
+
+async def _read_upload(request: Request, max_bytes: int) -> bytes:
+    # Streamed, so an oversized body is refused without being held in memory
+    too_large = HTTPException(status_code=413, detail=f"Job uploads are limited to {max_bytes} bytes")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes:
+        raise too_large
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@app.post("/jobs")
+async def create_job(request: Request, n_samples: int = Query(PREDICT_N_SAMPLES, ge=1, le=MC_MAX_SAMPLES),
+                     adaptive: Optional[bool] = None, uncertainty_mode: str = "mc"):
+    """
+    Queue a prediction job. The body is either JSON {"nctids": [...],
+    "n_samples": ..., "adaptive": ..., "uncertainty_mode": ...} or an
+    uploaded study file (JSON Lines, a JSON list or API page of studies,
+    optionally gzipped), with n_samples, adaptive and uncertainty_mode as
+    query parameters. Bodies over JOB_MAX_UPLOAD_BYTES, raw
+    or decompressed, get 413.
+    """
+    _require_jobs()
+    body = await _read_upload(request, JOB_MAX_UPLOAD_BYTES)
+    nctids, studies = None, None
+    try:
+        payload = json.loads(body) if request.headers.get("content-type", "").startswith("application/json") else None
+        if isinstance(payload, dict) and "nctids" in payload:
+            job_request = BatchPredictRequest(**payload)
+            nctids = list(dict.fromkeys(job_request.nctids))
+            n_samples, adaptive = job_request.n_samples, job_request.adaptive
+            uncertainty_mode = job_request.uncertainty_mode
+        else:
+            studies = {}
+            for study in parse_upload(body, max_bytes=JOB_MAX_UPLOAD_BYTES):
+                nctid = study_nctid(study) if isinstance(study, dict) else ""
+                if not nctid:
+                    raise ValueError("Every uploaded study needs protocolSection.identificationModule.nctId")
+                studies.setdefault(nctid, study)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid job: {e}")
+
+    _check_uncertainty_mode(uncertainty_mode)
+    total = len(nctids if nctids is not None else studies)
+    if not total:
+        raise HTTPException(status_code=400, detail="Job has no trials")
+    if total > JOB_MAX_TRIALS:
+        raise HTTPException(status_code=400, detail=f"At most {JOB_MAX_TRIALS} trials per job")
+
+    job = await run_in_threadpool(
+        job_store.create, nctids=nctids, studies=list(studies.items()) if studies is not None else None,
+        n_samples=n_samples, adaptive=adaptive, uncertainty_mode=uncertainty_mode,
+    )
+    job_runner.start()
+    job_runner.notify()
+    annotate(job_id=job["job_id"], trials=total)
+    return JSONResponse(status_code=202, content=_job_view(job))
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    _require_jobs()
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return _job_view(job)
+
+
+@app.get("/jobs/{job_id}/results")
+async def job_results(job_id: str, follow: bool = True):
+    """
+    Results as NDJSON in completion order. With follow (the default) the
+    stream stays open until the job finishes, sending results as they land.
+    """
+    _require_jobs()
+    if await run_in_threadpool(job_store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+
+    async def stream():
+        after = 0
+        while True:
+            # Status first: once it reads finished, every result is already committed
+            job = await run_in_threadpool(job_store.get, job_id)
+            rows = await run_in_threadpool(job_store.results, job_id, after)
+            if rows:
+                after = rows[-1][0]
+                yield "".join(json.dumps(result) + "\n" for _, result in rows)
+            elif not follow or job["status"] in FINISHED:
+                return
+            else:
+                await asyncio.sleep(0.5)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+class ScenarioRequest(BaseModel):
+    nctid: str
+    # Field overrides per variant, e.g. [{"phase": "Phase 3"}, {"sponsor": "Pfizer"}]
+    variants: List[dict]
+    n_samples: int = Field(PREDICT_N_SAMPLES, ge=1, le=MC_MAX_SAMPLES)
+
+
+@app.post("/scenarios")
+async def predict_scenarios(request: ScenarioRequest):
+    if not 1 <= len(request.variants) <= SCENARIO_MAX_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {SCENARIO_MAX_VARIANTS} variants per scenario")
+    predictor = await get_predictor()
+    annotate(nctid=request.nctid, variants=len(request.variants))
+    async with interactive():
+        try:
+            with span("fetch"):
+                trial_data = await ct_client.fetch_study(request.nctid)
+            with span("preprocess"):
+                base = preprocess_trial(parse_trial_json(trial_data))
+        except Exception as e:
+            ERRORS.inc(stage="scenarios")
+            annotate(error=str(e))
+            return {"error": str(e)}
+        try:
+            variants = [apply_overrides(base, overrides) for overrides in request.variants]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        try:
+            # Tower outputs shared with the base are computed once for all variants
+            results = await run_in_threadpool(predictor.predict_scenarios, base, variants,
+                                              n_samples=request.n_samples)
+        except Exception as e:
+            ERRORS.inc(stage="scenarios")
+            annotate(error=str(e))
+            return {"error": str(e)}
+    return {
+        "nctid": request.nctid,
+        "base": {"phase": base["phase"], **results[0]},
+        "variants": [
+            {"overrides": overrides, "phase": variant["phase"], **result}
+            for overrides, variant, result in zip(request.variants, variants, results[1:])
+        ],
+    }
+
+
+@app.get("/similar/{nctid}")
+async def similar_trials(nctid: str, k: int = 10):
+    if vector_index is None:
+        raise HTTPException(status_code=404, detail="No similar-trials index configured (VECTOR_INDEX_DIR)")
+    if not 1 <= k <= SIMILAR_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {SIMILAR_MAX_K}")
+
+    # Indexed trials are answered from their stored vector; others are embedded first
+    indexed = nctid in vector_index
+    predictor = None if indexed else await get_predictor()
     try:
-        trial_data = fetch_nctid_data(nctid)
-        parsed = parse_trial_json(trial_data)
-        prepped = preprocess_trial(parsed)
-        result = predictor.predict_with_uncertainty(prepped, n_samples=1000)
-        print(f"[Lucent] {nctid} | Deterministic: {result['deterministic']} | MC: {result['probability']} ± {result['uncertainty']}")
-        return {"nctid": nctid, "phase": prepped["phase"] ,**result}
+        if indexed:
+            with span("vector_search"):
+                neighbours = await run_in_threadpool(vector_index.similar, nctid, k)
+        else:
+            trial_data = await ct_client.fetch_study(nctid)
+            prepped = preprocess_trial(parse_trial_json(trial_data))
+            embeddings = await run_in_threadpool(predictor.embedder.encode_trials, [prepped])
+            with span("vector_search"):
+                neighbours = await run_in_threadpool(vector_index.search, trial_vectors(embeddings)[0], k, nctid)
+        return {"nctid": nctid, "indexed": indexed, "neighbours": neighbours}
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        ERRORS.inc(stage="similar")
+        annotate(error=str(e))
+        return {"error": str(e)}
+
+
+def _members(predictor) -> list:
+    if hasattr(predictor, "member_info"):
+        return predictor.member_info()
+    return [{"name": "default", "checksum": predictor.weights_checksum, "path": MODEL_PATH}]
+
+
+@app.get("/models")
+async def list_models():
+    predictor = await get_predictor()
+    return {"ensemble": hasattr(predictor, "member_info"), "weights_checksum": predictor.weights_checksum,
+            "models": _members(predictor)}
+
+
+@app.post("/models/refresh")
+async def refresh_models():
+    predictor = await get_predictor()
+    if not hasattr(predictor, "refresh"):
+        raise HTTPException(status_code=404, detail="Not serving an ensemble (ENSEMBLE_DIR)")
+    try:
+        changed = await run_in_threadpool(predictor.refresh)
+    except Exception as e:
+        ERRORS.inc(stage="models_refresh")
+        return {"error": str(e)}
+    return {"changed": changed, "weights_checksum": predictor.weights_checksum, "models": _members(predictor)}
+
+
+@app.get("/stats/admission")
+def admission_stats():
+    return admission.stats()
+
+
+@app.get("/stats/batcher")
+def batcher_stats():
+    if batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **batcher.stats()}
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+def healthz():
+    # Liveness: the process is up and serving, models may still be loading
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    status = loader.status()
+    if not loader.is_ready():
+        return JSONResponse(status_code=503, content=status)
+    return status
@@ -1,6 +1,9 @@
 import torch
 import torch.nn as nn
 
+# Modality towers in input (and stacking) order
+TOWERS = ("sponsor_tower", "disease_tower", "inclusion_tower", "exclusion_tower", "summary_tower")
+
    
 class ModalityTower(nn.Module):
     def __init__(self, input_dim, hidden_dims):
@@ -81,17 +84,26 @@ class MultiInputNN(nn.Module):
                 m.train()
 
 
-    def forward(self, sponsor, disease, inclusion, exclusion, summary, numerical):
-        sponsor_out = self.sponsor_tower(sponsor)
-        disease_out = self.disease_tower(disease)
-        inclusion_out = self.inclusion_tower(inclusion)
-        exclusion_out = self.exclusion_tower(exclusion)
-        summary_out = self.summary_tower(summary)
-
-        # Stack modality outputs and fuse
-        modality_stack = torch.stack(
-            [sponsor_out, disease_out, inclusion_out, exclusion_out, summary_out], dim=1
-        )  # [B, 5, D]
+    def tower(self, index, x, reps=1):
+        """
+        One modality tower (TOWERS order) on its input; with reps > 1 every
+        row is repeated reps times (trial-major) first, for MC dropout.
+        """
+        if reps > 1:
+            x = x.repeat_interleave(reps, dim=0)
+        return getattr(self, TOWERS[index])(x)
+
+    def towers(self, sponsor, disease, inclusion, exclusion, summary, reps=1):
+        """
+        All five tower outputs stacked as [B * reps, 5, D].
+        """
+        inputs = (sponsor, disease, inclusion, exclusion, summary)
+        return torch.stack([self.tower(i, x, reps) for i, x in enumerate(inputs)], dim=1)
+
+    def head(self, modality_stack, numerical):
+        """
+        Fusion, numerical projection and final head over stacked tower outputs [B, 5, D].
+        """
         fused = self.fusion(modality_stack)  # [B, D]
 
         # Process numerical features
@@ -99,4 +111,7 @@ class MultiInputNN(nn.Module):
 
         # Final prediction
         combined = torch.cat([fused, numerical_proj], dim=1)
-        return self.final_head(combined)
\ No newline at end of file
+        return self.final_head(combined)
+
+    def forward(self, sponsor, disease, inclusion, exclusion, summary, numerical):
+        return self.head(self.towers(sponsor, disease, inclusion, exclusion, summary), numerical)
@@ -0,0 +1,266 @@
+"""
+Inference-only rewrite of MultiInputNN.
+
+    python -m app.models.optimized app/models/model_weights.pth
+
+Built from a loaded (eval-mode) MultiInputNN:
+- every BatchNorm1d is folded into the Linear before it (running stats);
+- the five modality towers run as batched matmuls: the four text-width
+  towers share one baddbmm for their first layer, the sponsor tower keeps its
+  own (no padding), and layers 2 and 3 run as one 5-way bmm;
+- the single-head attention fusion reduces to one score vector and one
+  linear map, which is folded into the first layer of the final head.
+
+Dropout sits after each LeakyReLU, so folding does not change MC dropout.
+forward_repeated() additionally computes the dropout-free prefix (first
+tower layer, numerical projection) once per trial and only repeats its
+activations, so MC sampling skips the widest matmul for every replica.
+tower(), towers() and head() split the model like MultiInputNN's methods of
+the same names (used by TrialPredictor.predict_scenarios).
+"""
+import argparse
+import math
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from app.models.model import TOWERS, MultiInputNN
+
+
+def fold_linear_bn(linear: nn.Linear, bn: nn.BatchNorm1d):
+    """
+    Weight [out, in] and bias [out] of linear followed by bn in eval mode.
+    """
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    weight = linear.weight * scale[:, None]
+    bias = (linear.bias - bn.running_mean) * scale + bn.bias
+    return weight, bias
+
+
+def _tower_layers(tower) -> list:
+    # Sequential of (Linear, BatchNorm1d, LeakyReLU, Dropout) x 3
+    modules = list(tower.tower)
+    return [fold_linear_bn(modules[i], modules[i + 1]) for i in range(0, len(modules), 4)]
+
+
+class OptimizedMultiInputNN(nn.Module):
+    def __init__(self, model: MultiInputNN):
+        super().__init__()
+        with torch.no_grad():
+            layers = [_tower_layers(getattr(model, name)) for name in TOWERS]
+            if len({l[0][0].shape[1] for l in layers[1:]}) != 1:
+                raise ValueError("Disease and text towers must share an input width to be fused")
+
+            # Layer 1: sponsor on its own, the four text towers batched ([4, in, out] for bmm)
+            (w, b) = layers[0][0]
+            self.register_buffer("sponsor_w1", w.t().contiguous())
+            self.register_buffer("sponsor_b1", b.clone())
+            self.register_buffer("text_w1", torch.stack([l[0][0].t() for l in layers[1:]]))
+            self.register_buffer("text_b1", torch.stack([l[0][1] for l in layers[1:]])[:, None, :])
+            # Layers 2 and 3: all five towers
+            self.register_buffer("tower_w2", torch.stack([l[1][0].t() for l in layers]))
+            self.register_buffer("tower_b2", torch.stack([l[1][1] for l in layers])[:, None, :])
+            self.register_buffer("tower_w3", torch.stack([l[2][0].t() for l in layers]))
+            self.register_buffer("tower_b3", torch.stack([l[2][1] for l in layers])[:, None, :])
+
+            # Attention with a learned query and one head:
+            #   score_m = x_m . (W_k^T q) / sqrt(d)   (the key bias only shifts all scores)
+            #   fused   = W_o (W_v sum_m a_m x_m + b_v) + b_o
+            attn = model.fusion.attn
+            dim = attn.embed_dim
+            w_q, w_k, w_v = attn.in_proj_weight.split(dim)
+            b_q, _, b_v = attn.in_proj_bias.split(dim)
+            q = model.fusion.query[0] @ w_q.t() + b_q
+            self.register_buffer("attn_u", (w_k.t() @ q) / math.sqrt(dim))
+            fuse_w = attn.out_proj.weight @ w_v
+            fuse_b = attn.out_proj.weight @ b_v + attn.out_proj.bias
+
+            # Numerical projection
+            num_linear, num_bn = model.numerical_proj[0], model.numerical_proj[1]
+            w, b = fold_linear_bn(num_linear, num_bn)
+            self.register_buffer("num_w", w.t().contiguous())
+            self.register_buffer("num_b", b.clone())
+
+            # Head: the fusion's linear map is folded into the first layer's fused-input columns
+            head = list(model.final_head)
+            w1, b1 = fold_linear_bn(head[0], head[1])
+            self.register_buffer("head_wz", (w1[:, :dim] @ fuse_w).t().contiguous())
+            self.register_buffer("head_wn", w1[:, dim:].t().contiguous())
+            self.register_buffer("head_b1", b1 + w1[:, :dim] @ fuse_b)
+            w2, b2 = fold_linear_bn(head[4], head[5])
+            self.register_buffer("head_w2", w2.t().contiguous())
+            self.register_buffer("head_b2", b2.clone())
+            self.register_buffer("head_w3", head[8].weight.t().contiguous())
+            self.register_buffer("head_b3", head[8].bias.clone())
+
+        first = model.sponsor_tower.tower
+        self.negative_slope = first[2].negative_slope
+        self.tower_dropout = nn.Dropout(first[3].p)
+        self.num_dropout = nn.Dropout(model.numerical_proj[3].p)
+        self.head_dropout = nn.Dropout(model.final_head[3].p)
+        self.eval()
+
+    def enable_mc_dropout(self):
+        for m in self.modules():
+            if isinstance(m, nn.Dropout):
+                m.train()
+
+    def _tower_prefix(self, sponsor, disease, inclusion, exclusion, summary):
+        """
+        Tower layer 1 of all five towers, activated. Returns [5, B, 256].
+        """
+        batch = sponsor.shape[0]
+        h = sponsor.new_empty((5, batch, self.tower_w2.shape[1]))
+        torch.addmm(self.sponsor_b1, sponsor, self.sponsor_w1, out=h[0])
+        text = torch.stack([disease, inclusion, exclusion, summary])
+        torch.baddbmm(self.text_b1, text, self.text_w1, out=h[1:])
+        return F.leaky_relu_(h, self.negative_slope)
+
+    def _prefix(self, sponsor, disease, inclusion, exclusion, summary, numerical):
+        """
+        Everything before the first dropout: tower layer 1 and the numerical
+        projection, activated. Returns ([5, B, 256], [B, 32]).
+        """
+        n = torch.addmm(self.num_b, numerical, self.num_w)
+        return (self._tower_prefix(sponsor, disease, inclusion, exclusion, summary),
+                F.leaky_relu_(n, self.negative_slope))
+
+    def _towers(self, h):
+        """
+        Tower layers 2 and 3 from activated layer-1 outputs h [5, B, 256]. Returns [5, B, 64].
+        """
+        slope = self.negative_slope
+        h = self.tower_dropout(h)
+        h = self.tower_dropout(F.leaky_relu_(torch.baddbmm(self.tower_b2, h, self.tower_w2), slope))
+        return self.tower_dropout(F.leaky_relu_(torch.baddbmm(self.tower_b3, h, self.tower_w3), slope))
+
+    def _head(self, x, n):
+        """
+        Fusion and head from tower outputs x [5, B, 64] and the activated numerical projection n.
+        """
+        slope = self.negative_slope
+        weights = torch.softmax(x @ self.attn_u, dim=0)  # [5, B]
+        z = (weights.unsqueeze(-1) * x).sum(dim=0)       # [B, 64]
+        n = self.num_dropout(n)
+
+        y = torch.addmm(self.head_b1, z, self.head_wz).addmm_(n, self.head_wn)
+        y = self.head_dropout(F.leaky_relu_(y, slope))
+        y = self.head_dropout(F.leaky_relu_(torch.addmm(self.head_b2, y, self.head_w2), slope))
+        return torch.addmm(self.head_b3, y, self.head_w3)
+
+    def _rest(self, h, n):
+        return self._head(self._towers(h), n)
+
+    def tower(self, index, x, reps=1):
+        """
+        MultiInputNN.tower(): one tower, its first layer run once per row before repeating.
+        """
+        slope = self.negative_slope
+        if index == 0:
+            h = torch.addmm(self.sponsor_b1, x, self.sponsor_w1)
+        else:
+            h = torch.addmm(self.text_b1[index - 1, 0], x, self.text_w1[index - 1])
+        h = F.leaky_relu_(h, slope)
+        if reps > 1:
+            h = h.repeat_interleave(reps, dim=0)
+        h = self.tower_dropout(h)
+        h = self.tower_dropout(F.leaky_relu_(torch.addmm(self.tower_b2[index, 0], h, self.tower_w2[index]), slope))
+        return self.tower_dropout(F.leaky_relu_(torch.addmm(self.tower_b3[index, 0], h, self.tower_w3[index]), slope))
+
+    def towers(self, sponsor, disease, inclusion, exclusion, summary, reps=1):
+        """
+        MultiInputNN.towers(): [B * reps, 5, 64].
+        """
+        h = self._tower_prefix(sponsor, disease, inclusion, exclusion, summary)
+        if reps > 1:
+            h = h.repeat_interleave(reps, dim=1)
+        return self._towers(h).transpose(0, 1)
+
+    def head(self, modality_stack, numerical):
+        """
+        MultiInputNN.head() over stacked tower outputs [B, 5, 64].
+        """
+        n = F.leaky_relu_(torch.addmm(self.num_b, numerical, self.num_w), self.negative_slope)
+        return self._head(modality_stack.transpose(0, 1), n)
+
+    def forward(self, sponsor, disease, inclusion, exclusion, summary, numerical):
+        return self._rest(*self._prefix(sponsor, disease, inclusion, exclusion, summary, numerical))
+
+    def forward_repeated(self, inputs, reps: int):
+        """
+        Same as forward(*[t.repeat_interleave(reps, dim=0) for t in inputs]),
+        but the dropout-free prefix runs once per trial.
+        """
+        h, n = self._prefix(*inputs)
+        return self._rest(h.repeat_interleave(reps, dim=1), n.repeat_interleave(reps, dim=0))
+
+
+def optimize_model(model: MultiInputNN) -> OptimizedMultiInputNN:
+    model.eval()
+    return OptimizedMultiInputNN(model).to(next(model.parameters()).device)
+
+
+def _random_inputs(model: MultiInputNN, batch_size: int, generator: torch.Generator) -> tuple:
+    device = next(model.parameters()).device
+    dims = [getattr(model, name).tower[0].in_features for name in TOWERS]
+    inputs = [torch.randn(batch_size, d, generator=generator).to(device) for d in dims]
+    phases = torch.randint(0, model.numerical_proj[0].in_features, (batch_size,), generator=generator)
+    inputs.append(F.one_hot(phases, model.numerical_proj[0].in_features).float().to(device))
+    return tuple(inputs)
+
+
+def check_equivalence(model: MultiInputNN, optimized: OptimizedMultiInputNN, batch_size: int = 64,
+                      n_samples: int = 2000, seed: int = 0) -> dict:
+    """
+    Compare the optimized module against the reference on random inputs:
+    deterministic logits directly, and MC dropout through the mean and std
+    of n_samples sigmoid samples per trial (masks differ, so only the
+    distributions are comparable). n_samples=0 checks the logits only.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    inputs = _random_inputs(model, batch_size, generator)
+    model.eval()
+    optimized.eval()
+    with torch.no_grad():
+        report = {"max_abs_logit_diff": float((model(*inputs) - optimized(*inputs)).abs().max())}
+        if not n_samples:
+            return report
+
+        torch.manual_seed(seed)
+        model.enable_mc_dropout()
+        ref_mc = torch.sigmoid(model(*[t.repeat_interleave(n_samples, dim=0) for t in inputs]))
+        optimized.enable_mc_dropout()
+        opt_mc = torch.sigmoid(optimized.forward_repeated(inputs, n_samples))
+        model.eval()
+        optimized.eval()
+
+    ref_mc, opt_mc = ref_mc.view(batch_size, n_samples), opt_mc.view(batch_size, n_samples)
+    report.update({
+        "mc_max_mean_diff": float((ref_mc.mean(1) - opt_mc.mean(1)).abs().max()),
+        "mc_max_std_diff": float((ref_mc.std(1) - opt_mc.std(1)).abs().max()),
+        # Largest standard error of a per-trial MC mean, to judge the two above
+        "mc_mean_stderr": float(ref_mc.std(1).max() / math.sqrt(n_samples)),
+    })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify the optimized MultiInputNN against saved weights.")
+    parser.add_argument("model_path", nargs="?", default="app/models/model_weights.pth")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--n-samples", type=int, default=2000)
+    parser.add_argument("--atol", type=float, default=1e-4, help="Allowed deterministic logit difference")
+    args = parser.parse_args(argv)
+
+    model = MultiInputNN(sponsor_dim=384, disease_dim=768, text_dim=768, num_features=7)
+    model.load_state_dict(torch.load(args.model_path, map_location="cpu"))
+    report = check_equivalence(model, optimize_model(model), args.batch_size, args.n_samples)
+    for key, value in report.items():
+        print(f"[optimized] {key}: {value:.3g}")
+    if report["max_abs_logit_diff"] > args.atol:
+        raise SystemExit(f"[optimized] Deterministic logits differ by more than {args.atol}")
+
+
+if __name__ == "__main__":
+    main()
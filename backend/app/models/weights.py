@@ -0,0 +1,62 @@
+"""
+Memory-mapped weight loading.
+
+    python -m app.models.weights app/models/model_weights.pth app/models/model_weights.safetensors
+
+load_state_dict() maps the weights file instead of reading it into anonymous
+memory: safetensors files always, and torch.save zip checkpoints through
+torch.load(mmap=True). Loaded with assign=True, the model's parameters point
+straight into the page cache, so every process serving the same file shares
+one physical copy, and pages are only read when first touched.
+"""
+import argparse
+
+import torch
+
+
+def load_state_dict(path: str, device="cpu") -> dict:
+    """
+    State dict of a .safetensors or torch.save checkpoint, memory-mapped on CPU.
+    """
+    device = torch.device(device)
+    if path.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        state = load_file(path, device="cpu")
+    else:
+        try:
+            state = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        except RuntimeError:
+            # Legacy (pre-zip) checkpoints cannot be mapped
+            state = torch.load(path, map_location="cpu", weights_only=True)
+    if device.type != "cpu":
+        state = {k: v.to(device) for k, v in state.items()}
+    return state
+
+
+def load_weights(model: torch.nn.Module, path: str, device="cpu") -> torch.nn.Module:
+    """
+    Load path into model in place, assigning the mapped tensors as parameters
+    rather than copying them into the model's own storage.
+    """
+    model.load_state_dict(load_state_dict(path, device), assign=True)
+    return model
+
+
+def convert_to_safetensors(source: str, output: str):
+    from safetensors.torch import save_file
+
+    state = torch.load(source, map_location="cpu", weights_only=True)
+    save_file({k: v.contiguous() for k, v in state.items()}, output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a torch.save checkpoint to safetensors.")
+    parser.add_argument("source")
+    parser.add_argument("output")
+    args = parser.parse_args(argv)
+    convert_to_safetensors(args.source, args.output)
+    print(f"[weights] Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Re-score every trial in a feature store without running the encoders.
+
+    python -m app.rescore features/ --output scores.csv --model-path app/models/model_weights.pth
+
+Batches of stored embeddings are streamed from the memory-mapped shards
+straight into batched MultiInputNN inference (deterministic forward plus MC
+dropout); the transformer encoders are never loaded, so a new set of
+weights re-scores the whole registry at the cost of the small network
+alone. Output is the same CSV / Parquet as app.bulk_score, checkpointed
+after every batch at `<output>.checkpoint.json` along with the weights and
+the store it was written for. Only each trial's latest row is scored; a
+trial re-embedded at a newer study version after it was scored is scored
+again on resume, and its later output row supersedes the earlier one.
+"""
+import argparse
+import json
+import os
+from typing import Optional
+
+from app.bulk_io import OUTPUT_COLUMNS, CsvSink, ParquetSink, save_checkpoint
+from app.core.feature_store import FeatureStore
+
+
+def _load_checkpoint(path: str, weights: str, store: FeatureStore) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("weights") != weights:
+        raise RuntimeError(f"Checkpoint {path} was written with other weights; use --restart")
+    # Stores only grow; another id, or fewer rows than were scored, means it was rebuilt
+    if checkpoint.get("store") != store.id or checkpoint["processed"] > len(store):
+        raise RuntimeError(f"Checkpoint {path} was written for another feature store; use --restart")
+    return checkpoint
+
+
+def rescore(store: FeatureStore, output: str, predictor, batch_size: int = 1024, n_samples: int = 1000,
+            fmt: Optional[str] = None, restart: bool = False, adaptive=None) -> int:
+    """
+    Scores the stored trials into output, resuming from the checkpoint unless
+    restart is set. Rows appended to the store since are scored on resume.
+    Returns:
+        Number of trials scored by this run
+    """
+    fmt = fmt or ("parquet" if output.endswith(".parquet") else "csv")
+    checkpoint_path = output.rstrip("/") + ".checkpoint.json"
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+        if fmt == "csv" and os.path.exists(output):
+            os.remove(output)
+    checkpoint = _load_checkpoint(checkpoint_path, predictor.weights_checksum, store) or {
+        "weights": predictor.weights_checksum, "store": store.id, "processed": 0, "output": None}
+    if checkpoint["processed"]:
+        print(f"[rescore] Resuming after {checkpoint['processed']} rows")
+
+    sink = CsvSink(output, checkpoint["output"]) if fmt == "csv" else ParquetSink(output, checkpoint["output"])
+    scored = 0
+    try:
+        for end, nctids, embeddings, phases in store.iter_spans(batch_size, start=checkpoint["processed"]):
+            results = predictor.predict_embeddings(embeddings, phases, n_samples=n_samples, adaptive=adaptive)
+            rows = []
+            for nctid, phase, result in zip(nctids, phases, results):
+                row = {col: None for col in OUTPUT_COLUMNS}
+                row.update(nctid=nctid, phase=phase, **result)
+                rows.append(row)
+            sink.write(rows)
+            scored += len(rows)
+            checkpoint.update(processed=end, output=sink.position())
+            save_checkpoint(checkpoint_path, checkpoint)
+            print(f"[rescore] {checkpoint['processed']} / {len(store)} rows scored")
+    finally:
+        sink.close()
+    return scored
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score a feature store with the trial model.")
+    parser.add_argument("store", help="Feature store directory (see app.embed_features)")
+    parser.add_argument("--output", required=True, help="CSV file, or directory for Parquet parts")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="Output format (default: from --output)")
+    parser.add_argument("--model-path", default="app/models/model_weights.pth")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--n-samples", type=int, default=1000)
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--optimized", action="store_true", help="Use the BatchNorm-folded, tower-fused model")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Stop MC sampling per trial once converged (--n-samples is the cap)")
+    parser.add_argument("--sem-tol", type=float, default=1e-3)
+    parser.add_argument("--std-tol", type=float, default=1e-3)
+    args = parser.parse_args(argv)
+
+    from app.core.predict import AdaptiveSampling, TrialPredictor
+
+    store = FeatureStore(args.store)
+    print(f"[rescore] {store.trials} trials in {len(store)} rows ({store.dtype}) embedded with {store.encoders}")
+    predictor = TrialPredictor(model_path=args.model_path, device=args.device, optimize_model=args.optimized,
+                               load_embedder=False)
+    adaptive = AdaptiveSampling(sem_tol=args.sem_tol, std_tol=args.std_tol) if args.adaptive else None
+    scored = rescore(store, args.output, predictor, batch_size=args.batch_size, n_samples=args.n_samples,
+                     fmt=args.format, restart=args.restart, adaptive=adaptive)
+    print(f"[rescore] Done: {scored} trials scored this run")
+
+
+if __name__ == "__main__":
+    main()
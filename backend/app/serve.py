@@ -0,0 +1,199 @@
+"""
+Pre-fork serving: load the models once, then fork the uvicorn workers.
+
+    python -m app.serve --workers 4 --port 8000
+
+The parent imports app.main and builds the predictor (MultiInputNN weights
+memory-mapped, see app.models.weights; the transformer encoders as usual)
+without running any inference, freezes the garbage collector so it never
+writes to the inherited objects, binds the listening socket and forks the
+workers. Every worker runs uvicorn on the inherited socket; weight pages are
+shared copy-on-write and only the per-worker activations, caches and
+interpreter state are private. A worker that exits is re-forked from the
+parent, which costs no model load.
+
+The parent logs each worker's shared versus private resident memory every
+--memory-interval seconds; each worker also exports its own as
+lucent_process_memory_bytes on /metrics. Linux only (fork, smaps_rollup).
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+from app.core.metrics import memory_breakdown
+
+# A worker dying sooner than this after its fork counts as a crash loop
+MIN_WORKER_UPTIME = 5.0
+MAX_FAST_EXITS = 5
+
+
+def _bind(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, args, index: int):
+    import uvicorn
+
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    if args.threads_per_worker:
+        import torch
+        torch.set_num_threads(args.threads_per_worker)
+    print(f"[serve] Worker {index} started (pid {os.getpid()})")
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def format_memory(workers: Dict[int, int]) -> str:
+    """
+    One line per worker (index -> pid) with its shared / private resident memory in MiB.
+    """
+    lines = []
+    total_private = 0
+    for index, pid in sorted(workers.items()):
+        memory = memory_breakdown(pid)
+        if memory is None:
+            continue
+        total_private += memory["private"]
+        lines.append(f"[serve] worker {index} pid {pid}: rss {memory['rss'] / 2**20:.0f} MiB, "
+                     f"shared {memory['shared'] / 2**20:.0f} MiB, private {memory['private'] / 2**20:.0f} MiB, "
+                     f"pss {memory['pss'] / 2**20:.0f} MiB")
+    parent = memory_breakdown()
+    if parent is not None:
+        lines.append(f"[serve] parent: rss {parent['rss'] / 2**20:.0f} MiB; workers' private total "
+                     f"{total_private / 2**20:.0f} MiB")
+    return "\n".join(lines)
+
+
+class PreforkServer:
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers: Dict[int, int] = {}  # index -> pid
+        self.started: Dict[int, float] = {}
+        self.fast_exits = 0
+        self.stopping = False
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(self.app, self.sock, self.args, index)
+            except BaseException as e:
+                print(f"[serve] Worker {index} failed: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.workers[index] = pid
+        self.started[index] = time.monotonic()
+
+    def stop(self, *_):
+        self.stopping = True
+
+    def reap(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = next((i for i, p in self.workers.items() if p == pid), None)
+            if index is None:
+                continue
+            del self.workers[index]
+            if self.stopping:
+                continue
+            uptime = time.monotonic() - self.started[index]
+            print(f"[serve] Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)} "
+                  f"after {uptime:.1f}s; restarting")
+            self.fast_exits = self.fast_exits + 1 if uptime < MIN_WORKER_UPTIME else 0
+            if self.fast_exits >= MAX_FAST_EXITS:
+                print("[serve] Workers keep exiting on startup; shutting down")
+                self.stopping = True
+                continue
+            self.spawn(index)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.args.workers):
+            self.spawn(index)
+
+        next_report = time.monotonic() + self.args.memory_interval
+        while not self.stopping:
+            time.sleep(0.2)
+            self.reap()
+            if self.args.memory_interval and time.monotonic() >= next_report:
+                print(format_memory(self.workers), flush=True)
+                next_report = time.monotonic() + self.args.memory_interval
+
+        # uvicorn finishes in-flight requests on SIGTERM
+        for pid in self.workers.values():
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            time.sleep(0.1)
+            self.reap()
+        for pid in self.workers.values():
+            os.kill(pid, signal.SIGKILL)
+        self.sock.close()
+        return 1 if self.fast_exits >= MAX_FAST_EXITS else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing one model load.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "2")))
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch intra-op threads per worker (default: cpu count / workers)")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5, help="HTTP keep-alive timeout (s)")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    parser.add_argument("--memory-interval", type=float, default=60.0,
+                        help="Seconds between per-worker memory reports (0 disables)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    if args.threads_per_worker is None:
+        args.threads_per_worker = max(1, (os.cpu_count() or 1) // args.workers)
+
+    from app import main as service
+    from app.core import embedding_cache
+
+    if service.EMBED_WORKERS > 0:
+        raise SystemExit("[serve] EMBED_WORKERS starts its own processes and cannot be forked; unset it")
+    # Workers share the EMBED_CACHE_DIR disk tier; its writers serialize on an fcntl lock
+    if service.embedding_cache.cache_dir and args.workers > 1 and embedding_cache.fcntl is None:
+        raise SystemExit("[serve] Sharing the EMBED_CACHE_DIR disk tier between workers needs fcntl locking, "
+                         "which this platform lacks; unset it or run one worker")
+
+    service.loader.preload()
+    # Objects that survive to here are never collected; the GC then never
+    # touches (and un-shares) their pages in the workers
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind(args.host, args.port, args.backlog)
+    print(f"[serve] Listening on {args.host}:{args.port} with {args.workers} workers "
+          f"({args.threads_per_worker} torch threads each)")
+    print(format_memory({}), flush=True)
+    sys.exit(PreforkServer(service.app, sock, args).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 import requests
 from typing import List, Dict
 
+# Field path requested when only the study version is needed
+VERSION_FIELDS = "protocolSection.statusModule.lastUpdatePostDateStruct"
+
+# Seconds to wait for ClinicalTrials.gov before giving up
+REQUEST_TIMEOUT = 10
+
 
 def fetch_nctid_data(nctid: str):
     """
@@ -17,12 +23,44 @@ def fetch_nctid_data(nctid: str):
     """
     base_url = f"https://clinicaltrials.gov/api/v2/studies/{nctid}"
     
-    response = requests.get(base_url)
+    response = requests.get(base_url, timeout=REQUEST_TIMEOUT)
     if response.status_code != 200:
         raise Exception(f"ClinicalTrials.gov API returned status {response.status_code}")
     data = response.json()
     return data
 
+
+def study_version(data: dict) -> str:
+    """
+    Returns the study's last update post date, which changes on every new
+    ClinicalTrials.gov version of the record. Empty string if missing.
+    """
+    status = data.get('protocolSection', {}).get('statusModule', {})
+    return status.get('lastUpdatePostDateStruct', {}).get('date', "")
+
+
+def study_nctid(data: dict) -> str:
+    """
+    Returns the NCTID of a study JSON record. Empty string if missing.
+    """
+    return data.get('protocolSection', {}).get('identificationModule', {}).get('nctId', "")
+
+
+def fetch_nctid_version(nctid: str) -> str:
+    """
+    Fetches only the version metadata of a trial, which is much cheaper than
+    the full record. Used to revalidate cached predictions.
+
+    Raises:
+        Exception: If the API request fails or returns a non-200 status.
+    """
+    base_url = f"https://clinicaltrials.gov/api/v2/studies/{nctid}"
+
+    response = requests.get(base_url, params={"fields": VERSION_FIELDS}, timeout=REQUEST_TIMEOUT)
+    if response.status_code != 200:
+        raise Exception(f"ClinicalTrials.gov API returned status {response.status_code}")
+    return study_version(response.json())
+
 if __name__ == "__main__":
     # Example usage
     nctid = "NCT00000172"
@@ -0,0 +1,187 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Union
+
+import httpx
+
+from app.services.clinicaltrials_api import VERSION_FIELDS, study_version
+
+BASE_URL = "https://clinicaltrials.gov/api/v2"
+
+# Status codes worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class AsyncClinicalTrialsClient:
+    """
+    Async ClinicalTrials.gov v2 client.
+
+    Uses one pooled keep-alive HTTP session, bounds concurrent upstream
+    requests, retries transient failures with exponential backoff (capped at
+    backoff_max) or after the server's Retry-After (capped separately at
+    retry_after_max, since a rate-limited server's wait is usually longer
+    than our own backoff), and coalesces concurrent fetches of the same
+    study into a single upstream call. With a StudyStore, studies and
+    versions are read from the local mirror first; studies fetched upstream
+    on a miss are written back to it.
+    """
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        max_concurrency: int = 10,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        retry_after_max: float = 120.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        store=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self._transport = transport
+        self.store = store
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+        self.upstream_requests = 0
+        self.coalesced = 0
+        self.local_hits = 0
+
+    async def _session(self) -> httpx.AsyncClient:
+        # Sessions are bound to an event loop; rebuild if called from a new one
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                # Release the previous loop's connection pool instead of leaking it
+                stale, self._client = self._client, None
+                try:
+                    await stale.aclose()
+                except Exception as e:
+                    print(f"[ClinicalTrials] Could not close stale session: {e}")
+            self._loop = loop
+            self._inflight = {}
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                transport=self._transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None and "Retry-After" in response.headers:
+            value = response.headers["Retry-After"]
+            try:
+                delay = float(value)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(value).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = self.backoff_base
+            return min(max(delay, 0.0), self.retry_after_max)
+        # Exponential backoff with jitter so retries from many requests spread out
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _get_json(self, path: str, params: Optional[dict] = None) -> dict:
+        client = await self._session()
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                async with self._semaphore:
+                    self.upstream_requests += 1
+                    response = await client.get(url, params=params)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise Exception(f"ClinicalTrials.gov API request failed: {e}") from e
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code not in RETRYABLE_STATUS or attempt == self.max_retries:
+                    raise Exception(f"ClinicalTrials.gov API returned status {response.status_code}")
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+    async def _coalesced(self, key: tuple, factory):
+        await self._session()
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        def done(f):
+            self._inflight.pop(key, None)
+            if not f.cancelled():
+                f.exception()  # mark retrieved even if every waiter was cancelled
+
+        future = asyncio.ensure_future(factory())
+        self._inflight[key] = future
+        future.add_done_callback(done)
+        return await asyncio.shield(future)
+
+    async def fetch_study(self, nctid: str) -> dict:
+        """
+        Async equivalent of fetch_nctid_data.
+        """
+        if self.store is not None:
+            data = await asyncio.to_thread(self.store.get, nctid)
+            if data is not None:
+                self.local_hits += 1
+                return data
+
+        async def fetch():
+            data = await self._get_json(f"/studies/{nctid}")
+            if self.store is not None:
+                await asyncio.to_thread(self.store.upsert, [data])
+            return data
+
+        return await self._coalesced(("study", nctid), fetch)
+
+    async def fetch_version(self, nctid: str) -> str:
+        """
+        Async equivalent of fetch_nctid_version.
+        """
+        if self.store is not None:
+            version = await asyncio.to_thread(self.store.version, nctid)
+            if version is not None:
+                self.local_hits += 1
+                return version
+
+        async def fetch():
+            return study_version(await self._get_json(f"/studies/{nctid}", params={"fields": VERSION_FIELDS}))
+
+        return await self._coalesced(("version", nctid), fetch)
+
+    async def fetch_studies_page(self, params: dict) -> dict:
+        """
+        One page of the /studies search endpoint (studies, nextPageToken).
+        """
+        return await self._get_json("/studies", params=params)
+
+    async def fetch_many(self, nctids: List[str]) -> List[Union[dict, Exception]]:
+        """
+        Fetches several studies concurrently. Failures are returned in place
+        as exceptions so one bad NCTID does not fail the others.
+        """
+        return await asyncio.gather(*(self.fetch_study(n) for n in nctids), return_exceptions=True)
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from app.services.clinicaltrials_api import study_nctid, study_version
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    nctid TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    data BLOB NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _encode(data: dict):
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest(), zlib.compress(payload, 6)
+
+
+def _decode(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob))
+
+
+class StudyStore:
+    """
+    Local mirror of ClinicalTrials.gov study records in one SQLite file.
+
+    Studies are stored as zlib-compressed JSON keyed by NCTID, with their
+    version (lastUpdatePostDate) and a digest of the canonical JSON so an
+    upsert can tell whether anything changed. sync_state holds the sync
+    watermarks. One connection is shared behind a lock; WAL mode lets a
+    sync write while the API process reads. A forked process (app.serve
+    workers) opens its own connection on first use.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # SQLite connections must not be used across fork
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = self._pid = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM studies").fetchone()[0]
+
+    def __contains__(self, nctid: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM studies WHERE nctid = ?", (nctid,)).fetchone() is not None
+
+    def get(self, nctid: str) -> Optional[dict]:
+        """
+        Returns the stored study JSON, or None if the study is not mirrored.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM studies WHERE nctid = ?", (nctid,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    def version(self, nctid: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM studies WHERE nctid = ?", (nctid,)).fetchone()
+        return row[0] if row else None
+
+    def iter_studies(self, nctids: Optional[Iterable[str]] = None) -> Iterator[dict]:
+        """
+        Yields stored studies: the given NCTIDs (missing ones are skipped) or all of them.
+        """
+        if nctids is None:
+            with self._lock:
+                keys = [r[0] for r in self._conn.execute("SELECT nctid FROM studies ORDER BY nctid")]
+        else:
+            keys = list(nctids)
+        for nctid in keys:
+            data = self.get(nctid)
+            if data is not None:
+                yield data
+
+    def upsert(self, studies: Iterable[dict]) -> List[str]:
+        """
+        Inserts new studies and replaces changed ones in one transaction.
+        Returns:
+            NCTIDs that were added or whose record changed
+        """
+        rows = []
+        for data in studies:
+            nctid = study_nctid(data)
+            if nctid:
+                digest, blob = _encode(data)
+                rows.append((nctid, study_version(data), digest, blob))
+        if not rows:
+            return []
+
+        now = time.time()
+        changed = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for nctid, version, digest, blob in rows:
+                    current = self._conn.execute("SELECT digest FROM studies WHERE nctid = ?", (nctid,)).fetchone()
+                    if current is not None and current[0] == digest:
+                        continue
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO studies (nctid, version, digest, data, synced_at) VALUES (?, ?, ?, ?, ?)",
+                        (nctid, version, digest, blob, now),
+                    )
+                    changed.append(nctid)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return changed
+
+    def get_state(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            count, latest = self._conn.execute("SELECT COUNT(*), MAX(version) FROM studies").fetchone()
+        return {"studies": count, "latest_version": latest}
@@ -0,0 +1,123 @@
+"""
+Incremental sync of the local ClinicalTrials.gov mirror (see StudyStore).
+
+    python -m app.sync_studies studies.sqlite --changed-ids changed.txt
+    python -m app.sync_studies studies.sqlite --condition "lung cancer" --changed-studies changed.jsonl
+
+Pages the v2 /studies search filtered to studies updated since the last
+successful sync with the same filters (or --since), and upserts only studies
+whose record changed. The changed NCTIDs are printed or written to
+--changed-ids; --changed-studies writes the changed records as JSON Lines,
+which app.bulk_score and app.build_index read directly, so only those get
+re-scored. Point the API at the mirror with STUDY_STORE=studies.sqlite.
+"""
+import argparse
+import asyncio
+import json
+from typing import List, Optional
+
+from app.services.clinicaltrials_api import study_version
+from app.services.clinicaltrials_async import BASE_URL, AsyncClinicalTrialsClient
+from app.services.study_store import StudyStore
+
+PAGE_SIZE = 1000
+
+
+def _watermark_key(filters: dict) -> str:
+    return "watermark:" + json.dumps(filters, sort_keys=True)
+
+
+async def sync_studies(client: AsyncClinicalTrialsClient, store: StudyStore, since: Optional[str] = None,
+                       condition: Optional[str] = None, term: Optional[str] = None,
+                       status: Optional[List[str]] = None, page_size: int = PAGE_SIZE) -> dict:
+    """
+    Pages /studies for studies updated on or after the watermark and upserts them.
+    Args:
+        since: last update date (YYYY-MM-DD) to start from; defaults to the
+            stored watermark for these filters, or everything on the first run
+        condition / term / status: query.cond, query.term and filter.overallStatus
+    Returns:
+        Summary dict with the changed NCTIDs, studies seen and the new watermark
+    """
+    filters = {"condition": condition, "term": term, "status": sorted(status) if status else None}
+    key = _watermark_key(filters)
+    since = since or store.get_state(key)
+
+    params = {"format": "json", "pageSize": page_size}
+    if condition:
+        params["query.cond"] = condition
+    if term:
+        params["query.term"] = term
+    if status:
+        params["filter.overallStatus"] = ",".join(status)
+    if since:
+        # Dates have day granularity, so the watermark day is re-read; unchanged studies are skipped
+        params["filter.advanced"] = f"AREA[LastUpdatePostDate]RANGE[{since},MAX]"
+
+    changed, seen, pages = [], 0, 0
+    watermark = since or ""
+    while True:
+        page = await client.fetch_studies_page(params)
+        studies = page.get("studies", [])
+        changed.extend(await asyncio.to_thread(store.upsert, studies))
+        seen += len(studies)
+        pages += 1
+        watermark = max([watermark] + [study_version(s) for s in studies])
+        print(f"[sync_studies] Page {pages}: {seen} studies seen, {len(changed)} changed")
+        token = page.get("nextPageToken")
+        if not token:
+            break
+        params["pageToken"] = token
+
+    # Pages are not ordered by date, so the watermark only moves once the whole range is in
+    if watermark:
+        store.set_state(key, watermark)
+    return {"changed": changed, "seen": seen, "pages": pages, "since": since, "watermark": watermark or None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync the local ClinicalTrials.gov study mirror.")
+    parser.add_argument("store", help="SQLite mirror path (created if missing)")
+    parser.add_argument("--since", default=None, help="Last update date YYYY-MM-DD (default: last sync)")
+    parser.add_argument("--condition", default=None, help="query.cond filter")
+    parser.add_argument("--term", default=None, help="query.term filter")
+    parser.add_argument("--status", default=None, help="Comma-separated filter.overallStatus values")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--changed-ids", default=None, help="Write changed NCTIDs here, one per line")
+    parser.add_argument("--changed-studies", default=None, help="Write changed studies here as JSON Lines")
+    args = parser.parse_args(argv)
+
+    store = StudyStore(args.store)
+    client = AsyncClinicalTrialsClient(base_url=args.base_url)
+
+    async def run():
+        try:
+            return await sync_studies(
+                client, store, since=args.since, condition=args.condition, term=args.term,
+                status=args.status.split(",") if args.status else None, page_size=args.page_size,
+            )
+        finally:
+            await client.aclose()
+
+    try:
+        summary = asyncio.run(run())
+        if args.changed_ids:
+            with open(args.changed_ids, "w") as f:
+                f.writelines(f"{nctid}\n" for nctid in summary["changed"])
+        else:
+            for nctid in summary["changed"]:
+                print(nctid)
+        if args.changed_studies:
+            with open(args.changed_studies, "w") as f:
+                for study in store.iter_studies(summary["changed"]):
+                    f.write(json.dumps(study) + "\n")
+    finally:
+        store.close()
+    print(f"[sync_studies] {len(summary['changed'])} of {summary['seen']} studies changed; "
+          f"watermark {summary['watermark']}")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Calibration report for the fast uncertainty modes.
+
+    python -m app.uncertainty_report tests/fixtures/studies.jsonl --n-samples 1000
+
+Scores a fixture set of study JSON with MC dropout (the reference) and with
+each sampling-free uncertainty_mode ("moments", "masks"), from the same
+embeddings, and compares the per-trial probability mean and std against the
+reference. The report also gives each mode's model time and speedup, and
+the command exits non-zero when a mode drifts past the given tolerances.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import torch
+
+from app.bulk_io import iter_studies, list_study_files, preprocess_batch
+
+FAST_MODES = ("moments", "masks")
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def compare_uncertainty(reference: list, candidate: list) -> dict:
+    """
+    Mean / std agreement of candidate results with the reference results.
+    """
+    ref_mean = np.array([r["probability"] for r in reference])
+    ref_std = np.array([r["uncertainty"] for r in reference])
+    mean = np.array([r["probability"] for r in candidate])
+    std = np.array([r["uncertainty"] for r in candidate])
+    std_diff = np.abs(std - ref_std)
+    return {
+        "mean_max_abs_diff": round(float(np.abs(mean - ref_mean).max()), 6),
+        "mean_mean_abs_diff": round(float(np.abs(mean - ref_mean).mean()), 6),
+        "std_max_abs_diff": round(float(std_diff.max()), 6),
+        "std_mean_abs_diff": round(float(std_diff.mean()), 6),
+        # Median ratio: < 1 means the mode is over-confident
+        "std_ratio_median": round(float(np.median(std / np.maximum(ref_std, 1e-12))), 4),
+        "std_correlation": round(float(np.corrcoef(std, ref_std)[0, 1]), 4) if len(std) > 1 else None,
+        "label_flips": int(((mean >= 0.5) != (ref_mean >= 0.5)).sum()),
+    }
+
+
+def run_report(predictor, trials: list, n_samples: int = 1000, seed: int = 0) -> dict:
+    inputs = predictor.prepare_inputs(trials)
+    torch.manual_seed(seed)
+    reference, ref_seconds = _timed(predictor.predict_inputs, inputs, n_samples=n_samples)
+    report = {"trials": len(trials), "n_samples": n_samples, "mc_seconds": round(ref_seconds, 4), "modes": {}}
+    for mode in FAST_MODES:
+        # Warm-up: the first call builds the optimized model and the masks
+        predictor.predict_inputs(tuple(t[:1] for t in inputs), uncertainty_mode=mode)
+        results, seconds = _timed(predictor.predict_inputs, inputs, uncertainty_mode=mode)
+        report["modes"][mode] = {
+            **compare_uncertainty(reference, results),
+            "seconds": round(seconds, 4),
+            "speedup": round(ref_seconds / seconds, 1) if seconds else None,
+        }
+    return report
+
+
+def check_tolerances(report: dict, max_mean_diff: float, max_std_diff: float) -> list:
+    """
+    Returns a list of tolerance violations (empty if every mode passes).
+    """
+    failures = []
+    for mode, stats in report["modes"].items():
+        if stats["mean_max_abs_diff"] > max_mean_diff:
+            failures.append(f"{mode} mean max drift {stats['mean_max_abs_diff']} > {max_mean_diff}")
+        if stats["std_max_abs_diff"] > max_std_diff:
+            failures.append(f"{mode} std max drift {stats['std_max_abs_diff']} > {max_std_diff}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the fast uncertainty modes against MC dropout.")
+    parser.add_argument("source", help="Fixture study JSON / JSON Lines file or directory")
+    parser.add_argument("--model-path", default="app/models/model_weights.pth")
+    parser.add_argument("--n-samples", type=int, default=1000)
+    parser.add_argument("--max-mean-diff", type=float, default=0.02)
+    parser.add_argument("--max-std-diff", type=float, default=0.02)
+    args = parser.parse_args(argv)
+
+    from app.core.predict import TrialPredictor
+
+    studies = [study for _, _, study in iter_studies(list_study_files(args.source))]
+    trials = [t for t in preprocess_batch(studies) if not isinstance(t, Exception)]
+    predictor = TrialPredictor(model_path=args.model_path, device="cpu")
+
+    report = run_report(predictor, trials, n_samples=args.n_samples)
+    report["failures"] = check_tolerances(report, args.max_mean_diff, args.max_std_diff)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
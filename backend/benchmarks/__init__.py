@@ -0,0 +1,8 @@
+"""
+Stage-level micro-benchmarks for the prediction pipeline.
+
+    python -m benchmarks.run --mode stub --output results.json --save-baseline stub-cpu
+    python -m benchmarks.run --mode stub --output results.json --baseline stub-cpu
+
+See benchmarks/run.py for the stages and sweep options.
+"""
@@ -0,0 +1,111 @@
+"""
+Compare a benchmark results file against a stored baseline.
+
+    python -m benchmarks.compare stub-cpu results.json --threshold 0.10
+
+A measurement regresses when its median is more than threshold slower than
+the baseline. Exits non-zero on any regression, so it can gate upgrades, and
+also when the baseline is missing or shares no measurement with the run, so
+a gate never passes for lack of anything to compare.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.harness import load_results
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.10) -> dict:
+    """
+    Match measurements by key and classify each median ratio (current / baseline).
+    Returns:
+        Report dict with per-key rows, missing / new keys, regressions and
+        the environment fields that differ between the runs
+    """
+    base = {r["key"]: r for r in baseline["results"]}
+    cur = {r["key"]: r for r in current["results"]}
+
+    rows = []
+    for key in [k for k in cur if k in base]:
+        ratio = cur[key]["median_ms"] / base[key]["median_ms"] if base[key]["median_ms"] else float("inf")
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append({
+            "key": key,
+            "baseline_ms": base[key]["median_ms"],
+            "current_ms": cur[key]["median_ms"],
+            "ratio": round(ratio, 3),
+            "status": status,
+        })
+
+    base_env, cur_env = baseline.get("environment", {}), current.get("environment", {})
+    env_changes = {}
+    for field in ("mode", "machine", "cpu_count"):
+        if base_env.get(field) != cur_env.get(field):
+            env_changes[field] = [base_env.get(field), cur_env.get(field)]
+    for name, version in cur_env.get("versions", {}).items():
+        if base_env.get("versions", {}).get(name) != version:
+            env_changes[name] = [base_env.get("versions", {}).get(name), version]
+
+    return {
+        "threshold": threshold,
+        "rows": rows,
+        "regressions": [r["key"] for r in rows if r["status"] == "regression"],
+        "improvements": [r["key"] for r in rows if r["status"] == "improvement"],
+        "missing": [k for k in base if k not in cur],
+        "new": [k for k in cur if k not in base],
+        "environment_changes": env_changes,
+    }
+
+
+def format_report(report: dict) -> str:
+    width = max([len(r["key"]) for r in report["rows"]] + [10])
+    lines = [f"{'measurement':<{width}}  {'baseline ms':>12}  {'current ms':>12}  {'ratio':>7}  status"]
+    for r in report["rows"]:
+        lines.append(f"{r['key']:<{width}}  {r['baseline_ms']:>12.3f}  {r['current_ms']:>12.3f}  "
+                     f"{r['ratio']:>7.3f}  {r['status']}")
+    for name, (before, after) in report["environment_changes"].items():
+        lines.append(f"environment: {name} {before} -> {after}")
+    if report["missing"]:
+        lines.append(f"missing from current run: {len(report['missing'])}")
+    lines.append(f"{len(report['regressions'])} regressions, {len(report['improvements'])} improvements "
+                 f"(threshold {report['threshold']:.0%})")
+    return "\n".join(lines)
+
+
+def exit_status(report: dict) -> int:
+    """
+    1 on any regression; 2 when no measurement matched the baseline.
+    """
+    if not report["rows"]:
+        print("[benchmarks] No measurements in common with the baseline")
+        return 2
+    return 1 if report["regressions"] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare benchmark results against a baseline.")
+    parser.add_argument("baseline", help="Results file or stored baseline name")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed median slowdown (0.10 = 10%%)")
+    parser.add_argument("--json", default=None, help="Also write the report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    try:
+        baseline = load_results(args.baseline)
+    except FileNotFoundError as e:
+        sys.exit(f"[benchmarks] {e}")
+    report = compare(baseline, load_results(args.current), args.threshold)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(exit_status(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from typing import Callable, Dict, List
+
+# Results files carry this version; compare refuses mismatched schemas
+SCHEMA_VERSION = 1
+
+# Named baselines, e.g. benchmarks/baselines/stub-cpu.json
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def time_call(fn: Callable, warmup: int = 1, min_repeats: int = 3, max_repeats: int = 50,
+              min_seconds: float = 0.2) -> Dict[str, float]:
+    """
+    Time fn() after warmup calls, repeating until both min_repeats and
+    min_seconds are reached (or max_repeats).
+    Returns:
+        Timing summary in milliseconds
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_repeats:
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+        if len(samples) >= min_repeats and time.perf_counter() - started >= min_seconds:
+            break
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 4),
+        "p90_ms": round(samples[min(len(samples) - 1, int(0.9 * len(samples)))], 4),
+        "min_ms": round(samples[0], 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "repeats": len(samples),
+    }
+
+
+def result_key(stage: str, params: dict) -> str:
+    """
+    Stable identifier of one measurement, e.g. "mc_sample[batch_size=8,n_samples=100,threads=1]".
+    """
+    return f"{stage}[{','.join(f'{k}={params[k]}' for k in sorted(params))}]"
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def environment(mode: str) -> dict:
+    """
+    Library versions and machine facts recorded with every run; a comparison
+    across different environments is flagged in the report.
+    """
+    import numpy
+    import torch
+
+    versions = {"python": platform.python_version(), "numpy": numpy.__version__, "torch": torch.__version__}
+    for name in ("transformers", "sentence_transformers"):
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return {
+        "mode": mode,
+        "versions": versions,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_results(path: str, env: dict, results: List[dict]):
+    with open(path, "w") as f:
+        json.dump({"schema": SCHEMA_VERSION, "environment": env, "results": results}, f, indent=2)
+        f.write("\n")
+
+
+def baseline_path(name: str) -> str:
+    """
+    A results path, or the name of a stored baseline in BASELINES_DIR.
+    """
+    if os.path.exists(name) or name.endswith(".json"):
+        return name
+    return os.path.join(BASELINES_DIR, f"{name}.json")
+
+
+def load_results(path: str) -> dict:
+    """
+    Raises:
+        FileNotFoundError: if there is no such results file or stored baseline
+        ValueError: if the file was written with another schema version
+    """
+    path = baseline_path(path)
+    if not os.path.exists(path):
+        stored = sorted(name[:-len(".json")] for name in os.listdir(BASELINES_DIR) if name.endswith(".json"))
+        raise FileNotFoundError(
+            f"No benchmark results at {path} (stored baselines: {', '.join(stored) or 'none'}); "
+            f"record one with python -m benchmarks.run --save-baseline NAME"
+        )
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("schema") != SCHEMA_VERSION:
+        raise ValueError(f"{path} has schema {data.get('schema')}, expected {SCHEMA_VERSION}")
+    return data
@@ -0,0 +1,124 @@
+"""
+Run the stage benchmarks and write machine-readable results.
+
+    python -m benchmarks.run --mode stub --output results.json
+    python -m benchmarks.run --mode real --batch-sizes 1,16,64 --threads 1,4 \
+        --output results.json --baseline real-cpu
+
+Stages: parse_trial_json, preprocess_trial (and their columnar
+parse_trials / preprocess_trials), encode_sponsors, encode_diseases,
+encode_text_fields, model_forward, mc_sample and predict_batch, each timed on
+fixture study JSON over the batch-size sweep (and the n_samples sweep for the
+MC stages). torch stages are repeated for every thread count. Baselines
+are stored per machine with --save-baseline NAME (benchmarks/baselines/
+NAME.json) and compared with --baseline NAME or benchmarks.compare. Runs are
+offline: Hugging Face hub access is disabled, so --mode real needs the
+models in the local cache.
+"""
+import argparse
+import os
+import sys
+
+# Never reach out to the Hugging Face hub from a benchmark
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+def run_benchmarks(ctx, batch_sizes, n_samples_list, threads, stages=None, min_seconds: float = 0.2) -> list:
+    """
+    Time every selected stage over the sweep.
+    Returns:
+        List of result dicts (stage, params, key, timings, items_per_s)
+    """
+    import torch
+
+    from benchmarks.harness import result_key, time_call
+    from benchmarks.stages import STAGES
+
+    selected = [s for s in STAGES if stages is None or s.name in stages]
+    original_threads = torch.get_num_threads()
+    results = []
+    try:
+        for thread_idx, num_threads in enumerate(threads):
+            torch.set_num_threads(num_threads)
+            for stage in selected:
+                # Pure-Python stages do not depend on the torch thread count
+                if not stage.uses_torch and thread_idx > 0:
+                    continue
+                for batch_size in batch_sizes:
+                    for n_samples in (n_samples_list if stage.sampled else [None]):
+                        params = {"batch_size": batch_size}
+                        if stage.sampled:
+                            params["n_samples"] = n_samples
+                        if stage.uses_torch:
+                            params["threads"] = num_threads
+                        timing = time_call(stage.build(ctx, batch_size, n_samples), min_seconds=min_seconds)
+                        results.append({
+                            "stage": stage.name,
+                            "params": params,
+                            "key": result_key(stage.name, params),
+                            **timing,
+                            "items_per_s": round(batch_size / (timing["median_ms"] / 1000), 2),
+                        })
+                        print(f"[benchmarks] {results[-1]['key']}: {timing['median_ms']} ms")
+    finally:
+        torch.set_num_threads(original_threads)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stage-level prediction pipeline benchmarks.")
+    parser.add_argument("--mode", choices=["stub", "real"], default="stub",
+                        help="stub: deterministic stub encoders; real: cached transformer models")
+    parser.add_argument("--fixtures", default=None, help="Study JSON / JSON Lines file or directory")
+    parser.add_argument("--model-path", default="app/models/model_weights.pth", help="Weights for --mode real")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32])
+    parser.add_argument("--n-samples", type=_int_list, default=[100, 1000])
+    parser.add_argument("--threads", type=_int_list, default=None, help="torch thread counts (default: current)")
+    parser.add_argument("--stages", default=None, help="Comma-separated subset of stages")
+    parser.add_argument("--min-seconds", type=float, default=0.2, help="Minimum timed duration per measurement")
+    parser.add_argument("--output", required=True, help="Results JSON path")
+    parser.add_argument("--baseline", default=None, help="Compare against a results file or stored baseline name")
+    parser.add_argument("--save-baseline", default=None, help="Also store the results as this named baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed median slowdown (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    import torch
+
+    from benchmarks.compare import compare, exit_status, format_report
+    from benchmarks.harness import baseline_path, environment, load_results, write_results
+    from benchmarks.stages import DEFAULT_FIXTURES, PipelineContext
+
+    # Fail before the sweep, not after it, when the baseline does not exist
+    try:
+        baseline = load_results(args.baseline) if args.baseline else None
+    except FileNotFoundError as e:
+        sys.exit(f"[benchmarks] {e}")
+
+    ctx = PipelineContext(args.mode, fixtures=args.fixtures or DEFAULT_FIXTURES, model_path=args.model_path)
+    try:
+        results = run_benchmarks(
+            ctx, args.batch_sizes, args.n_samples, args.threads or [torch.get_num_threads()],
+            stages=args.stages.split(",") if args.stages else None, min_seconds=args.min_seconds,
+        )
+    finally:
+        ctx.close()
+    env = environment(args.mode)
+    write_results(args.output, env, results)
+    print(f"[benchmarks] Wrote {len(results)} results to {args.output}")
+    if args.save_baseline:
+        write_results(baseline_path(args.save_baseline), env, results)
+        print(f"[benchmarks] Stored baseline {baseline_path(args.save_baseline)}")
+
+    if baseline is not None:
+        report = compare(baseline, {"environment": env, "results": results}, args.threshold)
+        print(format_report(report))
+        sys.exit(exit_status(report))
+
+
+if __name__ == "__main__":
+    main()
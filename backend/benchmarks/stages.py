@@ -0,0 +1,127 @@
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Callable, List
+
+import torch
+
+from app.bulk_io import iter_studies, list_study_files
+from app.core.parsing import parse_trial_json, parse_trials
+from app.core.preprocessing import preprocess_trial, preprocess_trials
+from app.models.model import MultiInputNN
+from benchmarks.stubs import StubEmbedder
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "studies.jsonl")
+
+
+@dataclass
+class Stage:
+    name: str
+    # torch stages are repeated for every thread count in the sweep
+    uses_torch: bool
+    # whether the stage is also swept over n_samples
+    sampled: bool
+    # build(ctx, batch, n_samples) -> zero-argument callable to time
+    build: Callable
+
+
+class PipelineContext:
+    """
+    Fixture studies plus the predictor used by every stage. mode="stub" uses
+    StubEmbedder and seeded random MultiInputNN weights, so it needs no model
+    files; mode="real" loads the transformer models from the local Hugging
+    Face cache and the weights at model_path.
+    """
+
+    def __init__(self, mode: str, fixtures: str = DEFAULT_FIXTURES, model_path: str = "app/models/model_weights.pth"):
+        from app.core.predict import TrialPredictor
+
+        self.studies = [study for _, _, study in iter_studies(list_study_files(fixtures))]
+        if not self.studies:
+            raise ValueError(f"No fixture studies found in {fixtures}")
+        self.trials = [preprocess_trial(parse_trial_json(s)) for s in self.studies]
+
+        self._tmpdir = None
+        if mode == "stub":
+            torch.manual_seed(0)
+            model = MultiInputNN(sponsor_dim=384, disease_dim=768, text_dim=768, num_features=7)
+            self._tmpdir = tempfile.TemporaryDirectory()
+            model_path = os.path.join(self._tmpdir.name, "model_weights.pth")
+            torch.save(model.state_dict(), model_path)
+            embedder = StubEmbedder()
+        elif mode == "real":
+            embedder = None
+        else:
+            raise ValueError(f"Unknown benchmark mode '{mode}'")
+        self.predictor = TrialPredictor(model_path=model_path, device="cpu", embedder=embedder)
+
+    def batch(self, items: list, size: int) -> list:
+        # Cycle the fixtures to fill batches larger than the fixture set
+        return [items[i % len(items)] for i in range(size)]
+
+    def close(self):
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
+
+def _parse(ctx, size, _):
+    studies = ctx.batch(ctx.studies, size)
+    return lambda: [parse_trial_json(s) for s in studies]
+
+
+def _preprocess(ctx, size, _):
+    parsed = [parse_trial_json(s) for s in ctx.batch(ctx.studies, size)]
+    return lambda: [preprocess_trial(p) for p in parsed]
+
+
+def _parse_columnar(ctx, size, _):
+    studies = ctx.batch(ctx.studies, size)
+    return lambda: parse_trials(studies)
+
+
+def _preprocess_columnar(ctx, size, _):
+    parsed = parse_trials(ctx.batch(ctx.studies, size))
+    return lambda: preprocess_trials(parsed)
+
+
+def _encode(method: str, field: str):
+    def build(ctx, size, _):
+        texts = [t[field] for t in ctx.batch(ctx.trials, size)]
+        return lambda: getattr(ctx.predictor.embedder, method)(texts)
+    return build
+
+
+def _forward(ctx, size, _):
+    inputs = ctx.predictor.prepare_inputs(ctx.batch(ctx.trials, size))
+    model = ctx.predictor.model
+
+    def run():
+        model.eval()
+        with torch.no_grad():
+            return model(*inputs)
+    return run
+
+
+def _mc_sample(ctx, size, n_samples):
+    inputs = ctx.predictor.prepare_inputs(ctx.batch(ctx.trials, size))
+    return lambda: ctx.predictor.mc_sample(inputs, n_samples)
+
+
+def _predict_batch(ctx, size, n_samples):
+    trials = ctx.batch(ctx.trials, size)
+    return lambda: ctx.predictor.predict_batch(trials, n_samples=n_samples)
+
+
+STAGES: List[Stage] = [
+    Stage("parse_trial_json", uses_torch=False, sampled=False, build=_parse),
+    Stage("preprocess_trial", uses_torch=False, sampled=False, build=_preprocess),
+    Stage("parse_trials", uses_torch=False, sampled=False, build=_parse_columnar),
+    Stage("preprocess_trials", uses_torch=False, sampled=False, build=_preprocess_columnar),
+    Stage("encode_sponsors", uses_torch=True, sampled=False, build=_encode("encode_sponsors", "sponsor")),
+    Stage("encode_diseases", uses_torch=True, sampled=False, build=_encode("encode_diseases", "diseases")),
+    Stage("encode_text_fields", uses_torch=True, sampled=False,
+          build=_encode("encode_text_fields", "inclusion_criteria")),
+    Stage("model_forward", uses_torch=True, sampled=False, build=_forward),
+    Stage("mc_sample", uses_torch=True, sampled=True, build=_mc_sample),
+    Stage("predict_batch", uses_torch=True, sampled=True, build=_predict_batch),
+]
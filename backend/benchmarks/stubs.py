@@ -0,0 +1,44 @@
+"""
+Offline stand-ins for the transformer encoders, shared by the stub-mode
+benchmarks and the test suite.
+"""
+import hashlib
+
+import numpy as np
+
+from app.core.generate_embeddings import TrialEmbedder
+
+
+class StubEmbedder(TrialEmbedder):
+    """
+    Deterministic stand-in for TrialEmbedder: vectors are seeded from the
+    text, so nothing is downloaded and the stub benchmarks isolate our own
+    code from model cost. Only the raw _embed_* calls are replaced, so
+    caching and the encode_* wrappers run as in the real embedder.
+    """
+
+    def __init__(self, device=None, batch_size=64, cache=None, on_progress=None, backend="fp32"):
+        self.device = device
+        self.backend = backend
+        self.batch_size = batch_size
+        self.cache = cache
+
+    def _embed(self, texts, dim):
+        rows = []
+        for text in texts:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            rows.append(np.random.default_rng(seed).standard_normal(dim).astype(np.float32))
+        return np.vstack(rows) if rows else np.empty((0, dim), dtype=np.float32)
+
+    def _embed_sponsors(self, sponsor_names):
+        return self._embed(sponsor_names, 384)
+
+    def _embed_text_fields(self, texts):
+        return self._embed(texts, 768)
+
+    def _embed_diseases(self, diseases):
+        return self._embed(diseases, 768)
+
+    def encoder_info(self):
+        return {"sponsor": {"model": "stub", "revision": None}, "text": {"model": "stub", "revision": None},
+                "disease": {"model": "stub", "revision": None}, "backend": self.backend}
@@ -0,0 +1,65 @@
+import pytest
+import torch
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import benchmarks.stubs
+from app.models.model import MultiInputNN
+
+
+class StubEmbedder(benchmarks.stubs.StubEmbedder):
+    """
+    benchmarks.stubs.StubEmbedder that records every encode call in calls.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def encode_sponsors(self, sponsor_names):
+        self.calls.append(("sponsor", list(sponsor_names)))
+        return super().encode_sponsors(sponsor_names)
+
+    def encode_diseases(self, diseases):
+        self.calls.append(("disease", list(diseases)))
+        return super().encode_diseases(diseases)
+
+    def encode_text_fields(self, texts):
+        self.calls.append(("text", list(texts)))
+        return super().encode_text_fields(texts)
+
+
+@pytest.fixture
+def model_weights(tmp_path):
+    torch.manual_seed(0)
+    model = MultiInputNN(sponsor_dim=384, disease_dim=768, text_dim=768, num_features=7)
+    # Non-trivial running stats so BatchNorm is exercised in eval mode
+    for m in model.modules():
+        if isinstance(m, torch.nn.BatchNorm1d):
+            m.running_mean.uniform_(-0.5, 0.5)
+            m.running_var.uniform_(0.5, 1.5)
+    path = tmp_path / "model_weights.pth"
+    torch.save(model.state_dict(), path)
+    return str(path)
+
+
+@pytest.fixture
+def stub_predictor(monkeypatch, model_weights):
+    from app.core import predict
+
+    monkeypatch.setattr(predict, "TrialEmbedder", StubEmbedder)
+    return predict.TrialPredictor(model_path=model_weights, device="cpu")
+
+
+@pytest.fixture
+def prepped_trial():
+    return {
+        "sponsor": "Pfizer",
+        "diseases": "Diabetes",
+        "inclusion_criteria": "Patients must be over 18 years old.",
+        "exclusion_criteria": "No recent heart attack.",
+        "description": "A trial evaluating a new insulin delivery method.",
+        "phase": "phase 2"
+    }
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.admission import (APPROXIMATE, DETERMINISTIC, FULL, REDUCED, STALE, AdmissionController, Deadline,
+                                DeadlineExceeded, Overloaded, parse_deadline, within)
+from app.core.batching import MicroBatcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_deadline():
+    clock = FakeClock()
+    assert parse_deadline("250", 30000, clock=clock).remaining() == 0.25
+    assert parse_deadline(None, 30000, clock=clock).remaining() == 30.0
+    assert parse_deadline(None, 0, clock=clock).remaining() is None
+    with pytest.raises(ValueError):
+        parse_deadline("soon", 30000)
+
+
+def test_cost_estimate_skips_levels_that_cannot_meet_the_deadline():
+    clock = FakeClock()
+    controller = AdmissionController(clock=clock, half_life=10)
+    controller.observe(FULL, 2.0)
+    controller.observe(REDUCED, 0.5)
+    assert controller.choose_level(Deadline(5.0, clock=clock)) == FULL
+    assert controller.choose_level(Deadline(1.0, clock=clock)) == REDUCED
+    assert controller.choose_level(Deadline(0.1, clock=clock)) == APPROXIMATE
+    assert controller.choose_level(Deadline(clock=clock)) == FULL
+    # When no computed answer fits the budget, only a cached result can be served
+    controller.observe(APPROXIMATE, 0.2)
+    controller.observe(DETERMINISTIC, 0.05)
+    assert controller.choose_level(Deadline(0.1, clock=clock)) == DETERMINISTIC
+    assert controller.choose_level(Deadline(0.01, clock=clock)) == STALE
+    # An old estimate decays, so the full level is tried again
+    clock.now = 20.0
+    assert controller.cost(FULL) == pytest.approx(0.5)
+    assert controller.choose_level(Deadline(1.0, clock=clock)) == FULL
+
+
+def test_queue_pressure_degrades_then_rejects():
+    controller = AdmissionController(max_concurrency=1, max_queue=4)
+
+    async def main():
+        release = asyncio.Event()
+        levels = []
+
+        async def request():
+            async with controller.admit(Deadline()) as admitted:
+                levels.append(admitted.level)
+                await release.wait()
+
+        tasks = [asyncio.create_task(request()) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        assert controller.stats()["running"] == 1 and controller.stats()["waiting"] == 4
+        with pytest.raises(Overloaded) as rejected:
+            async with controller.admit(Deadline()):
+                pass
+        assert rejected.value.retry_after >= 1
+        release.set()
+        await asyncio.gather(*tasks)
+        return levels
+
+    levels = asyncio.run(main())
+    # Each slot goes to the oldest waiter; the queue drains as it is served
+    assert levels == [FULL, DETERMINISTIC, APPROXIMATE, REDUCED, FULL]
+    stats = controller.stats()
+    assert stats["running"] == 0 and stats["rejected"] == 1
+    assert sum(stats["admitted"].values()) == 5
+
+
+def test_deadline_expires_in_queue():
+    controller = AdmissionController(max_concurrency=1, max_queue=4)
+
+    async def main():
+        async with controller.admit(Deadline()):
+            with pytest.raises(DeadlineExceeded):
+                async with controller.admit(Deadline(0.01)):
+                    pass
+            assert controller.stats()["waiting"] == 0
+        async with controller.admit(Deadline(5.0)) as admitted:
+            return admitted.level
+
+    assert asyncio.run(main()) == FULL
+    assert controller.stats()["expired"] == 1
+    assert controller.stats()["running"] == 0
+
+
+def test_within_cancels_slow_stage():
+    async def main():
+        with pytest.raises(DeadlineExceeded):
+            await within(Deadline(0.01), asyncio.sleep(1), "fetch")
+        return await within(Deadline(1.0), asyncio.sleep(0, result="ok"), "fetch")
+
+    assert asyncio.run(main()) == "ok"
+
+
+def test_batcher_drops_expired_requests():
+    scored = []
+
+    def predict_batch(trials, n_samples=20):
+        scored.extend(t["id"] for t in trials)
+        return [{"id": t["id"]} for t in trials]
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=8, max_wait_ms=20)
+    expired = Deadline(0.0)
+
+    async def main():
+        try:
+            return await asyncio.gather(batcher.submit({"id": 1}, 10, deadline=expired),
+                                        batcher.submit({"id": 2}, 10, deadline=Deadline(5.0)),
+                                        return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(main())
+    assert isinstance(results[0], DeadlineExceeded)
+    assert results[1] == {"id": 2}
+    assert scored == [2]
+    assert batcher.stats()["expired"] == 1
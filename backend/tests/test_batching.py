@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.batching import MicroBatcher
+
+
+class RecordingPredictor:
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def predict_batch(self, trials, n_samples=20):
+        self.batches.append(([t["id"] for t in trials], n_samples))
+        if any(t["id"] == self.fail_on for t in trials):
+            raise ValueError(f"bad trial {self.fail_on}")
+        return [{"id": t["id"], "n_samples": n_samples} for t in trials]
+
+
+def _submit_all(batcher, requests):
+    async def main():
+        try:
+            return await asyncio.gather(
+                *(batcher.submit({"id": i}, n) for i, n in requests), return_exceptions=True
+            )
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_batch():
+    predictor = RecordingPredictor()
+    batcher = MicroBatcher(predictor.predict_batch, max_batch_size=8, max_wait_ms=50)
+    results = _submit_all(batcher, [(i, 10) for i in range(5)])
+
+    assert [r["id"] for r in results] == list(range(5))
+    assert predictor.batches == [([0, 1, 2, 3, 4], 10)]
+    stats = batcher.stats()
+    assert stats["batches"] == 1
+    assert stats["batch_size_histogram"] == {"le_8": 1}
+
+
+def test_max_batch_size_splits_batches():
+    predictor = RecordingPredictor()
+    batcher = MicroBatcher(predictor.predict_batch, max_batch_size=2, max_wait_ms=50)
+    _submit_all(batcher, [(i, 10) for i in range(5)])
+    assert [len(ids) for ids, _ in predictor.batches] == [2, 2, 1]
+
+
+def test_groups_by_sample_count():
+    predictor = RecordingPredictor()
+    batcher = MicroBatcher(predictor.predict_batch, max_batch_size=8, max_wait_ms=50)
+    results = _submit_all(batcher, [(0, 10), (1, 20), (2, 10)])
+    assert [r["n_samples"] for r in results] == [10, 20, 10]
+    assert sorted(predictor.batches) == [([0, 2], 10), ([1], 20)]
+
+
+def test_failing_trial_is_isolated():
+    predictor = RecordingPredictor(fail_on=1)
+    batcher = MicroBatcher(predictor.predict_batch, max_batch_size=8, max_wait_ms=50)
+    results = _submit_all(batcher, [(i, 10) for i in range(3)])
+    assert results[0]["id"] == 0
+    assert isinstance(results[1], ValueError)
+    assert results[2]["id"] == 2
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.compare import compare, format_report, main as compare_main
+from benchmarks.harness import load_results, result_key, write_results
+from benchmarks.run import run_benchmarks
+from benchmarks.stages import PipelineContext
+
+
+@pytest.fixture(scope="module")
+def stub_context():
+    ctx = PipelineContext("stub")
+    yield ctx
+    ctx.close()
+
+
+def test_stub_sweep_covers_stages_and_params(stub_context):
+    results = run_benchmarks(stub_context, batch_sizes=[1, 4], n_samples_list=[8], threads=[1, 2],
+                             min_seconds=0)
+    keys = {r["key"] for r in results}
+
+    # Pure-Python stages run once; torch stages once per thread count
+    assert "parse_trial_json[batch_size=4]" in keys
+    assert "parse_trial_json[batch_size=4,threads=2]" not in keys
+    assert "encode_diseases[batch_size=4,threads=2]" in keys
+    assert "mc_sample[batch_size=1,n_samples=8,threads=1]" in keys
+    assert "preprocess_trials[batch_size=4]" in keys
+    assert len(results) == 4 * 2 + 6 * 2 * 2
+    assert all(r["median_ms"] > 0 and r["items_per_s"] > 0 for r in results)
+
+
+def test_compare_flags_regressions(tmp_path):
+    def run(median):
+        return [{"stage": "mc_sample", "params": {"batch_size": 1}, "key": result_key("mc_sample", {"batch_size": 1}),
+                 "median_ms": median}]
+
+    env = {"mode": "stub", "versions": {"torch": "2.7.1"}}
+    write_results(str(tmp_path / "base.json"), env, run(10.0))
+    baseline = load_results(str(tmp_path / "base.json"))
+
+    report = compare(baseline, {"environment": {**env, "versions": {"torch": "2.8.0"}}, "results": run(12.0)})
+    assert report["regressions"] == ["mc_sample[batch_size=1]"]
+    assert report["environment_changes"] == {"torch": ["2.7.1", "2.8.0"]}
+    assert "1 regressions" in format_report(report)
+
+    assert compare(baseline, {"environment": env, "results": run(10.5)})["regressions"] == []
+    assert compare(baseline, {"environment": env, "results": run(5.0)})["improvements"] == ["mc_sample[batch_size=1]"]
+
+    with open(tmp_path / "old.json", "w") as f:
+        json.dump({"schema": 0, "results": []}, f)
+    with pytest.raises(ValueError):
+        load_results(str(tmp_path / "old.json"))
+
+
+def test_compare_fails_loudly_without_a_baseline(tmp_path):
+    write_results(str(tmp_path / "current.json"), {"mode": "stub"},
+                  [{"stage": "mc_sample", "params": {}, "key": "mc_sample", "median_ms": 1.0}])
+    with pytest.raises(SystemExit) as missing:
+        compare_main(["no-such-baseline", str(tmp_path / "current.json")])
+    assert "No benchmark results" in str(missing.value.code)
+
+    write_results(str(tmp_path / "other.json"), {"mode": "stub"},
+                  [{"stage": "parse", "params": {}, "key": "parse", "median_ms": 1.0}])
+    with pytest.raises(SystemExit) as disjoint:
+        compare_main([str(tmp_path / "other.json"), str(tmp_path / "current.json")])
+    assert disjoint.value.code == 2
+
@@ -0,0 +1,103 @@
+import csv
+import gzip
+import json
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import bulk_score
+from app.bulk_score import iter_studies, list_study_files, score_dump
+
+
+def _study(nctid, phase="Phase 2"):
+    return {
+        "protocolSection": {
+            "identificationModule": {"nctId": nctid},
+            "sponsorCollaboratorsModule": {"leadSponsor": {"name": f"Sponsor {nctid}"}},
+            "descriptionModule": {"briefSummary": f"Summary of {nctid}"},
+            "eligibilityModule": {"eligibilityCriteria": "Inclusion: Adults. Exclusion: Children."},
+            "conditionsModule": {"conditions": ["Asthma"]},
+            "designModule": {"phases": [phase]}
+        }
+    }
+
+
+@pytest.fixture
+def dump_dir(tmp_path):
+    root = tmp_path / "dump"
+    (root / "a").mkdir(parents=True)
+    for i in range(3):
+        with open(root / "a" / f"NCT0{i}.json", "w") as f:
+            json.dump(_study(f"NCT0{i}"), f)
+    with gzip.open(root / "b.jsonl.gz", "wt") as f:
+        for i in range(3, 8):
+            f.write(json.dumps(_study(f"NCT0{i}")) + "\n")
+    with open(root / "page.json", "w") as f:
+        json.dump({"studies": [_study("NCT08"), _study("NCT09")]}, f)
+    return str(root)
+
+
+def _read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_iter_studies_formats_and_resume_position(dump_dir):
+    files = list_study_files(dump_dir)
+    nctids = [s["protocolSection"]["identificationModule"]["nctId"] for _, _, s in iter_studies(files)]
+    assert sorted(nctids) == [f"NCT0{i}" for i in range(10)]
+
+    all_records = list(iter_studies(files))
+    file_idx, record_idx, _ = all_records[4]
+    resumed = list(iter_studies(files, (file_idx, record_idx)))
+    assert [s for _, _, s in resumed] == [s for _, _, s in all_records[4:]]
+
+
+def test_score_dump_writes_csv(dump_dir, tmp_path, stub_predictor):
+    output = str(tmp_path / "scores.csv")
+    assert score_dump(dump_dir, output, stub_predictor, batch_size=4, n_samples=5) == 10
+
+    rows = _read_csv(output)
+    assert len(rows) == 10
+    assert all(0.0 <= float(r["probability"]) <= 1.0 for r in rows)
+    assert {r["phase"] for r in rows} == {"phase 2"}
+
+
+def test_score_dump_resumes_after_interruption(dump_dir, tmp_path, stub_predictor, monkeypatch):
+    output = str(tmp_path / "scores.csv")
+    real_score_batch = bulk_score._score_batch
+    calls = []
+
+    def flaky_score_batch(predictor, studies, n_samples, adaptive=None):
+        calls.append(len(studies))
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return real_score_batch(predictor, studies, n_samples, adaptive)
+
+    monkeypatch.setattr(bulk_score, "_score_batch", flaky_score_batch)
+    with pytest.raises(KeyboardInterrupt):
+        score_dump(dump_dir, output, stub_predictor, batch_size=4, n_samples=5)
+    assert len(_read_csv(output)) == 4
+
+    monkeypatch.setattr(bulk_score, "_score_batch", real_score_batch)
+    assert score_dump(dump_dir, output, stub_predictor, batch_size=4, n_samples=5) == 6
+
+    nctids = [r["nctid"] for r in _read_csv(output)]
+    assert sorted(nctids) == [f"NCT0{i}" for i in range(10)]
+
+
+def test_score_dump_isolates_bad_studies(tmp_path, stub_predictor):
+    source = tmp_path / "bad.jsonl"
+    with open(source, "w") as f:
+        f.write(json.dumps(_study("NCTOK")) + "\n")
+        f.write(json.dumps({"protocolSection": {"identificationModule": {"nctId": "NCTBAD"},
+                                                "conditionsModule": {"conditions": [1]}}}) + "\n")
+    output = str(tmp_path / "scores.csv")
+    score_dump(str(source), output, stub_predictor, n_samples=5)
+
+    rows = {r["nctid"]: r for r in _read_csv(output)}
+    assert rows["NCTOK"]["error"] == ""
+    assert rows["NCTBAD"]["error"]
@@ -5,7 +5,7 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.services.clinicaltrials_api import fetch_nctid_data
+from app.services.clinicaltrials_api import fetch_nctid_data, fetch_nctid_version, study_version
 
 
 def test_fetch_nctid_data_success():
@@ -29,4 +29,22 @@ def test_fetch_nctid_data_failure():
         mock_get.return_value = mock_resp
 
         with pytest.raises(Exception, match="ClinicalTrials.gov API returned status 404"):
-            fetch_nctid_data("INVALID_ID")
\ No newline at end of file
+            fetch_nctid_data("INVALID_ID")
+
+def test_study_version():
+    data = {"protocolSection": {"statusModule": {"lastUpdatePostDateStruct": {"date": "2024-05-01"}}}}
+    assert study_version(data) == "2024-05-01"
+    assert study_version({}) == ""
+
+
+def test_fetch_nctid_version_requests_only_version_fields():
+    dummy_response = {"protocolSection": {"statusModule": {"lastUpdatePostDateStruct": {"date": "2024-05-01"}}}}
+
+    with patch("app.services.clinicaltrials_api.requests.get") as mock_get:
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.json.return_value = dummy_response
+        mock_get.return_value = mock_resp
+
+        assert fetch_nctid_version("NCT00000172") == "2024-05-01"
+        assert "fields" in mock_get.call_args.kwargs["params"]
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.clinicaltrials_async import AsyncClinicalTrialsClient
+
+
+class StubAPI:
+    """
+    Local stand-in for the ClinicalTrials.gov v2 API. Each path maps to a list
+    of (status, headers, body) responses served in order; the last one repeats.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.hits = []
+        self.delay = 0.0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits.append(self.path)
+                time.sleep(stub.delay)
+                path = self.path.split("?")[0]
+                responses = stub.routes.get(path, [(404, {}, {})])
+                status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/api/v2"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_api():
+    api = StubAPI()
+    yield api
+    api.close()
+
+
+def _client(stub_api, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return AsyncClinicalTrialsClient(base_url=stub_api.base_url, **kwargs)
+
+
+def _run(client, coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def test_fetch_study_success(stub_api):
+    stub_api.routes["/api/v2/studies/NCT1"] = [(200, {}, {"protocolSection": {"x": 1}})]
+    client = _client(stub_api)
+    assert _run(client, client.fetch_study("NCT1")) == {"protocolSection": {"x": 1}}
+
+
+def test_fetch_study_not_found_is_not_retried(stub_api):
+    client = _client(stub_api)
+    with pytest.raises(Exception, match="returned status 404"):
+        _run(client, client.fetch_study("NCTMISSING"))
+    assert len(stub_api.hits) == 1
+
+
+def test_retries_429_with_retry_after(stub_api):
+    stub_api.routes["/api/v2/studies/NCT1"] = [
+        (429, {"Retry-After": "0"}, {}),
+        (503, {}, {}),
+        (200, {}, {"ok": True}),
+    ]
+    client = _client(stub_api)
+    assert _run(client, client.fetch_study("NCT1")) == {"ok": True}
+    assert len(stub_api.hits) == 3
+
+
+def test_retry_after_is_honoured_past_backoff_max(stub_api):
+    client = _client(stub_api, backoff_max=0.05, retry_after_max=30.0)
+    assert client._retry_delay(0, httpx.Response(429, headers={"Retry-After": "10"})) == 10.0
+    assert client._retry_delay(0, httpx.Response(429, headers={"Retry-After": "600"})) == 30.0
+    assert client._retry_delay(5, httpx.Response(503)) <= 0.05
+
+
+def test_stale_session_is_closed_on_new_loop(stub_api):
+    stub_api.routes["/api/v2/studies/NCT1"] = [(200, {}, {"ok": True})]
+    client = _client(stub_api)
+    assert asyncio.run(client.fetch_study("NCT1")) == {"ok": True}
+    first = client._client
+    assert _run(client, client.fetch_study("NCT1")) == {"ok": True}
+    assert first.is_closed
+
+
+def test_gives_up_after_max_retries(stub_api):
+    stub_api.routes["/api/v2/studies/NCT1"] = [(500, {}, {})]
+    client = _client(stub_api, max_retries=2)
+    with pytest.raises(Exception, match="returned status 500"):
+        _run(client, client.fetch_study("NCT1"))
+    assert len(stub_api.hits) == 3
+
+
+def test_concurrent_fetches_are_coalesced(stub_api):
+    stub_api.routes["/api/v2/studies/NCT1"] = [(200, {}, {"ok": True})]
+    stub_api.delay = 0.2
+    client = _client(stub_api)
+
+    async def fetch_all():
+        return await asyncio.gather(*(client.fetch_study("NCT1") for _ in range(5)))
+
+    results = _run(client, fetch_all())
+    assert results == [{"ok": True}] * 5
+    assert len(stub_api.hits) == 1
+    assert client.coalesced == 4
+
+
+def test_fetch_version_and_many(stub_api):
+    stub_api.routes["/api/v2/studies/NCT1"] = [
+        (200, {}, {"protocolSection": {"statusModule": {"lastUpdatePostDateStruct": {"date": "2024-05-01"}}}})
+    ]
+    client = _client(stub_api)
+    assert _run(client, client.fetch_version("NCT1")) == "2024-05-01"
+    assert "fields=" in stub_api.hits[0]
+
+    results = _run(client, client.fetch_many(["NCT1", "NCT2"]))
+    assert isinstance(results[0], dict)
+    assert isinstance(results[1], Exception)
+
+
+def test_timeout_raises(stub_api):
+    stub_api.routes["/api/v2/studies/NCT1"] = [(200, {}, {})]
+    stub_api.delay = 0.5
+    client = _client(stub_api, timeout=0.1, max_retries=0)
+    with pytest.raises(Exception, match="request failed"):
+        _run(client, client.fetch_study("NCT1"))
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import torch
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.bulk_io import iter_studies, list_study_files
+from app.core.inference_backend import check_backend, quantize_linear
+from app.core.parsing import parse_trial_json
+from app.core.preprocessing import preprocess_trial
+from app.drift_check import check_tolerances, compare_probabilities, run_drift_check
+from conftest import StubEmbedder
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "studies.jsonl")
+
+
+class NoisyEmbedder(StubEmbedder):
+    """
+    Stands in for a lower-precision backend: the reference vectors plus noise.
+    """
+
+    def _embed(self, texts, dim):
+        clean = super()._embed(texts, dim)
+        return clean + np.random.default_rng(0).normal(0, 0.01, clean.shape).astype(np.float32)
+
+
+@pytest.fixture
+def fixture_trials():
+    return [preprocess_trial(parse_trial_json(s)) for _, _, s in iter_studies(list_study_files(FIXTURES))]
+
+
+def test_check_backend():
+    assert check_backend("int8") == "int8"
+    with pytest.raises(ValueError):
+        check_backend("fp8")
+
+
+def test_quantize_linear_stays_close_to_fp32():
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.ReLU(), torch.nn.Linear(64, 8)).eval()
+    x = torch.randn(16, 64)
+    reference = model(x)
+    quantized = quantize_linear(model)
+    assert not any(type(m) is torch.nn.Linear for m in quantized.modules())
+    assert torch.allclose(quantized(x), reference, atol=0.05)
+
+
+def test_compare_probabilities_counts_label_flips():
+    report = compare_probabilities(np.array([0.49, 0.8]), np.array([0.51, 0.8]))
+    assert report["label_flips"] == 1
+    assert report["max_abs_diff"] == pytest.approx(0.02)
+
+
+def test_drift_check_report(stub_predictor, fixture_trials, model_weights):
+    from app.core.predict import TrialPredictor
+
+    candidate = TrialPredictor(model_path=model_weights, device="cpu", embedder=NoisyEmbedder())
+    report = run_drift_check(fixture_trials, stub_predictor, candidate, n_samples=50)
+
+    assert report["trials"] == 8
+    # One pass per encoder field, not one for the comparison and another for scoring
+    assert [kind for kind, _ in candidate.embedder.calls].count("sponsor") == 1
+    assert 0.99 < report["embeddings"]["summary"]["min_cosine"] < 1.0
+    assert check_tolerances(report, min_cosine=0.9, max_prob_drift=0.5) == []
+    assert check_tolerances(report, min_cosine=0.99999, max_prob_drift=0.5)
+
+    identical = run_drift_check(fixture_trials, stub_predictor, stub_predictor, n_samples=50)
+    assert identical["mc_probability"]["max_abs_diff"] == 0.0
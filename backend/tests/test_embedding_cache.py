@@ -0,0 +1,80 @@
+import pytest
+import numpy as np
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.embedding_cache import EmbeddingCache, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text("  Breast   Cancer\n") == "Breast Cancer"
+    assert normalize_text(None) == ""
+
+
+def test_lru_hits_misses_and_eviction():
+    cache = EmbeddingCache(max_entries=2)
+    assert cache.get_many("m", ["a"]) == [None]
+
+    cache.put_many("m", ["a", "b", "c"], np.eye(3, dtype=np.float32))
+    a, c = cache.get_many("m", ["a", "c"])
+    assert a is None  # evicted
+    np.testing.assert_array_equal(c, [0, 0, 1])
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["entries"] == 2
+
+
+def test_keys_are_per_model_and_whitespace_insensitive():
+    cache = EmbeddingCache()
+    cache.put_many("sponsor", ["Pfizer"], np.ones((1, 4)))
+    assert cache.get_many("text", ["Pfizer"]) == [None]
+    assert cache.get_many("sponsor", [" Pfizer  "])[0] is not None
+
+
+def test_disk_tier_persists(tmp_path):
+    vectors = np.random.rand(3, 8).astype(np.float32)
+    cache = EmbeddingCache(cache_dir=str(tmp_path))
+    cache.put_many("org/model", ["x", "y", "x"], vectors)
+
+    reloaded = EmbeddingCache(cache_dir=str(tmp_path))
+    x, y, z = reloaded.get_many("org/model", ["x", "y", "z"])
+    np.testing.assert_array_equal(x, vectors[0])
+    np.testing.assert_array_equal(y, vectors[1])
+    assert z is None
+    assert reloaded.stats()["disk_hits"] == 2
+
+
+def test_disk_tier_rows_follow_the_vectors_file_after_a_crash(tmp_path):
+    vectors = np.random.rand(4, 8).astype(np.float32)
+    EmbeddingCache(cache_dir=str(tmp_path)).put_many("m", ["a", "b"], vectors[:2])
+    tier = tmp_path / "m"
+    # Killed mid-write: half a row appended, and an index line for a row never written
+    with open(tier / "vectors.f32", "ab") as f:
+        f.write(vectors[2].tobytes()[:12])
+    with open(tier / "index.tsv", "a") as f:
+        f.write("deadbeef\t2\nhalf-a-li")
+
+    cache = EmbeddingCache(cache_dir=str(tmp_path))
+    cache.put_many("m", ["c", "d"], vectors[2:])
+    a, b, c, d = EmbeddingCache(cache_dir=str(tmp_path)).get_many("m", ["a", "b", "c", "d"])
+    for got, expected in zip((a, b, c, d), vectors):
+        np.testing.assert_array_equal(got, expected)
+
+
+def test_disk_tier_shared_by_two_writers(tmp_path):
+    vectors = np.random.rand(4, 8).astype(np.float32)
+    first, second = EmbeddingCache(cache_dir=str(tmp_path)), EmbeddingCache(cache_dir=str(tmp_path))
+    first.put_many("m", ["a", "b"], vectors[:2])
+    second.put_many("m", ["c", "a"], vectors[[2, 0]])
+    # Each writer numbers its rows after the other's, and sees the other's keys
+    assert os.path.getsize(tmp_path / "m" / "vectors.f32") == 3 * 8 * 4
+    c, = first.get_many("m", ["c"])
+    np.testing.assert_array_equal(c, vectors[2])
+    b, = second.get_many("m", ["b"])
+    np.testing.assert_array_equal(b, vectors[1])
+    a, b, c = EmbeddingCache(cache_dir=str(tmp_path)).get_many("m", ["a", "b", "c"])
+    np.testing.assert_array_equal(np.stack([a, b, c]), vectors[:3])
@@ -0,0 +1,79 @@
+import pytest
+import torch
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.ensemble import EnsemblePredictor
+from app.core.predict import TrialPredictor
+from app.models.model import MultiInputNN
+from conftest import StubEmbedder
+
+
+def _checkpoint(path, seed):
+    torch.manual_seed(seed)
+    model = MultiInputNN(sponsor_dim=384, disease_dim=768, text_dim=768, num_features=7)
+    for m in model.modules():
+        if isinstance(m, torch.nn.BatchNorm1d):
+            m.running_mean.uniform_(-0.5, 0.5)
+            m.running_var.uniform_(0.5, 1.5)
+    torch.save(model.state_dict(), path)
+    return str(path)
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    root = tmp_path / "ensemble"
+    root.mkdir()
+    _checkpoint(root / "a.pth", 1)
+    _checkpoint(root / "b.pth", 2)
+    (root / "notes.txt").write_text("not a checkpoint")
+    return root
+
+
+def test_members_match_single_model_predictors(model_dir, prepped_trial):
+    embedder = StubEmbedder()
+    ensemble = EnsemblePredictor(str(model_dir), device="cpu", embedder=embedder)
+    assert ensemble.members == ["a", "b"]
+
+    other = dict(prepped_trial, sponsor="Moderna", phase="phase 3")
+    results = ensemble.predict_batch([prepped_trial, other], n_samples=50)
+    # One embedding pass for the whole batch, however many members
+    assert [field for field, _ in embedder.calls] == ["sponsor", "disease", "text", "text", "text"]
+
+    for name in ("a", "b"):
+        single = TrialPredictor(model_path=str(model_dir / f"{name}.pth"), device="cpu", embedder=StubEmbedder())
+        expected = single.predict_batch([prepped_trial, other], n_samples=1)
+        for result, reference in zip(results, expected):
+            assert result["models"][name]["deterministic"] == pytest.approx(reference["deterministic"], abs=1e-4)
+            assert result["models"][name]["n_samples_used"] == 50
+    for result in results:
+        members = result["models"].values()
+        assert result["deterministic"] == pytest.approx(sum(m["deterministic"] for m in members) / 2, abs=1e-4)
+        assert result["probability"] == pytest.approx(sum(m["probability"] for m in members) / 2, abs=1e-4)
+        assert result["uncertainty"] > 0
+    assert ensemble.predict(prepped_trial)["probability"] == pytest.approx(results[0]["deterministic"], abs=1e-4)
+
+
+def test_hot_loads_added_changed_and_removed_checkpoints(model_dir, prepped_trial):
+    ensemble = EnsemblePredictor(str(model_dir), device="cpu", embedder=StubEmbedder(), refresh_interval=3600)
+    checksum = ensemble.weights_checksum
+    assert not ensemble.refresh()
+
+    _checkpoint(model_dir / "c.pth", 3)
+    (model_dir / "broken.pth").write_bytes(b"partial upload")
+    assert ensemble.refresh()
+    assert ensemble.members == ["a", "b", "c"]
+    assert ensemble.weights_checksum != checksum
+    assert set(ensemble.predict_batch([prepped_trial], n_samples=4)[0]["models"]) == {"a", "b", "c"}
+
+    os.remove(model_dir / "a.pth")
+    _checkpoint(model_dir / "broken.pth", 4)
+    assert ensemble.refresh()
+    assert ensemble.members == ["b", "broken", "c"]
+
+
+def test_requires_a_checkpoint(tmp_path):
+    with pytest.raises(RuntimeError):
+        EnsemblePredictor(str(tmp_path), device="cpu", embedder=StubEmbedder())
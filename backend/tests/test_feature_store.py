@@ -0,0 +1,149 @@
+import json
+
+import numpy as np
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.feature_store import FeatureStore, FeatureStoreWriter
+from app.embed_features import embed_features
+from app.rescore import rescore
+from conftest import StubEmbedder
+from test_bulk_score import _read_csv, _study
+
+DIMS = {"sponsor": 4, "disease": 8, "inclusion": 8, "exclusion": 8, "summary": 8}
+ENCODERS = {"sponsor": {"model": "a", "revision": "1"}, "backend": "fp32"}
+
+
+def _rows(nctids, seed=0):
+    rng = np.random.default_rng(seed)
+    return {field: rng.standard_normal((len(nctids), dim)).astype(np.float32) for field, dim in DIMS.items()}
+
+
+def test_append_across_shards_and_read_back(tmp_path):
+    path = str(tmp_path / "store")
+    writer = FeatureStoreWriter(path, ENCODERS, dtype="float32", shard_size=3, dims=DIMS)
+    ids = [f"NCT{i:02d}" for i in range(7)]
+    rows = _rows(ids)
+    assert writer.append(ids[:4], {f: x[:4] for f, x in rows.items()}, ["phase 1"] * 4) == 4
+    assert writer.append(ids[4:], {f: x[4:] for f, x in rows.items()}, ["phase 2"] * 3) == 3
+    writer.close()
+
+    store = FeatureStore(path)
+    assert len(store) == 7
+    assert store.manifest["shards"] == [3, 3, 1]
+    batches = list(store.iter_batches(batch_size=2))
+    assert [n for b in batches for n in b[0]] == ids
+    assert [p for b in batches for p in b[2]] == ["phase 1"] * 4 + ["phase 2"] * 3
+    for field in DIMS:
+        np.testing.assert_array_equal(np.vstack([b[1][field] for b in batches]), rows[field])
+    assert [n for b in store.iter_batches(batch_size=2, start=5) for n in b[0]] == ids[5:]
+
+
+def test_float16_store_and_resume_after_partial_write(tmp_path):
+    path = str(tmp_path / "store")
+    ids = [f"NCT{i:02d}" for i in range(4)]
+    rows = _rows(ids)
+    writer = FeatureStoreWriter(path, ENCODERS, shard_size=10, dims=DIMS)
+    writer.append(ids[:2], {f: x[:2] for f, x in rows.items()}, ["phase 3"] * 2)
+    # A killed run leaves bytes the manifest does not count
+    with open(os.path.join(path, "shard-00000", "summary.f16"), "ab") as f:
+        f.write(b"\x00" * 100)
+    with open(os.path.join(path, "shard-00000", "ids.txt"), "a") as f:
+        f.write("NCT99\n")
+
+    writer = FeatureStoreWriter(path, ENCODERS, dims=DIMS)
+    assert writer.nctids == set(ids[:2])
+    assert writer.append(ids, rows, ["phase 3"] * 4) == 2  # stored rows are skipped
+    store = FeatureStore(path)
+    assert store.dtype == np.float16
+    (got_ids, got, _), = store.iter_batches()
+    assert got_ids == ids
+    np.testing.assert_allclose(got["summary"], rows["summary"], atol=2e-3)
+
+
+def test_writer_rejects_other_encoders_and_bad_shapes(tmp_path):
+    path = str(tmp_path / "store")
+    writer = FeatureStoreWriter(path, ENCODERS, dims=DIMS)
+    with pytest.raises(ValueError):
+        writer.append(["NCT01"], _rows(["NCT01", "NCT02"]), ["phase 1"])
+    writer.close()
+    with pytest.raises(ValueError):
+        FeatureStoreWriter(path, {**ENCODERS, "backend": "int8"})
+
+
+def test_embed_then_rescore_matches_predict_batch(tmp_path, stub_predictor):
+    source = tmp_path / "dump.jsonl"
+    with open(source, "w") as f:
+        for i in range(5):
+            f.write(json.dumps(_study(f"NCT0{i}", phase="Phase 3" if i % 2 else "Phase 1")) + "\n")
+    store_path = str(tmp_path / "features")
+
+    assert embed_features(str(source), store_path, StubEmbedder(), batch_size=2, dtype="float32") == 5
+    assert embed_features(str(source), store_path, StubEmbedder(), batch_size=2) == 0
+    with open(os.path.join(store_path, "manifest.json")) as f:
+        assert json.load(f)["encoders"]["disease"]["model"] == "stub"
+
+    output = str(tmp_path / "scores.csv")
+    assert rescore(FeatureStore(store_path), output, stub_predictor, batch_size=2, n_samples=4) == 5
+    rows = _read_csv(output)
+    assert [r["nctid"] for r in rows] == [f"NCT0{i}" for i in range(5)]
+
+    from app.bulk_io import preprocess_batch
+    trials = preprocess_batch([_study(f"NCT0{i}", phase="Phase 3" if i % 2 else "Phase 1") for i in range(5)])
+    expected = stub_predictor.predict_batch(trials, n_samples=4)
+    assert [float(r["deterministic"]) for r in rows] == [e["deterministic"] for e in expected]
+    assert [r["phase"] for r in rows] == [t["phase"] for t in trials]
+
+    # Everything is scored; a second run has nothing left
+    assert rescore(FeatureStore(store_path), output, stub_predictor, batch_size=2, n_samples=4) == 0
+
+
+def test_newer_study_version_supersedes_stored_row(tmp_path):
+    path = str(tmp_path / "store")
+    ids = ["NCT01", "NCT02", "NCT03"]
+    rows = _rows(ids)
+    writer = FeatureStoreWriter(path, ENCODERS, dtype="float32", shard_size=2, dims=DIMS)
+    writer.append(ids, rows, ["phase 1"] * 3, ["2024-01-01"] * 3)
+
+    update = _rows(["NCT02"], seed=1)
+    assert writer.append(["NCT02"], update, ["phase 2"], ["2024-01-01"]) == 0  # same version
+    assert writer.append(["NCT02"], update, ["phase 2"], ["2025-03-01"]) == 1
+    assert writer.updated == 1
+    assert FeatureStoreWriter(path, ENCODERS, dims=DIMS).is_current("NCT02", "2025-03-01")
+
+    store = FeatureStore(path)
+    assert len(store) == 4 and store.trials == 3
+    got = {n: (p, e) for ids_, emb, phases in store.iter_batches(batch_size=2)
+           for n, p, e in zip(ids_, phases, emb["summary"])}
+    assert sorted(got) == ids
+    assert got["NCT02"][0] == "phase 2"
+    np.testing.assert_array_equal(got["NCT02"][1], update["summary"][0])
+
+
+def test_rescore_checkpoint_is_bound_to_its_store(tmp_path, stub_predictor):
+    source = tmp_path / "dump.jsonl"
+    with open(source, "w") as f:
+        for i in range(3):
+            f.write(json.dumps(_study(f"NCT0{i}")) + "\n")
+    store_path, output = str(tmp_path / "features"), str(tmp_path / "scores.csv")
+    embed_features(str(source), store_path, StubEmbedder(), batch_size=2, dtype="float32")
+    assert rescore(FeatureStore(store_path), output, stub_predictor, batch_size=2, n_samples=4) == 3
+
+    # An updated study is re-embedded and scored again on resume
+    updated = _study("NCT01", phase="Phase 3")
+    updated["protocolSection"]["statusModule"] = {"lastUpdatePostDateStruct": {"date": "2025-01-01"}}
+    with open(source, "a") as f:
+        f.write(json.dumps(updated) + "\n")
+    assert embed_features(str(source), store_path, StubEmbedder(), batch_size=2) == 1
+    assert rescore(FeatureStore(store_path), output, stub_predictor, batch_size=2, n_samples=4) == 1
+    assert [(r["nctid"], r["phase"]) for r in _read_csv(output)][-1] == ("NCT01", "phase 3")
+
+    # A rebuilt store must not resume from the old store's offset
+    import shutil
+    shutil.rmtree(store_path)
+    embed_features(str(source), store_path, StubEmbedder(), batch_size=2, dtype="float32")
+    with pytest.raises(RuntimeError):
+        rescore(FeatureStore(store_path), output, stub_predictor, batch_size=2, n_samples=4)
@@ -0,0 +1,154 @@
+import gzip
+import json
+import threading
+import time
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.jobs import (COMPLETED, FAILED, QUEUED, RUNNING, JobRunner, JobStore, UploadTooLarge, parse_upload,
+                           process_token)
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = JobStore(str(tmp_path / "jobs.sqlite"))
+    yield s
+    s.close()
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_parse_upload_formats():
+    studies = [{"id": 1}, {"id": 2}]
+    assert parse_upload(b'{"id": 1}\n\n{"id": 2}\n') == studies
+    assert parse_upload(json.dumps(studies).encode()) == studies
+    assert parse_upload(json.dumps({"studies": studies}).encode()) == studies
+    assert parse_upload(gzip.compress(b'{"id": 1}\n{"id": 2}')) == studies
+    assert parse_upload(b"  ") == []
+    # Concatenated gzip members, inflated only up to the limit
+    assert parse_upload(gzip.compress(b'{"id": 1}\n') + gzip.compress(b'{"id": 2}'), max_bytes=20) == studies
+    with pytest.raises(UploadTooLarge):
+        parse_upload(gzip.compress(b" " * 10_000_000), max_bytes=1000)
+
+
+def test_store_without_uncertainty_mode_column_is_migrated(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "old.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, source TEXT NOT NULL, "
+                     "n_samples INTEGER NOT NULL, adaptive INTEGER, total INTEGER NOT NULL, "
+                     "done INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, error TEXT, owner TEXT, "
+                     "created_at REAL NOT NULL, started_at REAL, finished_at REAL)")
+        conn.execute("INSERT INTO jobs (id, status, source, n_samples, total, created_at) "
+                     "VALUES ('old', 'completed', 'nctids', 5, 0, 0)")
+    store = JobStore(path)
+    try:
+        assert store.get("old")["uncertainty_mode"] == "mc"
+        assert store.create(nctids=["NCT1"], uncertainty_mode="masks")["uncertainty_mode"] == "masks"
+    finally:
+        store.close()
+
+
+def test_store_progress_results_and_recovery(store, tmp_path):
+    job = store.create(nctids=["NCT1", "NCT2", "NCT3"], n_samples=10)
+    assert job["status"] == QUEUED and job["total"] == 3 and job["adaptive"] is None
+
+    claimed = store.claim_next()
+    assert claimed["job_id"] == job["job_id"] and claimed["status"] == RUNNING
+    assert store.claim_next() is None
+
+    batch = store.pending_items(job["job_id"], 2)
+    assert [item["nctid"] for item in batch] == ["NCT1", "NCT2"] and batch[0]["study"] is None
+    store.complete(job["job_id"], [(batch[1]["seq"], {"nctid": "NCT2", "probability": 0.5}),
+                                   (batch[0]["seq"], {"nctid": "NCT1", "error": "boom"})])
+    assert [r["nctid"] for _, r in store.results(job["job_id"])] == ["NCT2", "NCT1"]
+    assert [r["nctid"] for _, r in store.results(job["job_id"], after=1)] == ["NCT1"]
+    progress = store.get(job["job_id"])
+    assert progress["done"] == 1 and progress["failed"] == 1
+
+    # A running job owned by this (live) process is not recovered; a dead owner's is
+    assert store.recover() == 0
+    reopened = JobStore(store.path)
+    reopened._conn.execute("UPDATE jobs SET owner = ? WHERE id = ?", (2 ** 22 + 1, job["job_id"]))
+    assert reopened.recover() == 1
+    assert reopened.get(job["job_id"])["status"] == QUEUED
+    assert [item["nctid"] for item in reopened.pending_items(job["job_id"], 10)] == ["NCT3"]
+    reopened.close()
+
+
+def test_restart_with_same_pid_requeues_and_stale_batches_are_dropped(store):
+    job = store.create(nctids=["NCT1", "NCT2"], n_samples=10)
+    store.claim_next()
+    item = store.pending_items(job["job_id"], 1)[0]
+
+    # A previous server process that had the same pid (e.g. pid 1 in a container)
+    store._conn.execute("UPDATE jobs SET owner = ? WHERE id = ?", (f"{os.getpid()}:earlier", job["job_id"]))
+    assert store.recover() == 1
+    # The old owner's late batch must not land on the requeued job
+    assert store.complete(job["job_id"], [(item["seq"], {"nctid": "NCT1"})]) is False
+    assert store.get(job["job_id"])["done"] == 0
+
+    store.claim_next()
+    assert store.get(job["job_id"])["owner"] == process_token()
+    assert store.complete(job["job_id"], [(item["seq"], {"nctid": "NCT1"})]) is True
+
+
+def test_uploaded_studies_round_trip(store):
+    job = store.create(studies=[("NCT9", {"protocolSection": {"x": 1}})], adaptive=True)
+    assert job["source"] == "upload" and job["adaptive"] is True
+    assert store.pending_items(job["job_id"], 5)[0]["study"] == {"protocolSection": {"x": 1}}
+
+
+def test_runner_scores_jobs_in_batches_and_yields_to_interactive(store):
+    busy = threading.Event()
+    seen = []
+
+    async def score_batch(items, job):
+        seen.append((len(items), busy.is_set()))
+        return [{"nctid": item["nctid"], "probability": 0.5} for item in items]
+
+    first = store.create(nctids=[f"NCT{i}" for i in range(5)])
+    runner = JobRunner(store, score_batch, batch_size=2, busy=busy.is_set, max_yield=0.3, poll_interval=0.05)
+    busy.set()
+    started = time.monotonic()
+    runner.start()
+    try:
+        assert _wait_for(lambda: store.get(first["job_id"])["status"] == COMPLETED)
+        # Each batch waited up to max_yield for interactive requests, then went ahead anyway
+        assert seen == [(2, True), (2, True), (1, True)]
+        assert time.monotonic() - started >= 0.9
+        busy.clear()
+
+        second = store.create(nctids=["NCTX"])
+        runner.notify()
+        assert _wait_for(lambda: store.get(second["job_id"])["status"] == COMPLETED)
+        assert store.get(first["job_id"])["done"] == 5
+        assert len(store.results(first["job_id"])) == 5
+    finally:
+        runner.stop()
+
+
+def test_runner_marks_failed_job(store):
+    async def score_batch(items, job):
+        raise RuntimeError("model unavailable")
+
+    job = store.create(nctids=["NCT1"])
+    runner = JobRunner(store, score_batch, poll_interval=0.05)
+    runner.start()
+    try:
+        assert _wait_for(lambda: store.get(job["job_id"])["status"] == FAILED)
+        assert store.get(job["job_id"])["error"] == "model unavailable"
+    finally:
+        runner.stop()
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.loader import PredictorLoader
+
+
+class FakePredictor:
+    def __init__(self):
+        self.warmed = False
+
+    def predict_batch(self, trials, n_samples=20):
+        self.warmed = True
+        return [{}] * len(trials)
+
+
+def test_background_load_reports_components():
+    release = threading.Event()
+
+    def factory(on_progress):
+        on_progress("weights", "loading")
+        release.wait(5)
+        on_progress("weights", "ready")
+        return FakePredictor()
+
+    loader = PredictorLoader(factory, warmup=True)
+    assert loader.status()["status"] == "pending"
+    loader.start()
+    assert not loader.is_ready()
+    assert loader.status()["status"] == "loading"
+
+    release.set()
+    predictor = loader.wait(5)
+    assert predictor.warmed
+    status = loader.status()
+    assert status["status"] == "ready"
+    assert status["components"] == {"weights": "ready", "warmup": "ready"}
+
+
+def test_failed_load_marks_component_failed():
+    def factory(on_progress):
+        on_progress("weights", "loading")
+        raise FileNotFoundError("model_weights.pth")
+
+    loader = PredictorLoader(factory)
+    with pytest.raises(RuntimeError, match="model_weights.pth"):
+        loader.wait(5)
+    assert loader.status()["status"] == "failed"
+    assert loader.status()["components"]["weights"] == "failed"
+
+
+def test_preload_builds_once_and_start_only_warms_up():
+    built = []
+
+    def factory(on_progress):
+        built.append(FakePredictor())
+        on_progress("weights", "ready")
+        return built[-1]
+
+    loader = PredictorLoader(factory, warmup=True)
+    loader.preload()
+    assert len(built) == 1 and not built[0].warmed
+    assert not loader.is_ready()
+
+    assert loader.wait(5) is built[0]
+    assert len(built) == 1 and built[0].warmed
@@ -1,16 +1,26 @@
+import gzip
+import json
+
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from app import main
 from app.main import app
 
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def ready_predictor(monkeypatch, stub_predictor):
+    monkeypatch.setattr(main.loader, "predictor", stub_predictor)
+    return stub_predictor
+
+
 def test_predict_success():
     fake_response = {
         "protocolSection": {
@@ -23,7 +33,7 @@ def test_predict_success():
         "hasResults": True
     }
 
-    with patch("app.services.clinicaltrials_api.fetch_nctid_data", return_value=fake_response):
+    with patch("app.main.ct_client.fetch_study", new=AsyncMock(return_value=fake_response)):
         with patch("app.core.predict.TrialPredictor.predict_with_uncertainty", return_value={
             "probability": 0.87,
             "uncertainty": 0.04,
@@ -39,7 +49,323 @@ def test_predict_success():
 
 
 def test_predict_failure():
-    with patch("app.services.clinicaltrials_api.fetch_nctid_data", side_effect=Exception("API failure")):
+    with patch("app.main.ct_client.fetch_study", new=AsyncMock(side_effect=Exception("API failure"))):
         response = client.get("/predict/NCTFAIL123")
         assert response.status_code == 200
-        assert "error" in response.json()
\ No newline at end of file
+        assert "error" in response.json()
+
+def test_predict_batch_keeps_errors_per_trial():
+    def fake_trial(sponsor):
+        return {
+            "protocolSection": {
+                "sponsorCollaboratorsModule": {"leadSponsor": {"name": sponsor}},
+                "designModule": {"phases": ["Phase 2"]}
+            }
+        }
+
+    fetched = [fake_trial("A"), Exception("ClinicalTrials.gov API returned status 404"), fake_trial("B")]
+    scored = [
+        {"probability": 0.6, "uncertainty": 0.05, "label": 1, "deterministic": 0.61},
+        {"probability": 0.3, "uncertainty": 0.07, "label": 0, "deterministic": 0.29},
+    ]
+
+    with patch("app.main.ct_client.fetch_many", new=AsyncMock(return_value=fetched)):
+        with patch("app.core.predict.TrialPredictor.predict_batch", return_value=scored) as mock_batch:
+            response = client.post("/predict/batch", json={"nctids": ["NCTB1", "NCTB2", "NCTB3"]})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["nctid"] for r in results] == ["NCTB1", "NCTB2", "NCTB3"]
+    assert results[0]["probability"] == 0.6
+    assert "404" in results[1]["error"]
+    assert results[2]["probability"] == 0.3
+    # Both valid trials scored in a single batched call
+    assert len(mock_batch.call_args.args[0]) == 2
+
+
+def test_predict_serves_stale_result_when_revalidation_fails(ready_predictor):
+    key = ready_predictor.weights_checksum
+    cached = {"nctid": "NCTSTALE", "phase": "phase 2", "probability": 0.42, "uncertainty": 0.03, "label": 0,
+              "deterministic": 0.41, "n_samples_used": 1000}
+    main.result_cache.put("NCTSTALE", "2024-01-01", key, cached)
+    main.result_cache.get("NCTSTALE", key).stored_at -= main.result_cache.ttl + 1
+
+    with patch("app.main.ct_client.fetch_version", new=AsyncMock(side_effect=Exception("upstream down"))), \
+            patch("app.main.ct_client.fetch_study", new=AsyncMock(side_effect=Exception("upstream down"))):
+        data = client.get("/predict/NCTSTALE").json()
+        batch = client.post("/predict/batch", json={"nctids": ["NCTSTALE"]}).json()["results"]
+
+    assert "error" not in data
+    assert data["probability"] == 0.42
+    assert data["degradation"]["name"] == "stale"
+    assert batch[0]["probability"] == 0.42
+
+
+def test_predict_returns_503_while_loading(monkeypatch):
+    monkeypatch.setattr(main.loader, "predictor", None)
+    response = client.get("/predict/NCT00000172")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_health_and_readiness(monkeypatch):
+    assert client.get("/healthz").json() == {"status": "ok"}
+    assert client.get("/readyz").json()["status"] == "ready"
+
+    monkeypatch.setattr(main.loader, "predictor", None)
+    monkeypatch.setattr(main.loader, "components", {"weights": "ready", "text_model": "loading"})
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["components"]["text_model"] == "loading"
+
+
+def test_similar_trials(monkeypatch, tmp_path, stub_predictor):
+    from app.build_index import build_index
+    from app.core.vector_index import load_index
+
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures", "studies.jsonl")
+    build_index(fixtures, str(tmp_path / "index"), stub_predictor, n_samples=5)
+    monkeypatch.setattr(main, "vector_index", load_index(str(tmp_path / "index")))
+
+    data = client.get("/similar/NCT01000001?k=3").json()
+    assert data["indexed"] is True
+    assert len(data["neighbours"]) == 3
+    assert "NCT01000001" not in [n["nctid"] for n in data["neighbours"]]
+
+    # Trials outside the index are fetched and embedded first
+    study = {"protocolSection": {"identificationModule": {"nctId": "NCT09999999"},
+                                 "sponsorCollaboratorsModule": {"leadSponsor": {"name": "Pfizer"}}}}
+    with patch("app.main.ct_client.fetch_study", new=AsyncMock(return_value=study)):
+        data = client.get("/similar/NCT09999999?k=2").json()
+    assert data["indexed"] is False
+    assert len(data["neighbours"]) == 2
+
+    assert client.get("/similar/NCT01000001?k=0").status_code == 400
+    monkeypatch.setattr(main, "vector_index", None)
+    assert client.get("/similar/NCT01000001").status_code == 404
+
+
+def test_metrics_and_access_log(capsys):
+    fake_response = {
+        "protocolSection": {
+            "sponsorCollaboratorsModule": {"leadSponsor": {"name": "Metrics Pharma"}},
+            "conditionsModule": {"conditions": ["Asthma"]},
+            "designModule": {"phases": ["Phase 2"]}
+        }
+    }
+    with patch("app.main.ct_client.fetch_study", new=AsyncMock(return_value=fake_response)), \
+            patch("app.main.result_cache.alookup", new=AsyncMock(return_value=None)):
+        assert "probability" in client.get("/predict/NCT05550001").json()
+
+    import json
+    log = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")][-1]
+    assert log["route"] == "/predict/{nctid}" and log["status"] == 200
+    assert log["nctid"] == "NCT05550001" and "probability" in log
+    assert {"cache_lookup", "fetch", "parse", "preprocess", "embed", "forward", "mc_sample"} <= set(log["stages_ms"])
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'lucent_http_requests_total{route="/predict/{nctid}",status="200"}' in text
+    assert 'lucent_stage_duration_seconds_count{stage="mc_sample"}' in text
+    assert "lucent_result_cache_events_total" in text
+    assert "process_resident_memory_bytes" in text
+    assert 'lucent_torch_threads{kind="intra_op"}' in text
+
+
+def test_jobs_lifecycle(monkeypatch, tmp_path):
+    from app.core.jobs import JobRunner, JobStore
+
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    runner = JobRunner(store, main._score_job_batch, batch_size=3, poll_interval=0.05)
+    monkeypatch.setattr(main, "job_store", store)
+    monkeypatch.setattr(main, "job_runner", runner)
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures", "studies.jsonl")
+    with open(fixtures, "rb") as f:
+        upload = f.read()
+    studies = {}
+    for line in upload.decode().splitlines():
+        study = json.loads(line)
+        studies[study["protocolSection"]["identificationModule"]["nctId"]] = study
+
+    async def fake_fetch_many(nctids):
+        return [studies.get(n.replace("NCTJOB", "NCT0100000"), Exception("status 404")) for n in nctids]
+
+    try:
+        with patch("app.main.job_ct_client.fetch_many", new=fake_fetch_many):
+            created = client.post("/jobs", json={"nctids": ["NCTJOB1", "NCTJOB2", "NCTJOB9"], "n_samples": 5})
+            assert created.status_code == 202
+            job_id = created.json()["job_id"]
+            lines = client.get(f"/jobs/{job_id}/results").text.splitlines()
+
+        results = {r["nctid"]: r for r in map(json.loads, lines)}
+        assert set(results) == {"NCTJOB1", "NCTJOB2", "NCTJOB9"}
+        assert "probability" in results["NCTJOB1"] and "404" in results["NCTJOB9"]["error"]
+        status = client.get(f"/jobs/{job_id}").json()
+        assert (status["status"], status["done"], status["failed"], status["progress"]) == ("completed", 2, 1, 1.0)
+
+        uploaded = client.post("/jobs?n_samples=5", content=upload, headers={"Content-Type": "application/x-ndjson"})
+        assert uploaded.status_code == 202 and uploaded.json()["total"] == len(studies)
+        lines = client.get(f"/jobs/{uploaded.json()['job_id']}/results").text.splitlines()
+        assert sorted(json.loads(line)["nctid"] for line in lines) == sorted(studies)
+
+        assert client.get("/jobs/unknown").status_code == 404
+        assert client.post("/jobs", json={"nctids": []}).status_code == 400
+        assert client.post("/jobs", content=b'{"no": "nctid"}\n').status_code == 400
+        # Unbounded sample counts would tie up the runner; 5-sample results stay out of /predict's cache
+        assert client.post("/jobs", json={"nctids": ["NCTJOB1"], "n_samples": 0}).status_code == 400
+        assert client.post(f"/jobs?n_samples={main.MC_MAX_SAMPLES + 1}", content=upload).status_code == 422
+        assert main.result_cache.get("NCTJOB1", main.loader.predictor.weights_checksum) is None
+        with patch("app.main.job_ct_client.fetch_many", new=fake_fetch_many):
+            moments = client.post("/jobs", json={"nctids": ["NCTJOB1"], "uncertainty_mode": "moments"})
+            assert moments.json()["uncertainty_mode"] == "moments"
+            line, = client.get(f"/jobs/{moments.json()['job_id']}/results").text.splitlines()
+        assert json.loads(line)["n_samples_used"] == 0
+        assert client.post("/jobs", json={"nctids": ["NCTJOB1"], "uncertainty_mode": "exact"}).status_code == 400
+        assert client.post("/jobs?uncertainty_mode=exact", content=upload).status_code == 400
+        monkeypatch.setattr(main, "JOB_MAX_UPLOAD_BYTES", 1000)
+        assert client.post("/jobs", content=b" " * 1001).status_code == 413
+        assert client.post("/jobs", content=gzip.compress(b" " * 1_000_000)).status_code == 413
+        assert 'lucent_jobs{status="completed"} 3' in client.get("/metrics").text
+    finally:
+        runner.stop()
+        store.close()
+
+
+def test_jobs_disabled_without_store(monkeypatch):
+    monkeypatch.setattr(main, "job_store", None)
+    assert client.post("/jobs", json={"nctids": ["NCT1"]}).status_code == 404
+
+
+def test_scenarios_score_variants_together():
+    fake_response = {
+        "protocolSection": {
+            "sponsorCollaboratorsModule": {"leadSponsor": {"name": "Test Pharma"}},
+            "descriptionModule": {"briefSummary": "Study description"},
+            "eligibilityModule": {"eligibilityCriteria": "Inclusion: A. Exclusion: B."},
+            "conditionsModule": {"conditions": ["Cancer"]},
+            "designModule": {"phases": ["Phase 2"]}
+        }
+    }
+    with patch("app.main.ct_client.fetch_study", new=AsyncMock(return_value=fake_response)):
+        response = client.post("/scenarios", json={
+            "nctid": "NCT00000172", "n_samples": 16,
+            "variants": [{"phase": "Phase 3"}, {"sponsor": "Other Pharma"}],
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["base"]["phase"] == "phase 2"
+        assert [v["phase"] for v in data["variants"]] == ["phase 3", "phase 2"]
+        assert data["variants"][1]["overrides"] == {"sponsor": "Other Pharma"}
+        assert all(v["n_samples_used"] == 16 for v in data["variants"])
+
+        bad = client.post("/scenarios", json={"nctid": "NCT00000172", "variants": [{"enrollment": 5}]})
+        assert bad.status_code == 400
+        for variant in ({"phase": 3}, {"diseases": [1]}):
+            bad = client.post("/scenarios", json={"nctid": "NCT00000172", "variants": [variant]})
+            assert bad.status_code == 400
+        assert client.post("/scenarios", json={"nctid": "NCT00000172", "variants": []}).status_code == 400
+
+
+def test_models_lists_single_model_and_refresh_needs_ensemble(stub_predictor):
+    response = client.get("/models")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["ensemble"] is False
+    assert data["models"][0]["checksum"] == stub_predictor.weights_checksum
+    assert client.post("/models/refresh").status_code == 404
+
+
+def test_predict_uncertainty_mode():
+    fake_response = {
+        "protocolSection": {
+            "sponsorCollaboratorsModule": {"leadSponsor": {"name": "Test Pharma"}},
+            "descriptionModule": {"briefSummary": "Study description"},
+            "eligibilityModule": {"eligibilityCriteria": "Inclusion: A. Exclusion: B."},
+            "conditionsModule": {"conditions": ["Cancer"]},
+            "designModule": {"phases": ["Phase 2"]}
+        }
+    }
+    with patch("app.main.ct_client.fetch_study", new=AsyncMock(return_value=fake_response)):
+        response = client.get("/predict/NCTMOMENTS1", params={"uncertainty_mode": "moments"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["n_samples_used"] == 0
+        assert 0 <= data["probability"] <= 1 and data["uncertainty"] >= 0
+
+        assert client.get("/predict/NCTMOMENTS1", params={"uncertainty_mode": "exact"}).status_code == 400
+        bad = client.post("/predict/batch", json={"nctids": ["NCTMOMENTS1"], "uncertainty_mode": "exact"})
+        assert bad.status_code == 400
+
+
+def test_predict_overload_and_degradation(monkeypatch):
+    from app.core.admission import AdmissionController, DETERMINISTIC, STALE
+
+    fake_response = {
+        "protocolSection": {
+            "sponsorCollaboratorsModule": {"leadSponsor": {"name": "Test Pharma"}},
+            "conditionsModule": {"conditions": ["Cancer"]},
+            "designModule": {"phases": ["Phase 2"]}
+        }
+    }
+    controller = AdmissionController(max_concurrency=1, max_queue=0)
+    monkeypatch.setattr(main, "admission", controller)
+
+    with patch("app.main.ct_client.fetch_study", new=AsyncMock(return_value=fake_response)):
+        data = client.get("/predict/NCTLOAD1").json()
+        assert data["degradation"] == {"level": 0, "name": "full"}
+
+        # Full MC is known to take longer than the caller's budget
+        controller.observe(0, 5.0)
+        controller.observe(1, 5.0)
+        controller.observe(2, 5.0)
+        data = client.get("/predict/NCTLOAD2", headers={"X-Deadline-Ms": "1000"}).json()
+        assert data["degradation"]["name"] == "deterministic"
+        assert data["uncertainty"] is None
+
+        # Past every fresh level: the expired cached result is served unrevalidated
+        controller.observe(DETERMINISTIC, 5.0)
+        data = client.get("/predict/NCTLOAD1", headers={"X-Deadline-Ms": "1000"}).json()
+        assert data["degradation"] == {"level": STALE, "name": "stale"}
+        assert data["nctid"] == "NCTLOAD1"
+
+        assert client.get("/predict/NCTLOAD1", headers={"X-Deadline-Ms": "soon"}).status_code == 400
+
+    # Every slot taken and no queue: turned away at once
+    controller.running = 1
+    response = client.get("/predict/NCTLOAD3")
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    controller.running = 0
+
+
+def test_predict_batch_off_default_samples_bypasses_cache_and_isolates_failures():
+    def fake_trial(sponsor):
+        return {
+            "protocolSection": {
+                "sponsorCollaboratorsModule": {"leadSponsor": {"name": sponsor}},
+                "designModule": {"phases": ["Phase 2"]}
+            }
+        }
+
+    def predict_batch(self, trials, **kwargs):
+        if len(trials) > 1:
+            raise RuntimeError("batch failed")
+        if trials[0]["sponsor"] == "Bad":
+            raise RuntimeError("bad trial")
+        return [{"probability": 0.5, "uncertainty": 0.1, "label": 1, "deterministic": 0.5}]
+
+    fetched = [fake_trial("Good"), fake_trial("Bad")]
+    with patch("app.main.ct_client.fetch_many", new=AsyncMock(return_value=fetched)), \
+            patch("app.core.predict.TrialPredictor.predict_batch", new=predict_batch), \
+            patch("app.main.result_cache.put") as put:
+        response = client.post("/predict/batch", json={"nctids": ["NCTFEW1", "NCTFEW2"], "n_samples": 5})
+    results = response.json()["results"]
+    assert results[0]["probability"] == 0.5
+    assert "bad trial" in results[1]["error"]
+    # 5-sample results must not be served later as /predict's 1000-sample ones
+    put.assert_not_called()
+
+    assert client.post("/predict/batch", json={"nctids": ["NCTFEW1"], "n_samples": 0}).status_code == 422
+    too_many = main.MC_MAX_SAMPLES + 1
+    assert client.post("/predict/batch", json={"nctids": ["NCTFEW1"], "n_samples": too_many}).status_code == 422
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.metrics import (
+    Registry, RequestContext, annotate, current_request, memory_breakdown, process_stats, run_collecting, span,
+    REGISTRY, STAGE_SECONDS, _current
+)
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("demo_requests_total", "Requests.", ("route", "status"))
+    latency = registry.histogram("demo_seconds", "Latency.", buckets=(0.1, 1.0))
+    requests.inc(route="/predict/{nctid}", status=200)
+    requests.inc(2, route="/predict/{nctid}", status=200)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+    registry.register_collector(lambda: [("demo_rss_bytes", "gauge", "RSS.", [({}, 1024)])])
+
+    text = registry.render()
+    assert "# TYPE demo_requests_total counter" in text
+    assert 'demo_requests_total{route="/predict/{nctid}",status="200"} 3' in text
+    # Buckets are cumulative and le-inclusive
+    assert 'demo_seconds_bucket{le="0.1"} 2' in text
+    assert 'demo_seconds_bucket{le="1"} 3' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 4' in text
+    assert "demo_seconds_count 4" in text
+    assert "demo_seconds_sum 3.65" in text
+    assert "demo_rss_bytes 1024" in text
+
+
+def test_span_records_histogram_and_request_timings():
+    before = STAGE_SECONDS.count(stage="unit_test_stage")
+    ctx = RequestContext()
+    token = _current.set(ctx)
+    try:
+        with span("unit_test_stage"):
+            annotate(nctid="NCT01")
+        with pytest.raises(ValueError):
+            with span("unit_test_stage"):
+                raise ValueError("boom")
+    finally:
+        _current.reset(token)
+
+    assert STAGE_SECONDS.count(stage="unit_test_stage") == before + 2
+    assert ctx.stages["unit_test_stage"] >= 0
+    assert ctx.fields == {"nctid": "NCT01"}
+    # Outside a request spans only feed the histogram
+    with span("unit_test_stage"):
+        annotate(ignored=True)
+    assert current_request() is None
+
+
+def test_run_collecting_isolates_shared_work():
+    def work():
+        with span("shared_stage"):
+            return 42
+
+    result, stages = run_collecting(work)
+    assert result == 42 and set(stages) == {"shared_stage"}
+
+
+def test_process_stats():
+    stats = process_stats()
+    assert stats["rss_bytes"] > 0
+    assert stats["threads"] >= 1
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="needs /proc/<pid>/smaps_rollup")
+def test_memory_breakdown():
+    memory = memory_breakdown()
+    assert memory["rss"] > 0
+    assert memory["shared"] + memory["private"] == memory["rss"]
+    assert memory_breakdown(2 ** 30) is None
+    assert "lucent_process_memory_bytes{kind=\"private\"}" in REGISTRY.render()
@@ -0,0 +1,68 @@
+import pytest
+import torch
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.model import MultiInputNN
+from app.models.optimized import _random_inputs, check_equivalence, optimize_model
+
+
+@pytest.fixture
+def reference(model_weights):
+    model = MultiInputNN(sponsor_dim=384, disease_dim=768, text_dim=768, num_features=7)
+    model.load_state_dict(torch.load(model_weights))
+    return model.eval()
+
+
+def test_deterministic_logits_match(reference):
+    optimized = optimize_model(reference)
+    report = check_equivalence(reference, optimized, batch_size=32, n_samples=0)
+    assert report["max_abs_logit_diff"] < 1e-5
+
+
+def test_forward_repeated_matches_forward(reference):
+    optimized = optimize_model(reference)
+    inputs = _random_inputs(reference, 3, torch.Generator().manual_seed(1))
+    with torch.no_grad():
+        expected = optimized(*[t.repeat_interleave(4, dim=0) for t in inputs])
+        torch.testing.assert_close(optimized.forward_repeated(inputs, 4), expected)
+
+
+def test_mc_dropout_distribution_matches(reference):
+    optimized = optimize_model(reference)
+    report = check_equivalence(reference, optimized, batch_size=8, n_samples=4000)
+    # Independent masks: per-trial means agree within a few standard errors
+    assert report["mc_max_mean_diff"] < 6 * report["mc_mean_stderr"]
+    assert report["mc_max_std_diff"] < 0.02
+    assert not any(m.training for m in optimized.modules())
+
+
+def test_predictor_uses_optimized_model(monkeypatch, model_weights, prepped_trial):
+    from app.core import predict
+    from conftest import StubEmbedder
+
+    monkeypatch.setattr(predict, "TrialEmbedder", StubEmbedder)
+    reference = predict.TrialPredictor(model_path=model_weights, device="cpu")
+    optimized = predict.TrialPredictor(model_path=model_weights, device="cpu", optimize_model=True)
+
+    assert hasattr(optimized.model, "forward_repeated")
+    assert optimized.predict(prepped_trial) == reference.predict(prepped_trial)
+    result = optimized.predict_with_uncertainty(prepped_trial, n_samples=200)
+    assert result["deterministic"] == reference.predict(prepped_trial)["probability"]
+    assert result["n_samples_used"] == 200
+
+
+@pytest.mark.parametrize("optimized", [False, True])
+def test_tower_head_split_matches_forward(reference, optimized):
+    model = optimize_model(reference) if optimized else reference
+    inputs = _random_inputs(reference, 3, torch.Generator().manual_seed(2))
+    with torch.no_grad():
+        expected = model(*inputs)
+        torch.testing.assert_close(model.head(model.towers(*inputs[:5]), inputs[5]), expected)
+        stack = torch.stack([model.tower(i, x) for i, x in enumerate(inputs[:5])], dim=1)
+        torch.testing.assert_close(model.head(stack, inputs[5]), expected)
+        repeated = model.towers(*inputs[:5], reps=2)
+        assert repeated.shape == (6, 5, 64)
+        torch.testing.assert_close(repeated[::2], model.towers(*inputs[:5]))
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.embedding_cache import EmbeddingCache
+from app.core.parallel_embeddings import ParallelEmbedder
+from conftest import StubEmbedder
+
+
+@pytest.fixture(scope="module")
+def parallel_embedder():
+    embedder = ParallelEmbedder(workers=2, threads_per_worker=1, shard_size=3, embedder_cls=StubEmbedder)
+    yield embedder
+    embedder.close()
+
+
+def test_sharded_encode_matches_single_process(parallel_embedder):
+    texts = [f"sponsor {i}" for i in range(10)]
+    expected = StubEmbedder().encode_sponsors(texts)
+    np.testing.assert_array_equal(parallel_embedder.encode_sponsors(texts), expected)
+
+
+def test_encode_trials_runs_all_fields(parallel_embedder, prepped_trial):
+    other = dict(prepped_trial, sponsor="Moderna", diseases="Asthma")
+    result = parallel_embedder.encode_trials([prepped_trial, other])
+    expected = StubEmbedder().encode_trials([prepped_trial, other])
+    assert set(result) == {"sponsor", "disease", "inclusion", "exclusion", "summary"}
+    for field in result:
+        np.testing.assert_array_equal(result[field], expected[field])
+
+
+def test_cache_stays_in_parent(parallel_embedder):
+    parallel_embedder.cache = EmbeddingCache()
+    try:
+        parallel_embedder.encode_diseases(["Asthma", "Asthma"])
+        parallel_embedder.encode_diseases(["Asthma"])
+        assert parallel_embedder.cache.stats()["hits"] == 1
+    finally:
+        parallel_embedder.cache = None
@@ -1,16 +1,23 @@
 import pytest
 
+import json
+import re
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app.core.preprocessing import (
+    apply_overrides,
     normalize_phase,
     clean_criteria,
     split_criteria,
     clean_and_join_diseases,
     preprocess_trial,
+    preprocess_trials,
+    trial_rows,
+    TRIAL_COLUMNS,
 )
+from app.core.parsing import parse_trial_json, parse_trials, PARSED_COLUMNS
 
 
 def test_normalize_phase():
@@ -67,4 +74,53 @@ def test_preprocess_trial_full_case():
     assert "Adults" in result["inclusion_criteria"]
     assert "Pregnant" in result["exclusion_criteria"]
     assert result["diseases"] == "Influenza"
-    assert result["phase"] == "phase 1"
\ No newline at end of file
+    assert result["phase"] == "phase 1"
+
+def _clean_criteria_reference(text):
+    # The original implementation, kept as the reference
+    if not text:
+        return ""
+    text = text.replace('\r', '').replace('\n', ' ').replace(':', ' ')
+    for w in ['Inclusion', 'inclusion', 'INCLUSION', 'Criteria', 'criteria', 'CRITERIA']:
+        text = text.replace(w, '')
+    text = re.sub(r'\s{2,}', ' ', text)
+    return text.strip()
+
+
+@pytest.mark.parametrize("text", [
+    "Inclusion Criteria:\r\n\r\n* Adults\n\nExclusion Criteria:\n\n* Pregnant",
+    "Age \t 18 to 65\tyears",               # tabs: single ones are kept
+    "\u2265 18 years,\u00a0 BMI\u00a0< 30",   # non-ASCII text and no-break spaces
+    "CriINCLUSIONteria stays joined",
+    "",
+    "   ",
+])
+def test_clean_criteria_matches_reference(text):
+    assert clean_criteria(text) == _clean_criteria_reference(text)
+
+
+def test_columnar_path_matches_per_trial_functions():
+    with open(os.path.join(os.path.dirname(__file__), "fixtures", "studies.jsonl")) as f:
+        studies = [json.loads(line) for line in f if line.strip()]
+    studies.append({"protocolSection": {"designModule": {"phases": []}}})  # every field missing
+
+    parsed = parse_trials(studies)
+    assert parsed == {k: [parse_trial_json(s)[k] for s in studies] for k in PARSED_COLUMNS}
+
+    columns = preprocess_trials(parsed)
+    assert set(columns) == set(TRIAL_COLUMNS)
+    assert trial_rows(columns) == [preprocess_trial(parse_trial_json(s)) for s in studies]
+    assert trial_rows(preprocess_trials(parse_trials([]))) == []
+
+
+def test_apply_overrides_normalizes_fields():
+    base = {"sponsor": "A", "description": "d", "inclusion_criteria": "i", "exclusion_criteria": "e",
+            "diseases": "Asthma", "phase": "phase 2"}
+    out = apply_overrides(base, {"phase": "PHASE3", "diseases": ["[Cancer]", " Flu "], "sponsor": " B "})
+    assert out == dict(base, phase="phase 3", diseases="Cancer, Flu", sponsor="B")
+    assert base["phase"] == "phase 2"
+    with pytest.raises(ValueError):
+        apply_overrides(base, {"enrollment": 10})
+    for bad in ({"phase": 3}, {"diseases": [1]}, {"sponsor": ["A"]}):
+        with pytest.raises(ValueError):
+            apply_overrides(base, bad)
@@ -0,0 +1,87 @@
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.result_cache import PredictionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _no_version_check(nctid):
+    raise AssertionError("fresh entries must not be revalidated")
+
+
+def test_fresh_hit_skips_version_check(clock):
+    cache = PredictionCache(ttl=60, clock=clock)
+    cache.put("NCT1", "2024-01-01", "abc", {"probability": 0.5})
+    assert cache.lookup("NCT1", "abc", _no_version_check) == {"probability": 0.5}
+    assert cache.stats()["hits"] == 1
+
+
+def test_stale_entry_revalidated_when_version_unchanged(clock):
+    cache = PredictionCache(ttl=60, clock=clock)
+    cache.put("NCT1", "2024-01-01", "abc", {"probability": 0.5})
+    clock.now = 120
+    assert cache.lookup("NCT1", "abc", lambda nctid: "2024-01-01") == {"probability": 0.5}
+    # Revalidation restarts the TTL
+    assert cache.lookup("NCT1", "abc", _no_version_check) is not None
+    assert cache.stats()["revalidations"] == 1
+
+
+def test_stale_entry_dropped_when_study_updated(clock):
+    cache = PredictionCache(ttl=60, clock=clock)
+    cache.put("NCT1", "2024-01-01", "abc", {"probability": 0.5})
+    clock.now = 120
+    assert cache.lookup("NCT1", "abc", lambda nctid: "2024-06-01") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_failed_revalidation_serves_stale_entry(clock):
+    import asyncio
+
+    def registry_down(nctid):
+        raise ConnectionError("registry unreachable")
+
+    async def async_registry_down(nctid):
+        registry_down(nctid)
+
+    cache = PredictionCache(ttl=60, clock=clock)
+    cache.put("NCT1", "2024-01-01", "abc", {"probability": 0.5})
+    clock.now = 120
+    assert cache.lookup("NCT1", "abc", registry_down) == {"probability": 0.5}
+    assert asyncio.run(cache.alookup("NCT1", "abc", async_registry_down)) == {"probability": 0.5}
+    # Still stale: the next lookup revalidates again
+    assert not cache.fresh("NCT1", "abc")
+    assert cache.lookup("NCT1", "abc", lambda nctid: "2024-01-01") == {"probability": 0.5}
+    assert cache.fresh("NCT1", "abc")
+    stats = cache.stats()
+    assert stats["revalidation_errors"] == 2 and stats["stale_hits"] == 2 and stats["entries"] == 1
+
+
+def test_weights_checksum_mismatch_is_a_miss(clock):
+    cache = PredictionCache(ttl=60, clock=clock)
+    cache.put("NCT1", "2024-01-01", "abc", {"probability": 0.5})
+    assert cache.lookup("NCT1", "other", _no_version_check) is None
+
+
+def test_lru_eviction(clock):
+    cache = PredictionCache(max_entries=2, ttl=60, clock=clock)
+    cache.put("NCT1", "v", "abc", {})
+    cache.put("NCT2", "v", "abc", {})
+    cache.lookup("NCT1", "abc", _no_version_check)
+    cache.put("NCT3", "v", "abc", {})
+    assert cache.get("NCT2", "abc") is None
+    assert cache.get("NCT1", "abc") is not None
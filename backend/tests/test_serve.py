@@ -0,0 +1,108 @@
+import argparse
+import os
+import signal
+import time
+
+import httpx
+import pytest
+
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.serve import PreforkServer, _bind, format_memory
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork") or not os.path.exists("/proc/self/smaps_rollup"),
+                                reason="pre-fork serving needs fork and /proc")
+
+# Allocated before the fork, like the preloaded models
+SHARED = bytearray(32 * 2 ** 20)
+
+
+async def pid_app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    body = str(os.getpid()).encode()
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _args(**overrides):
+    args = dict(workers=2, threads_per_worker=None, keep_alive=1, graceful_timeout=5.0, memory_interval=0,
+                log_level="warning")
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _get(port):
+    try:
+        return int(httpx.get(f"http://127.0.0.1:{port}/", timeout=2).text)
+    except httpx.HTTPError:
+        return None
+
+
+def test_workers_share_socket_restart_and_report_memory():
+    for i in range(0, len(SHARED), 4096):
+        SHARED[i] = 1  # fault the pages in, so workers inherit them resident
+    sock = _bind("127.0.0.1", 0, 64)
+    port = sock.getsockname()[1]
+    server = PreforkServer(pid_app, sock, _args())
+    for index in range(2):
+        server.spawn(index)
+    try:
+        assert _wait_for(lambda: _get(port) is not None)
+        first = dict(server.workers)
+        assert _get(port) in first.values()
+
+        # Pages allocated before the fork are shared, not private, in each worker
+        report = format_memory(server.workers)
+        assert report.count("[serve] worker") == 2
+        shared = [int(line.split("shared ")[1].split(" MiB")[0]) for line in report.splitlines() if "shared" in line]
+        assert all(mib >= 32 for mib in shared)
+
+        os.kill(first[0], signal.SIGKILL)
+        assert _wait_for(lambda: (server.reap(), server.workers.get(0, first[0]) != first[0])[1])
+        assert server.workers[1] == first[1]
+        assert _wait_for(lambda: _get(port) is not None)
+    finally:
+        server.stop()
+        for pid in server.workers.values():
+            os.kill(pid, signal.SIGTERM)
+        assert _wait_for(lambda: (server.reap(), not server.workers)[1])
+        sock.close()
+
+
+def test_disk_embedding_cache_is_shared_by_several_workers(monkeypatch, tmp_path):
+    from app import main as service
+    from app import serve
+    from app.core import embedding_cache
+
+    class FakeServer:
+        def __init__(self, app, sock, args):
+            self.args = args
+
+        def run(self):
+            return 0
+
+    monkeypatch.setattr(service.embedding_cache, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(service.loader, "preload", lambda: None)
+    monkeypatch.setattr(serve.gc, "freeze", lambda: None)
+    monkeypatch.setattr(serve, "_bind", lambda host, port, backlog: None)
+    monkeypatch.setattr(serve, "PreforkServer", FakeServer)
+    with pytest.raises(SystemExit) as started:
+        serve.main(["--workers", "2"])
+    assert started.value.code == 0
+
+    # Without fcntl the writers cannot lock, so several workers are refused
+    monkeypatch.setattr(embedding_cache, "fcntl", None)
+    with pytest.raises(SystemExit) as refused:
+        serve.main(["--workers", "2"])
+    assert "fcntl" in str(refused.value.code)
@@ -0,0 +1,113 @@
+import asyncio
+import json
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from test_clinicaltrials_async import StubAPI
+from app.services.clinicaltrials_async import AsyncClinicalTrialsClient
+from app.services.study_store import StudyStore
+from app import sync_studies
+
+
+def _study(nctid, updated="2024-05-01", title="A study"):
+    return {"protocolSection": {
+        "identificationModule": {"nctId": nctid, "briefTitle": title},
+        "statusModule": {"lastUpdatePostDateStruct": {"date": updated}},
+    }}
+
+
+@pytest.fixture
+def stub_api():
+    api = StubAPI()
+    yield api
+    api.close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = StudyStore(str(tmp_path / "studies.sqlite"))
+    yield s
+    s.close()
+
+
+def _query(path):
+    return {k: v[0] for k, v in parse_qs(urlparse(path).query).items()}
+
+
+def test_upsert_reports_only_changed_studies(store):
+    assert store.upsert([_study("NCT1"), _study("NCT2")]) == ["NCT1", "NCT2"]
+    assert store.upsert([_study("NCT1"), _study("NCT2", title="Amended")]) == ["NCT2"]
+    assert len(store) == 2 and "NCT1" in store and "NCT3" not in store
+    assert store.get("NCT2")["protocolSection"]["identificationModule"]["briefTitle"] == "Amended"
+    assert store.version("NCT1") == "2024-05-01"
+    assert store.get("NCT3") is None and store.version("NCT3") is None
+    assert [study["protocolSection"]["identificationModule"]["nctId"]
+            for study in store.iter_studies(["NCT2", "NCT3"])] == ["NCT2"]
+
+
+def test_sync_pages_filters_and_advances_watermark(stub_api, store, tmp_path):
+    stub_api.routes["/api/v2/studies"] = [
+        (200, {}, {"studies": [_study("NCT1", "2024-05-01"), _study("NCT2", "2024-05-03")], "nextPageToken": "p2"}),
+        (200, {}, {"studies": [_study("NCT3", "2024-05-02")]}),
+        # Second sync: NCT2 re-read unchanged (same day), NCT3 amended
+        (200, {}, {"studies": [_study("NCT2", "2024-05-03"), _study("NCT3", "2024-05-04", title="New")]}),
+    ]
+    ids = tmp_path / "changed.txt"
+    out = tmp_path / "changed.jsonl"
+    argv = [str(tmp_path / "studies.sqlite"), "--base-url", stub_api.base_url, "--condition", "asthma",
+            "--page-size", "2", "--changed-ids", str(ids)]
+
+    first = sync_studies.main(argv)
+    assert first["changed"] == ["NCT1", "NCT2", "NCT3"] and first["watermark"] == "2024-05-03"
+    page1, page2 = (_query(p) for p in stub_api.hits)
+    assert page1["query.cond"] == "asthma" and page1["pageSize"] == "2" and "filter.advanced" not in page1
+    assert page2["pageToken"] == "p2"
+
+    second = sync_studies.main(argv + ["--changed-studies", str(out)])
+    assert _query(stub_api.hits[-1])["filter.advanced"] == "AREA[LastUpdatePostDate]RANGE[2024-05-03,MAX]"
+    assert second["changed"] == ["NCT3"] and second["watermark"] == "2024-05-04"
+    assert ids.read_text() == "NCT3\n"
+    assert [json.loads(line)["protocolSection"]["statusModule"]["lastUpdatePostDateStruct"]["date"]
+            for line in out.read_text().splitlines()] == ["2024-05-04"]
+    assert len(store) == 3
+
+
+def test_sync_failure_keeps_watermark(stub_api, store):
+    stub_api.routes["/api/v2/studies"] = [(200, {}, {"studies": [_study("NCT1")], "nextPageToken": "p2"}),
+                                          (400, {}, {})]
+    client = AsyncClinicalTrialsClient(base_url=stub_api.base_url, backoff_base=0.01)
+
+    async def run():
+        try:
+            return await sync_studies.sync_studies(client, store)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(Exception):
+        asyncio.run(run())
+    assert "NCT1" in store
+    assert store.get_state(sync_studies._watermark_key({"condition": None, "term": None, "status": None})) is None
+
+
+def test_client_reads_mirror_first_and_writes_back_misses(stub_api, store):
+    store.upsert([_study("NCT1", "2024-01-01")])
+    stub_api.routes["/api/v2/studies/NCT2"] = [(200, {}, _study("NCT2", "2024-02-02"))]
+    client = AsyncClinicalTrialsClient(base_url=stub_api.base_url, store=store)
+
+    async def run():
+        try:
+            return (await client.fetch_study("NCT1"), await client.fetch_version("NCT1"),
+                    await client.fetch_study("NCT2"), await client.fetch_version("NCT2"))
+        finally:
+            await client.aclose()
+
+    local, local_version, fetched, fetched_version = asyncio.run(run())
+    assert local == _study("NCT1", "2024-01-01") and local_version == "2024-01-01"
+    assert fetched == _study("NCT2", "2024-02-02") and fetched_version == "2024-02-02"
+    assert [p.split("?")[0] for p in stub_api.hits] == ["/api/v2/studies/NCT2"]
+    assert client.local_hits == 3 and "NCT2" in store
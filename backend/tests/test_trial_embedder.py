@@ -58,4 +58,69 @@ def test_encode_text_fields(mock_embedder):
 def test_encode_diseases(mock_embedder):
     diseases = ["Type 2 Diabetes", "Breast Cancer"]
     emb = mock_embedder.encode_diseases(diseases)
-    assert emb.shape == (2, 768)
\ No newline at end of file
+    assert emb.shape == (2, 768)
+
+def test_encode_with_cache_skips_repeats(mock_embedder):
+    from backend.app.core.embedding_cache import EmbeddingCache
+
+    calls = []
+    encode = mock_embedder.sponsor_model.encode
+
+    def counting_encode(sentences, **kwargs):
+        calls.append(list(sentences))
+        return encode(sentences, **kwargs)
+
+    mock_embedder.sponsor_model.encode = counting_encode
+    mock_embedder.cache = EmbeddingCache()
+
+    first = mock_embedder.encode_sponsors(["Pfizer", "Moderna", "Pfizer"])
+    second = mock_embedder.encode_sponsors(["Moderna", "Pfizer"])
+
+    # One encoder call for the deduplicated misses (length-sorted inside the call)
+    assert [sorted(c) for c in calls] == [["Moderna", "Pfizer"]]
+    np.testing.assert_array_equal(first[0], first[2])
+    np.testing.assert_array_equal(second[0], first[1])
+    assert mock_embedder.cache.stats()["hits"] == 2
+
+
+def test_length_bucketing_restores_input_order(mock_embedder):
+    batches = []
+
+    def length_encode(sentences, **kwargs):
+        batches.append(list(sentences))
+        return np.array([[len(s)] * 384 for s in sentences], dtype=np.float32)
+
+    mock_embedder.text_model.encode = length_encode
+    texts = ["a" * 5, "a" * 400, "a" * 10, "a" * 300, "a" * 1]
+    emb = mock_embedder.encode_text_fields(texts)
+
+    # Batches are formed from length-sorted texts, rows come back in input order
+    assert batches == [["a" * 400, "a" * 300], ["a" * 10, "a" * 5], ["a" * 1]]
+    np.testing.assert_array_equal(emb[:, 0], [len(t) for t in texts])
+
+
+def test_disease_buckets_are_tokenized_by_length(mock_embedder):
+    tokenized = []
+
+    def length_tokenizer(batch, **kwargs):
+        tokenized.append(list(batch))
+
+        class MockBatchEncoding(dict):
+            def to(self, device):
+                return self
+
+        return MockBatchEncoding({"input_ids": torch.tensor([[len(d)] for d in batch])})
+
+    class LengthModel:
+        def __call__(self, **kwargs):
+            class Output:
+                last_hidden_state = kwargs["input_ids"].float().unsqueeze(-1).expand(-1, 1, 768)
+            return Output()
+
+    mock_embedder.disease_tokenizer = length_tokenizer
+    mock_embedder.disease_model = LengthModel()
+    diseases = ["Flu", "Non-small cell lung cancer", "Asthma", "Type 2 Diabetes Mellitus", "HIV"]
+    emb = mock_embedder.encode_diseases(diseases)
+
+    assert tokenized == [["Non-small cell lung cancer", "Type 2 Diabetes Mellitus"], ["Asthma", "Flu"], ["HIV"]]
+    np.testing.assert_array_equal(emb[:, 0], [len(d) for d in diseases])
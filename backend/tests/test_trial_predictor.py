@@ -6,7 +6,7 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.core.predict import TrialPredictor
+from app.core.predict import AdaptiveSampling, TrialPredictor
 
 
 @pytest.fixture
@@ -47,4 +47,140 @@ def test_real_model_predict_with_uncertainty(real_model_predictor, mock_trial_di
     assert 0.0 <= result["probability"] <= 1.0
     assert 0.0 <= result["uncertainty"] <= 1.0
     assert 0.0 <= result["deterministic"] <= 1.0
-    assert result["label"] in [0, 1]
\ No newline at end of file
+    assert result["label"] in [0, 1]
+
+def _loop_mc(predictor, inputs, n_samples):
+    with torch.no_grad():
+        preds = [torch.sigmoid(predictor.mc_model(*inputs)).item() for _ in range(n_samples)]
+    return np.array(preds)
+
+
+def _single_inputs(seed=0):
+    g = torch.Generator().manual_seed(seed)
+    dims = [384, 768, 768, 768, 768]
+    inputs = [torch.randn(1, d, generator=g) for d in dims]
+    phase = torch.zeros(1, 7)
+    phase[0, 3] = 1.0
+    return tuple(inputs) + (phase,)
+
+
+def test_mc_sample_shape_and_chunking(stub_predictor):
+    inputs = tuple(torch.cat([t, t * 0.5]) for t in _single_inputs())
+    samples = stub_predictor.mc_sample(inputs, n_samples=37, chunk_size=10)
+    assert samples.shape == (2, 37)
+    assert ((samples >= 0.0) & (samples <= 1.0)).all()
+    # Each replica must draw its own dropout mask
+    assert samples[0].std() > 0
+
+
+def test_mc_sample_matches_loop(stub_predictor):
+    inputs = _single_inputs()
+    torch.manual_seed(1)
+    looped = _loop_mc(stub_predictor, inputs, 2000)
+    torch.manual_seed(2)
+    batched = stub_predictor.mc_sample(inputs, n_samples=2000, chunk_size=256)[0]
+    assert abs(looped.mean() - batched.mean()) < 0.01
+    assert abs(looped.std() - batched.std()) < 0.01
+
+
+def test_predict_with_uncertainty_stub(stub_predictor, prepped_trial):
+    result = stub_predictor.predict_with_uncertainty(prepped_trial, n_samples=50, chunk_size=16)
+    assert 0.0 <= result["probability"] <= 1.0
+    assert result["uncertainty"] > 0.0
+    # MC dropout must not leak into later deterministic calls
+    assert not any(m.training for m in stub_predictor.model.modules())
+
+
+def test_predict_batch_matches_single(stub_predictor, prepped_trial):
+    other = dict(prepped_trial, sponsor="Moderna", phase="phase 3")
+    batch = stub_predictor.predict_batch([prepped_trial, other], n_samples=20)
+    assert len(batch) == 2
+    assert batch[0]["deterministic"] == stub_predictor.predict(prepped_trial)["probability"]
+    assert batch[1]["deterministic"] == stub_predictor.predict(other)["probability"]
+    # Each field embedded once for the whole batch
+    sponsor_calls = [args for field, args in stub_predictor.embedder.calls if field == "sponsor"]
+    assert ["Pfizer", "Moderna"] in sponsor_calls
+
+
+def test_concurrent_predictions_keep_deterministic_and_mc_apart(stub_predictor, prepped_trial):
+    from concurrent.futures import ThreadPoolExecutor
+
+    trials = [dict(prepped_trial, sponsor=f"Sponsor {i}") for i in range(4)]
+    expected = [stub_predictor.predict(t)["probability"] for t in trials]
+
+    def score(_):
+        return [r["deterministic"] for r in stub_predictor.predict_batch(trials, n_samples=200, chunk_size=64)]
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(score, range(30)))
+    assert all(r == expected for r in results)
+    # MC passes run on the weight-sharing twin; the served model never enters train mode
+    assert not any(m.training for m in stub_predictor.model.modules())
+    assert stub_predictor.mc_model.final_head[0].weight is stub_predictor.model.final_head[0].weight
+
+
+def test_adaptive_sampling_stops_converged_trials(stub_predictor, prepped_trial):
+    other = dict(prepped_trial, sponsor="Moderna", phase="phase 3")
+    torch.manual_seed(0)
+    fixed = stub_predictor.predict_batch([prepped_trial, other], n_samples=512)
+    assert [r["n_samples_used"] for r in fixed] == [512, 512]
+
+    # Loose tolerances: both trials stop after the first block
+    loose = AdaptiveSampling(sem_tol=0.05, std_tol=0.05, block_size=32, min_samples=32)
+    early = stub_predictor.predict_batch([prepped_trial, other], n_samples=512, adaptive=loose)
+    assert [r["n_samples_used"] for r in early] == [32, 32]
+    for a, b in zip(early, fixed):
+        assert a["deterministic"] == b["deterministic"]
+        assert abs(a["probability"] - b["probability"]) < 4 * max(b["uncertainty"], 1e-3) / np.sqrt(32)
+
+    # Tolerances that cannot be met run to the cap
+    strict = AdaptiveSampling(sem_tol=1e-9, std_tol=1e-9, block_size=100, min_samples=100)
+    capped = stub_predictor.predict_batch([prepped_trial], n_samples=250, adaptive=strict)
+    assert capped[0]["n_samples_used"] == 250
+    assert not any(m.training for m in stub_predictor.model.modules())
+
+
+def test_adaptive_sampling_only_resamples_active_trials(stub_predictor, prepped_trial):
+    inputs = stub_predictor.prepare_inputs([prepped_trial, dict(prepped_trial, sponsor="Moderna")])
+    # Make the second trial's samples constant by sampling it in eval mode
+    calls = []
+    mc_sample = stub_predictor.mc_sample
+
+    def recording_mc_sample(batch_inputs, n_samples, chunk_size=None):
+        calls.append(batch_inputs[0].shape[0])
+        out = mc_sample(batch_inputs, n_samples, chunk_size=chunk_size)
+        if batch_inputs[0].shape[0] == 2:
+            out[1] = 0.25
+        return out
+
+    stub_predictor.mc_sample = recording_mc_sample
+    stopping = AdaptiveSampling(sem_tol=1e-4, std_tol=1e-4, block_size=16, min_samples=16)
+    samples = stub_predictor.mc_sample_adaptive(inputs, 64, stopping)
+
+    assert len(samples[1]) == 16 and np.all(samples[1] == 0.25)
+    assert len(samples[0]) == 64
+    assert calls == [2, 1, 1, 1]
+
+
+@pytest.mark.parametrize("optimize_model", [False, True])
+def test_predict_scenarios_matches_separate_predictions(monkeypatch, model_weights, prepped_trial, optimize_model):
+    from app.core import predict
+    from conftest import StubEmbedder
+
+    monkeypatch.setattr(predict, "TrialEmbedder", StubEmbedder)
+    predictor = predict.TrialPredictor(model_path=model_weights, device="cpu", optimize_model=optimize_model)
+    variants = [dict(prepped_trial, phase="phase 3"), dict(prepped_trial, sponsor="Moderna"),
+                dict(prepped_trial, sponsor="Moderna", description="Another summary."), dict(prepped_trial)]
+    predictor.embedder.calls.clear()
+    results = predictor.predict_scenarios(prepped_trial, variants, n_samples=64, chunk_size=40)
+    calls = predictor.embedder.calls[5:]
+
+    assert len(results) == 5
+    expected = predictor.predict_batch([prepped_trial] + variants, n_samples=1)
+    assert [r["deterministic"] for r in results] == pytest.approx([e["deterministic"] for e in expected], abs=1e-4)
+    assert all(r["n_samples_used"] == 64 and 0.0 <= r["probability"] <= 1.0 for r in results)
+    # Only the overridden fields are embedded for the variants
+    assert ("sponsor", ["Moderna", "Moderna"]) in calls
+    assert ("text", ["Another summary."]) in calls
+    assert not any(field == "disease" for field, _ in calls)
+    assert not any(m.training for m in predictor.model.modules())
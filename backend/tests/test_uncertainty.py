@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import torch
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.bulk_io import iter_studies, list_study_files, preprocess_batch
+from app.models.uncertainty import leaky_relu_moments, sigmoid_moments
+from app.uncertainty_report import check_tolerances, run_report
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "studies.jsonl")
+
+
+def _fixture_trials():
+    studies = [study for _, _, study in iter_studies(list_study_files(FIXTURES))]
+    return [t for t in preprocess_batch(studies) if not isinstance(t, Exception)]
+
+
+def test_moment_helpers_match_sampling():
+    torch.manual_seed(0)
+    mean, var = torch.tensor([-1.0, 0.0, 2.0]), torch.tensor([0.5, 1.0, 4.0])
+    x = mean + var.sqrt() * torch.randn(200000, 3)
+
+    y = torch.nn.functional.leaky_relu(x, 0.1)
+    got_mean, got_var = leaky_relu_moments(mean, var, 0.1)
+    np.testing.assert_allclose(got_mean, y.mean(0), atol=0.02)
+    np.testing.assert_allclose(got_var, y.var(0), rtol=0.03)
+
+    p = torch.sigmoid(x)
+    got_mean, got_std = sigmoid_moments(mean, var)
+    np.testing.assert_allclose(got_mean, p.mean(0), atol=0.005)
+    np.testing.assert_allclose(got_std, p.std(0), atol=0.005)
+
+
+@pytest.mark.parametrize("mode", ["moments", "masks"])
+def test_fast_modes_track_mc_dropout(stub_predictor, prepped_trial, mode):
+    trials = [prepped_trial, {**prepped_trial, "phase": "phase 3", "sponsor": "Novartis"}]
+    torch.manual_seed(0)
+    reference = stub_predictor.predict_batch(trials, n_samples=4000)
+    results = stub_predictor.predict_batch(trials, uncertainty_mode=mode)
+    for ref, got in zip(reference, results):
+        assert got["deterministic"] == ref["deterministic"]
+        assert abs(got["probability"] - ref["probability"]) < 0.02
+        assert abs(got["uncertainty"] - ref["uncertainty"]) < 0.02
+    # Fixed masks: the same answer on every request
+    assert stub_predictor.predict_batch(trials, uncertainty_mode=mode) == results
+
+
+def test_unknown_mode_is_rejected(stub_predictor, prepped_trial):
+    with pytest.raises(ValueError):
+        stub_predictor.predict_batch([prepped_trial], uncertainty_mode="exact")
+
+
+def test_calibration_report_on_fixtures(stub_predictor):
+    trials = _fixture_trials()
+    report = run_report(stub_predictor, trials, n_samples=1000)
+    assert report["trials"] == len(trials) > 0
+    assert set(report["modes"]) == {"moments", "masks"}
+    for stats in report["modes"].values():
+        assert stats["label_flips"] == 0
+        assert stats["mean_max_abs_diff"] < 0.02
+        assert stats["std_max_abs_diff"] < 0.02
+    assert check_tolerances(report, 0.02, 0.02) == []
+    assert check_tolerances(report, 0.0, 0.0)
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.build_index import build_index
+from app.core.vector_index import (
+    FlatIndex, IVFPQIndex, IndexWriter, VectorIndex, load_index, train_ivfpq, trial_vectors
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "studies.jsonl")
+
+
+def _clustered(n, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    x = centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal((n, dim))
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _write(path, vectors):
+    writer = IndexWriter(str(path))
+    ids = [f"NCT{i:08d}" for i in range(len(vectors))]
+    records = [{"phase": "phase 2", "probability": i / len(vectors), "uncertainty": 0.1, "label": i % 2,
+                "deterministic": 0.5} for i in range(len(vectors))]
+    writer.append(ids, vectors, records)
+    writer.close()
+    return ids
+
+
+def test_trial_vectors_are_unit_norm():
+    rng = np.random.default_rng(0)
+    embeddings = {f: rng.standard_normal((3, 8)) * 5 for f in ("summary", "disease", "inclusion", "exclusion")}
+    vectors = trial_vectors(embeddings)
+    assert vectors.shape == (3, 32)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+
+
+def test_flat_index_matches_brute_force(tmp_path):
+    vectors = _clustered(500, 32, 10)
+    ids = _write(tmp_path / "flat", vectors)
+    index = load_index(str(tmp_path / "flat"))
+    assert isinstance(index, FlatIndex) and len(index) == 500
+
+    neighbours = index.similar(ids[7], k=5)
+    expected = [ids[i] for i in np.argsort(-(vectors @ vectors[7])) if i != 7][:5]
+    assert [n["nctid"] for n in neighbours] == expected
+    assert neighbours[0]["probability"] == round(float(np.float32(int(expected[0][3:]) / 500)), 4)
+    assert ids[7] not in [n["nctid"] for n in neighbours]
+
+
+def test_ivfpq_recall_against_exact(tmp_path):
+    vectors = _clustered(2000, 32, 20, seed=1)
+    ids = _write(tmp_path / "ivf", vectors)
+    params = train_ivfpq(str(tmp_path / "ivf"), nlist=16, m=8, n_iter=10)
+    assert params == {"nlist": 16, "m": 8, "ksub": 256}
+
+    exact = FlatIndex(str(tmp_path / "ivf"))
+    approx = load_index(str(tmp_path / "ivf"), nprobe=4, rerank=64)
+    assert isinstance(approx, IVFPQIndex)
+
+    recall = []
+    for nctid in ids[:50]:
+        truth = {n["nctid"] for n in exact.similar(nctid, k=10)}
+        found = {n["nctid"] for n in approx.similar(nctid, k=10)}
+        recall.append(len(truth & found) / 10)
+    assert np.mean(recall) >= 0.9
+
+    # Probing every list with a full rerank is exact
+    full = IVFPQIndex(str(tmp_path / "ivf"), nprobe=16, rerank=2000)
+    assert [n["nctid"] for n in full.similar(ids[3], k=10)] == [n["nctid"] for n in exact.similar(ids[3], k=10)]
+
+
+def test_ivfpq_rejects_bad_subspaces(tmp_path):
+    _write(tmp_path / "idx", _clustered(50, 30, 2))
+    with pytest.raises(ValueError):
+        train_ivfpq(str(tmp_path / "idx"), m=8)
+
+
+def test_build_index_from_dump(tmp_path, stub_predictor):
+    count = build_index(FIXTURES, str(tmp_path / "index"), stub_predictor, n_samples=5, batch_size=3)
+    index = load_index(str(tmp_path / "index"))
+    assert count == len(index) == 8
+    assert index.dim == 4 * 768
+    # Each trial is embedded once, for both its vector and its prediction
+    assert sum(len(names) for field, names in stub_predictor.embedder.calls if field == "sponsor") == 8
+
+    neighbours = index.similar("NCT01000001", k=3)
+    assert len(neighbours) == 3
+    assert {"nctid", "score", "phase", "probability", "uncertainty", "label", "deterministic"} <= set(neighbours[0])
+    assert neighbours[0]["score"] >= neighbours[-1]["score"]
+
+
+def test_index_without_search_fails_at_construction(tmp_path):
+    _write(tmp_path / "index", _clustered(4, 8, 2))
+
+    class Incomplete(VectorIndex):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete(str(tmp_path / "index"))
@@ -0,0 +1,41 @@
+import pytest
+import torch
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.model import MultiInputNN
+from app.models.weights import convert_to_safetensors, load_weights
+
+
+def _mapped_file(ptr):
+    # Path of the /proc/self/maps entry holding address ptr ('' for anonymous memory)
+    with open("/proc/self/maps") as f:
+        for line in f:
+            fields = line.split()
+            lo, hi = (int(x, 16) for x in fields[0].split("-"))
+            if lo <= ptr < hi:
+                return fields[5] if len(fields) > 5 else ""
+    return ""
+
+
+def _model():
+    return MultiInputNN(sponsor_dim=384, disease_dim=768, text_dim=768, num_features=7)
+
+
+@pytest.mark.parametrize("suffix", [".pth", ".safetensors"])
+def test_load_weights_maps_file(model_weights, tmp_path, suffix):
+    path = model_weights
+    if suffix == ".safetensors":
+        path = str(tmp_path / "model_weights.safetensors")
+        convert_to_safetensors(model_weights, path)
+
+    model = load_weights(_model(), path)
+    reference = _model()
+    reference.load_state_dict(torch.load(model_weights))
+    for (name, value), expected in zip(model.state_dict().items(), reference.state_dict().values()):
+        assert torch.equal(value, expected), name
+
+    if os.path.exists("/proc/self/maps"):
+        assert _mapped_file(model.summary_tower.tower[0].weight.data_ptr()) == os.path.realpath(path)